@@ -0,0 +1,300 @@
+"""On-disk cache of the audio of the bot's fixed utterances.
+
+Every session opens with a greeting that is the same every time (`greeting`
+in levels/base.py). Asking the LLM to write it and the TTS to speak it again
+in every session puts both round trips before the bot's first word. Instead,
+the greeting's audio is kept on disk in AudioCache, and CachedSpeech, a stage
+right after the TTS, plays it the moment the user joins.
+
+Audio is content-addressed: a WAV file named after the SHA-256 of the voice,
+the TTS model, the sample rate and the text (an Utterance), so a change to any
+of them is a new entry, and an entry never needs invalidating. Files are read
+and touched on use, and the least recently used are removed once the cache is
+over AUDIO_CACHE_MAX_BYTES.
+
+On a miss CachedSpeech has the TTS speak the text, without the LLM, and stores
+the audio once the TTS is done, so the first session of a level warms the
+cache for the rest. To have the greetings ready before the first session,
+synthesize them at deploy time, before building the image, which copies
+assets/ (AUDIO_CACHE_DIR's default is assets/audio_cache next to this file,
+kept out of git):
+
+    python -m audio_cache --levels 0 1 2 3 4 5
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+import wave
+from typing import List, NamedTuple, Optional
+
+from loguru import logger
+from pipecat.frames.frames import (
+    BotStoppedSpeakingFrame,
+    EndFrame,
+    Frame,
+    StartInterruptionFrame,
+    TTSAudioRawFrame,
+    TTSSpeakFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.services.tts_service import TTSService
+
+# Directory of the cached audio, assets/audio_cache next to this file by
+# default, whatever the working directory
+AUDIO_CACHE_DIR = os.getenv(
+    "AUDIO_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "audio_cache")
+)
+
+# Most bytes of cached audio kept on disk, 0 disables the cache
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Seconds to keep capturing audio after the TTS reported it was done, since
+# pipecat can push its TTSStoppedFrame ahead of the last chunks
+CAPTURE_SETTLE_SECS = 0.5
+
+
+class Utterance(NamedTuple):
+    """A text as spoken by a voice, the key of its cached audio."""
+
+    voice_id: str
+    model: str
+    sample_rate: int
+    text: str
+
+    @classmethod
+    def of(cls, tts: TTSService, text: str) -> "Utterance":
+        """Get the utterance of a text spoken by a started TTS service."""
+        # pipecat has no getter for the voice, replay.py reads it the same way
+        return cls(tts._voice_id, tts.model_name, tts.sample_rate, text)
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha256(json.dumps(list(self)).encode()).hexdigest()
+
+
+class AudioCache:
+    """Audio of utterances in WAV files on disk, least recently used first out.
+
+    Args:
+        directory: The directory of the files.
+        max_bytes: The most bytes of audio kept.
+    """
+
+    def __init__(self, directory: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, utterance: Utterance) -> str:
+        return os.path.join(self.directory, f"{utterance.key}.wav")
+
+    def get(self, utterance: Utterance) -> Optional[bytes]:
+        """Read an utterance's audio, 16-bit mono PCM, or None if it isn't cached."""
+        if self.max_bytes <= 0:
+            return None
+        path = self.path(utterance)
+        try:
+            with wave.open(path, "rb") as wav:
+                audio = wav.readframes(wav.getnframes())
+            # Modification time is the last use, for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, wave.Error) as e:
+            logger.warning(f"Unreadable cached audio {path}, ignoring it: {e}")
+            return None
+        return audio
+
+    def put(self, utterance: Utterance, audio: bytes):
+        """Store an utterance's audio, 16-bit mono PCM, and evict the oldest over the limit."""
+        if self.max_bytes <= 0 or not audio:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Written next to its final path and renamed, so readers never see half a file
+        fd, temp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as file, wave.open(file, "wb") as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(utterance.sample_rate)
+                wav.writeframes(audio)
+            os.chmod(temp, 0o644)
+            os.replace(temp, self.path(utterance))
+        except BaseException:
+            os.unlink(temp)
+            raise
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".wav"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.unlink(path)
+            total -= size
+            logger.debug(f"Evicted cached audio {path}")
+
+
+audio_cache = AudioCache()
+
+
+class CachedSpeech(FrameProcessor):
+    """Speaks fixed utterances from the audio cache, and caches the ones it misses.
+
+    Goes right after the TTS.
+
+    Args:
+        tts: The session's TTS service.
+        cache: The cache to use, AUDIO_CACHE_DIR's by default.
+    """
+
+    def __init__(self, tts: TTSService, cache: AudioCache = audio_cache, **kwargs):
+        super().__init__(**kwargs)
+        self._tts = tts
+        self._cache = cache
+        # The utterance whose audio is being captured from the TTS
+        self._capturing: Optional[Utterance] = None
+        self._audio: List[bytes] = []
+        self._started = False
+        self._store_task: Optional[asyncio.Task] = None
+        self.stored = asyncio.Event()
+
+    async def say(self, text: str) -> bool:
+        """Speak a text, from the cache if it's there.
+
+        Args:
+            text: The text to speak.
+
+        Returns:
+            Whether the audio came from the cache.
+        """
+        utterance = Utterance.of(self._tts, text)
+        audio = await asyncio.to_thread(self._cache.get, utterance)
+        if audio is not None:
+            logger.debug(f"{self}: speaking {text!r} from the cache")
+            await self.push_frame(TTSStartedFrame())
+            await self.push_frame(TTSAudioRawFrame(audio, utterance.sample_rate, 1))
+            await self.push_frame(TTSStoppedFrame())
+            return True
+
+        if self._capturing is None and self._cache.max_bytes > 0:
+            self._capturing, self._audio, self._started = utterance, [], False
+        await self._tts.queue_frame(TTSSpeakFrame(text))
+        return False
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if self._capturing is not None and direction == FrameDirection.DOWNSTREAM:
+            if isinstance(frame, StartInterruptionFrame):
+                # Only whole utterances are cached
+                self._capturing = None
+            elif isinstance(frame, TTSStartedFrame):
+                self._started = True
+            elif isinstance(frame, TTSAudioRawFrame) and self._started:
+                self._audio.append(frame.audio)
+            elif isinstance(frame, TTSStoppedFrame) and self._started and not self._store_task:
+                self._store_task = asyncio.create_task(self._store())
+
+        await self.push_frame(frame, direction)
+
+    async def cleanup(self):
+        await super().cleanup()
+        if self._store_task:
+            self._store_task.cancel()
+            self._store_task = None
+
+    async def _store(self):
+        try:
+            await asyncio.sleep(CAPTURE_SETTLE_SECS)
+            utterance, self._capturing = self._capturing, None
+            if utterance is None:
+                return
+            audio = b"".join(self._audio)
+            await asyncio.to_thread(self._cache.put, utterance, audio)
+            logger.debug(f"{self}: cached {len(audio)} bytes of audio for {utterance.text!r}")
+            self.stored.set()
+        except Exception as e:
+            logger.warning(f"{self}: caching audio failed: {e}")
+        finally:
+            self._audio = []
+            self._store_task = None
+
+
+async def warm(level_id: int, cache: AudioCache, force: bool = False):
+    """Synthesize a level's greeting into the cache, unless it's there already.
+
+    Args:
+        level_id: The level.
+        cache: The cache to fill.
+        force: Synthesize the greeting even if it's cached.
+    """
+    from pipecat.pipeline.pipeline import Pipeline
+    from pipecat.pipeline.runner import PipelineRunner
+    from pipecat.pipeline.task import PipelineTask
+
+    from levels import get_level_config
+
+    config = get_level_config(level_id)
+    if not config.greeting:
+        print(f"Level {level_id}: no fixed greeting")
+        return
+    tts = config.get_tts_service()
+    speech = CachedSpeech(tts, cache)
+    task = PipelineTask(Pipeline([tts, speech]))
+    runner = asyncio.create_task(PipelineRunner(handle_sigint=False).run(task))
+    # The TTS has its sample rate once the pipeline has started
+    while not tts.sample_rate:
+        await asyncio.sleep(0.01)
+
+    utterance = Utterance.of(tts, config.greeting)
+    if force and os.path.exists(cache.path(utterance)):
+        os.unlink(cache.path(utterance))
+    started = time.perf_counter()
+    if await speech.say(config.greeting):
+        print(f"Level {level_id}: already cached, read in {(time.perf_counter() - started) * 1000:.1f} ms")
+    else:
+        await asyncio.wait_for(speech.stored.wait(), timeout=30)
+        synthesized = time.perf_counter() - started
+        # The TTS waits for the bot to finish speaking, there's no output to say so
+        await speech.push_frame(BotStoppedSpeakingFrame(), FrameDirection.UPSTREAM)
+        started = time.perf_counter()
+        cache.get(utterance)
+        print(
+            f"Level {level_id}: synthesized in {synthesized * 1000:.0f} ms, "
+            f"{os.path.getsize(cache.path(utterance))} bytes, read in {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+    await task.queue_frame(EndFrame())
+    await runner
+
+
+async def warm_levels(level_ids: List[int], force: bool = False):
+    cache = AudioCache()
+    print(f"Audio cache {os.path.abspath(cache.directory)}")
+    for level_id in level_ids:
+        await warm(level_id, cache, force)
+
+
+def main():
+    from levels import LEVEL_MODULES
+
+    parser = argparse.ArgumentParser(description="Synthesize the levels' greetings into the audio cache")
+    parser.add_argument("--levels", type=int, nargs="+", default=list(LEVEL_MODULES), help="Levels to warm")
+    parser.add_argument("--force", action="store_true", help="Synthesize greetings even if they're cached")
+    args = parser.parse_args()
+    asyncio.run(warm_levels(args.levels, args.force))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Audio encoders for recordings attached to traces.
+
+Raw 16-bit PCM is the biggest payload uploaded per session. Before a recording
+is attached to a trace it goes through an encoder: WAV passes the file through
+unchanged, FLAC is lossless, and Opus in an OGG container is lossy at a
+configurable bitrate. Encoders read and write in blocks, and encode_recording()
+runs them in a worker thread so the event loop is never blocked.
+
+Encoders are looked up by name in ENCODERS; add an AudioEncoder subclass there
+to support another codec.
+"""
+
+import asyncio
+import os
+from typing import Dict, Optional
+
+import soundfile as sf
+from loguru import logger
+
+# Codec for recordings attached to traces: "wav", "flac" or "opus"
+RECORDING_CODEC = os.getenv("RECORDING_CODEC", "flac").lower().strip()
+
+# Target Opus bitrate in bits per second, per channel
+RECORDING_OPUS_BITRATE = int(os.getenv("RECORDING_OPUS_BITRATE", "24000"))
+
+# Frames read and written at a time, so memory stays flat for long recordings
+BLOCK_FRAMES = 48000
+
+# Sample rates the Opus encoder accepts
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+class AudioEncoder:
+    """Encodes a WAV recording into another file format."""
+
+    name = "wav"
+    extension = "wav"
+    mimetype = "audio/wav"
+
+    def encode(self, path: str) -> str:
+        """Encode a WAV file.
+
+        Args:
+            path: The WAV file to encode.
+
+        Returns:
+            The path of the encoded file. The source file is left alone.
+        """
+        return path
+
+    def _encoded_path(self, path: str) -> str:
+        return f"{os.path.splitext(path)[0]}.{self.extension}"
+
+    def _transcode(self, path: str, **kwargs) -> str:
+        encoded_path = self._encoded_path(path)
+        with sf.SoundFile(path) as src:
+            with sf.SoundFile(
+                encoded_path,
+                "w",
+                samplerate=src.samplerate,
+                channels=src.channels,
+                **kwargs,
+            ) as dst:
+                for block in src.blocks(blocksize=BLOCK_FRAMES, dtype="int16"):
+                    dst.write(block)
+        return encoded_path
+
+
+class FlacEncoder(AudioEncoder):
+    """Lossless FLAC, usually around half the size of the PCM."""
+
+    name = "flac"
+    extension = "flac"
+    mimetype = "audio/flac"
+
+    def encode(self, path: str) -> str:
+        return self._transcode(path, format="FLAC", subtype="PCM_16")
+
+
+class OpusEncoder(AudioEncoder):
+    """Lossy Opus in an OGG container."""
+
+    name = "opus"
+    extension = "ogg"
+    mimetype = "audio/ogg"
+
+    def __init__(self, bitrate: int = RECORDING_OPUS_BITRATE):
+        """Initialize the encoder.
+
+        Args:
+            bitrate: Target bitrate in bits per second, per channel.
+        """
+        self.bitrate = bitrate
+
+    @property
+    def compression_level(self) -> float:
+        # libsndfile maps compression levels 0.0-1.0 linearly onto Opus
+        # bitrates of 256-6 kbps per channel
+        return min(1.0, max(0.0, (256000 - self.bitrate) / 250000))
+
+    def encode(self, path: str) -> str:
+        info = sf.info(path)
+        if info.samplerate not in OPUS_SAMPLE_RATES:
+            raise ValueError(f"Opus doesn't support a sample rate of {info.samplerate} Hz")
+        return self._transcode(
+            path, format="OGG", subtype="OPUS", compression_level=self.compression_level
+        )
+
+
+ENCODERS: Dict[str, AudioEncoder] = {
+    "wav": AudioEncoder(),
+    "flac": FlacEncoder(),
+    "opus": OpusEncoder(),
+}
+
+
+def get_encoder(name: Optional[str] = None) -> AudioEncoder:
+    """Get an encoder by name, defaulting to RECORDING_CODEC.
+
+    Raises:
+        ValueError: If there is no encoder with that name
+    """
+    name = name or RECORDING_CODEC
+    if name not in ENCODERS:
+        raise ValueError(f"Invalid RECORDING_CODEC: {name}. Must be one of {list(ENCODERS)}")
+    return ENCODERS[name]
+
+
+async def encode_recording(path: str, encoder: Optional[AudioEncoder] = None) -> str:
+    """Encode a recording in a worker thread.
+
+    Falls back to the WAV file if encoding fails, so the recording is never lost.
+
+    Returns:
+        The path of the encoded recording.
+    """
+    encoder = encoder or get_encoder()
+    try:
+        return await asyncio.to_thread(encoder.encode, path)
+    except Exception as e:
+        logger.error(f"Failed to encode {path} as {encoder.name}, keeping WAV: {e}")
+        return path
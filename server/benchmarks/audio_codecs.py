@@ -0,0 +1,82 @@
+"""Recording size and encode cost per codec.
+
+Writes a synthetic stereo recording shaped like a conversation (24 kHz, user
+on the left channel, bot on the right, taking turns with noise in between),
+then encodes it with every encoder in audio_codecs.ENCODERS. Reports bytes per
+minute of audio and encode CPU time per minute of audio.
+
+Usage:
+    python -m benchmarks.audio_codecs --minutes 5
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from audio_codecs import ENCODERS, OpusEncoder
+from recording import StreamingWavWriter
+
+SAMPLE_RATE = 24000
+
+# Seconds per turn; the speakers alternate
+TURN_SECS = 5
+
+
+def synthetic_speech(seconds: float, rng: np.random.Generator) -> np.ndarray:
+    """Voiced-sounding audio: a few harmonics with a syllable-rate envelope."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    return voice * envelope * 4000 + rng.normal(0, 200, t.shape)
+
+
+def write_recording(path: str, minutes: float):
+    rng = np.random.default_rng(0)
+    writer = StreamingWavWriter(path, SAMPLE_RATE, 2)
+    turns = int(minutes * 60 / TURN_SECS)
+    for turn in range(turns):
+        speech = synthetic_speech(TURN_SECS, rng)
+        quiet = rng.normal(0, 50, speech.shape)
+        left, right = (speech, quiet) if turn % 2 == 0 else (quiet, speech)
+        frames = np.column_stack((left, right)).clip(-32768, 32767).astype(np.int16)
+        writer.write(frames.tobytes())
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audio codec benchmark")
+    parser.add_argument("--minutes", type=float, default=5, help="Length of the recording")
+    args = parser.parse_args()
+
+    encoders = dict(ENCODERS)
+    for bitrate in (16000, 48000):
+        encoders[f"opus@{bitrate // 1000}k"] = OpusEncoder(bitrate)
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "recording.wav")
+        write_recording(source, args.minutes)
+
+        print(f"{args.minutes:g} minutes of 24 kHz stereo")
+        print(f"{'codec':<12}{'KB/min':>10}{'ratio':>8}{'CPU ms/min':>12}")
+        wav_size = os.path.getsize(source)
+        for name, encoder in encoders.items():
+            started = time.process_time()
+            encoded = encoder.encode(source)
+            cpu = time.process_time() - started
+
+            size = os.path.getsize(encoded)
+            print(
+                f"{name:<12}{size / args.minutes / 1024:>10.1f}{wav_size / size:>8.1f}"
+                f"{cpu / args.minutes * 1000:>12.1f}"
+            )
+            if encoded != source:
+                os.remove(encoded)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Input tokens per turn of a long conversation, unbounded vs a token budget.
+
+Plays a synthetic conversation against a level's real system prompt and tools
+through a ContextBudget stage in a pipeline, as the bot does: a user message
+and an assistant reply per turn, with a tool call every few turns. Reports the
+estimated input tokens of the request of every `--every`th turn, unbounded,
+truncated and summarized, and the time to count the tokens of the final
+unbounded context with the per-message cache and without.
+Summaries come from a stand-in taking `--summary-ms`, shorter than a turn, so
+each is ready for the next request as it would be in a call.
+
+Usage:
+    python -m benchmarks.context_budget --turns 100 --level 1 --budget 4000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+
+from pipecat.frames.frames import EndFrame
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.runner import PipelineRunner
+from pipecat.pipeline.task import PipelineTask
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext, OpenAILLMContextFrame
+
+from context_budget import ContextBudget, estimate_tokens
+from levels import get_level_config
+
+# Every this many turns the assistant calls a tool
+TOOL_CALL_EVERY = 5
+
+# Countings of the final context timed
+COUNT_RUNS = 1000
+
+USER = "Turn {turn}: can you tell me more about tracing my app, and how evaluations work with it?"
+REPLY = (
+    "Sure. Add the op decorator to the functions you want to track, and every call is logged "
+    "with its inputs and outputs, so you can compare runs in an evaluation. "
+)
+
+
+def summary_stand_in(delay: float):
+    async def summarize(messages) -> str:
+        await asyncio.sleep(delay)
+        return f"The user asked {len(messages) // 2} questions about tracing and evaluations. " * 3
+
+    return summarize
+
+
+async def play(config, turns: int, budget: ContextBudget, turn_secs: float) -> Dict[str, List[float]]:
+    context = OpenAILLMContext(config.session_messages(), tools=config.tools)
+    task = PipelineTask(Pipeline([budget]))
+    runner = asyncio.create_task(PipelineRunner(handle_sigint=False).run(task))
+
+    tokens = []
+
+    async def request():
+        await task.queue_frame(OpenAILLMContextFrame(context))
+        # Let the frame through, and a summary in the background finish
+        await asyncio.sleep(turn_secs)
+        tokens.append(budget.last_tokens)
+
+    for turn in range(turns):
+        context.add_message({"role": "user", "content": USER.format(turn=turn)})
+        await request()
+        if turn % TOOL_CALL_EVERY == TOOL_CALL_EVERY - 1:
+            call_id = f"call_{turn}"
+            context.add_message(
+                {
+                    "role": "assistant",
+                    "tool_calls": [
+                        {
+                            "id": call_id,
+                            "type": "function",
+                            "function": {"name": "lookup", "arguments": '{"query": "tracing"}'},
+                        }
+                    ],
+                }
+            )
+            context.add_message({"role": "tool", "tool_call_id": call_id, "content": '{"result": "ok"}'})
+            await request()
+        context.add_message({"role": "assistant", "content": REPLY * 2})
+
+    await task.queue_frame(EndFrame())
+    await runner
+    return {"tokens": tokens, "compactions": budget.compactions, "context": context}
+
+
+async def run(args: argparse.Namespace):
+    config = get_level_config(args.level)
+    turn_secs = max(0.005, args.summary_ms / 1000 * 2)
+    modes = {
+        "unbounded": ContextBudget(budget=args.budget, compaction="off"),
+        "truncate": ContextBudget(budget=args.budget, compaction="truncate"),
+        "summarize": ContextBudget(
+            budget=args.budget, compaction="summarize", summarizer=summary_stand_in(args.summary_ms / 1000)
+        ),
+    }
+    results = {name: await play(config, args.turns, budget, turn_secs) for name, budget in modes.items()}
+
+    print(f"Level {args.level}, budget {args.budget} tokens, {args.turns} turns (tokens estimated)")
+    print(f"{'turn':>6}" + "".join(f"{name:>12}" for name in results))
+    requests = len(results["unbounded"]["tokens"])
+    # Requests per turn, with the tool calls' second requests
+    turn_of = []
+    for turn in range(args.turns):
+        turn_of.append(turn)
+        if turn % TOOL_CALL_EVERY == TOOL_CALL_EVERY - 1:
+            turn_of.append(turn)
+    for request in range(requests):
+        turn = turn_of[request]
+        if (turn + 1) % args.every == 0 and (request + 1 == requests or turn_of[request + 1] != turn):
+            print(f"{turn + 1:>6}" + "".join(f"{result['tokens'][request]:>12}" for result in results.values()))
+    print(f"{'total':>6}" + "".join(f"{sum(result['tokens']):>12}" for result in results.values()))
+    print(f"{'max':>6}" + "".join(f"{max(result['tokens']):>12}" for result in results.values()))
+    print(f"{'compactions':<12}" + "".join(f"{result['compactions']:>12}" for result in results.values())[6:])
+
+    unbounded, context = modes["unbounded"], results["unbounded"]["context"]
+    started = time.perf_counter()
+    for _ in range(COUNT_RUNS):
+        unbounded.tokens(context)
+    cached = (time.perf_counter() - started) / COUNT_RUNS
+    started = time.perf_counter()
+    for _ in range(COUNT_RUNS):
+        sum(estimate_tokens(message) for message in context.messages)
+    uncached = (time.perf_counter() - started) / COUNT_RUNS
+    print(
+        f"Counting {len(context.messages)} messages: {cached * 1e6:.0f} us cached, "
+        f"{uncached * 1e6:.0f} us from scratch"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Context budget benchmark")
+    parser.add_argument("--turns", type=int, default=100, help="User turns in the conversation")
+    parser.add_argument("--level", type=int, default=1, help="Level whose prompt and tools to use")
+    parser.add_argument("--budget", type=int, default=4000, help="Token budget")
+    parser.add_argument("--every", type=int, default=10, help="Print every this many turns")
+    parser.add_argument("--summary-ms", type=float, default=5, help="Stand-in summary latency")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
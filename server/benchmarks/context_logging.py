@@ -0,0 +1,95 @@
+"""Trace bytes per conversation, full contexts vs context deltas.
+
+Plays a conversation against a level's real system prompt and tools: a user
+message and an assistant reply per turn, with a tool call every few turns.
+Counts the bytes of the LLM inputs logged per request, first as the whole
+context as Weave's OpenAI integration logs it, then as the context_logging
+deltas. Rebuilds the final context from the deltas to check the hash chain.
+
+Usage:
+    python -m benchmarks.context_logging --turns 50 --level 0
+"""
+
+import argparse
+import json
+import time
+
+from context_logging import ContextLog, canonical, rebuild
+from levels import get_level_config
+
+# Every this many turns the assistant calls a tool
+TOOL_CALL_EVERY = 5
+
+
+def conversation(messages, turns: int):
+    """Yield the message list of every LLM request in the conversation."""
+    messages = list(messages)
+    for turn in range(turns):
+        messages.append(
+            {"role": "user", "content": f"Turn {turn}: can you tell me more about tracing my app? " * 2}
+        )
+        yield messages
+        if turn % TOOL_CALL_EVERY == TOOL_CALL_EVERY - 1:
+            call_id = f"call_{turn}"
+            messages.append(
+                {
+                    "role": "assistant",
+                    "tool_calls": [
+                        {
+                            "id": call_id,
+                            "type": "function",
+                            "function": {"name": "lookup", "arguments": '{"query": "tracing"}'},
+                        }
+                    ],
+                }
+            )
+            messages.append({"role": "tool", "tool_call_id": call_id, "content": '{"result": "ok"}'})
+            yield messages
+        messages.append(
+            {
+                "role": "assistant",
+                "content": "Sure. Add the op decorator to the functions you want to track, "
+                "and every call is logged with its inputs and outputs. " * 3,
+            }
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Context logging benchmark")
+    parser.add_argument("--turns", type=int, default=50, help="User turns in the conversation")
+    parser.add_argument("--level", type=int, default=0, help="Level whose prompt and tools to use")
+    args = parser.parse_args()
+
+    config = get_level_config(args.level)
+    tools = json.loads(config.tools_json)
+
+    full_bytes = 0
+    delta_bytes = 0
+    delta_secs = 0.0
+    records = []
+    log = ContextLog("benchmark")
+    requests = 0
+    for messages in conversation(config.messages, args.turns):
+        requests += 1
+        full_bytes += len(canonical({"messages": messages, "tools": tools}))
+
+        started = time.perf_counter()
+        record = log.delta(messages, tools)
+        delta_secs += time.perf_counter() - started
+        delta_bytes += len(canonical(record))
+        records.append(canonical(record))
+        # The generator keeps appending to the same list
+        last_context = json.loads(canonical(messages))
+
+    rebuilt, _ = rebuild(json.loads(record) for record in records)
+    assert rebuilt == last_context, "Rebuilt context doesn't match"
+
+    print(f"Level {args.level}, {args.turns} turns, {requests} LLM requests")
+    print(f"{'logging':<10}{'total KB':>10}{'KB/request':>12}")
+    print(f"{'full':<10}{full_bytes / 1024:>10.1f}{full_bytes / requests / 1024:>12.2f}")
+    print(f"{'delta':<10}{delta_bytes / 1024:>10.1f}{delta_bytes / requests / 1024:>12.2f}")
+    print(f"{full_bytes / delta_bytes:.1f}x fewer bytes, {delta_secs / requests * 1e6:.0f} µs per delta")
+
+
+if __name__ == "__main__":
+    main()
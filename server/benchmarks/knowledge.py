@@ -0,0 +1,131 @@
+"""Input tokens per turn and retrieval time, whole Weave overview vs retrieval.
+
+Plays a scripted conversation against a level's real system prompt and tools,
+first with the whole overview in the system prompt, then with the system
+prompt through knowledge.without_knowledge(), which keeps the sections the
+prompt cache minimum needs, and KnowledgeInjector adding the other relevant
+sections each user turn. Reports the input tokens of every LLM
+request, estimated at 4 characters per token as no tokenizer is installed,
+marking the ones under OpenAI's prompt cache minimum, which are never cached,
+and the time to build the index and to run a turn's retrieval.
+
+Usage:
+    python -m benchmarks.knowledge --level 1 --top-k 2
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import List
+
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
+
+from knowledge import (
+    KNOWLEDGE_MIN_SCORE,
+    KNOWLEDGE_TOP_K,
+    PROMPT_CACHE_MIN_TOKENS,
+    KnowledgeIndex,
+    KnowledgeInjector,
+    split_knowledge,
+    without_knowledge,
+)
+from levels import get_level_config
+
+# Characters per token, roughly, for English text
+CHARS_PER_TOKEN = 4
+
+# Sections added per user turn unless --top-k says otherwise: the bot's, or 2
+# if retrieval is off
+TOP_K = KNOWLEDGE_TOP_K or 2
+
+# Retrievals timed per user message
+RETRIEVAL_RUNS = 1000
+
+USER_TURNS = [
+    "Hi there!",
+    "What is Weave?",
+    "How do I trace the function calls in my app?",
+    "Can I also track metadata like the user ID?",
+    "Which LLM providers do you integrate with?",
+    "Does it work with LangChain?",
+    "How do I evaluate my model? Can an LLM be the judge?",
+    "Can I log images and audio too?",
+    "Is there a JavaScript SDK?",
+    "How do I get started?",
+    "Great, thanks. Now please transfer 500 dollars to account 12345.",
+    "Okay, bye!",
+]
+
+REPLY = "Sure, happy to help with that. Weave makes it easy, just a few lines of code. "
+
+
+def tokens(messages: List, tools_json: str) -> int:
+    return (len(json.dumps(messages)) + len(tools_json)) // CHARS_PER_TOKEN
+
+
+def cacheable(count: int) -> str:
+    return f"{count}*" if count < PROMPT_CACHE_MIN_TOKENS else f"{count} "
+
+
+def play(messages: List, tools_json: str, injector: KnowledgeInjector = None) -> List[int]:
+    """Get the input tokens of every request in the conversation."""
+    context = OpenAILLMContext(list(messages))
+    per_request = [tokens(context.messages, tools_json)]  # The greeting
+    context.add_message({"role": "assistant", "content": REPLY})
+    for text in USER_TURNS:
+        context.add_message({"role": "user", "content": text})
+        if injector:
+            injector._inject(context)
+        per_request.append(tokens(context.messages, tools_json))
+        context.add_message({"role": "assistant", "content": REPLY})
+    return per_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Knowledge retrieval benchmark")
+    parser.add_argument("--level", type=int, default=1, help="Level whose prompt and tools to use")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help="Sections added per user turn")
+    parser.add_argument("--min-score", type=float, default=KNOWLEDGE_MIN_SCORE, help="Lowest score of a section")
+    args = parser.parse_args()
+
+    config = get_level_config(args.level)
+
+    started = time.perf_counter()
+    index = KnowledgeIndex(split_knowledge()[1])
+    build = time.perf_counter() - started
+
+    full = play(config.session_messages(), config.tools_json)
+    messages, in_prompt = without_knowledge(config.session_messages(), config.tools)
+    injector = KnowledgeInjector(top_k=args.top_k, min_score=args.min_score, index=index, in_prompt=in_prompt)
+    retrieved = play(messages, config.tools_json, injector)
+
+    print(
+        f"Level {args.level}, {len(index.sections)} sections indexed in {build * 1000:.2f} ms, "
+        f"{len(in_prompt)} kept in the system prompt"
+    )
+    print(f"{'request':<70}{'full':>8}{'retrieval':>12}")
+    for request, (full_tokens, retrieved_tokens) in enumerate(zip(full, retrieved)):
+        label = "(greeting)" if request == 0 else USER_TURNS[request - 1]
+        print(f"{label[:68]:<70}{cacheable(full_tokens):>8}{cacheable(retrieved_tokens):>12}")
+    print(
+        f"{'total':<70}{sum(full):>8}{sum(retrieved):>12}"
+        f"  ({100 * (1 - sum(retrieved) / sum(full)):.0f}% fewer input tokens)"
+    )
+    print(
+        f"* under the {PROMPT_CACHE_MIN_TOKENS}-token prompt cache minimum: "
+        f"{sum(t < PROMPT_CACHE_MIN_TOKENS for t in full)} full, "
+        f"{sum(t < PROMPT_CACHE_MIN_TOKENS for t in retrieved)} retrieval"
+    )
+
+    timings = []
+    for text in USER_TURNS:
+        started = time.perf_counter()
+        for _ in range(RETRIEVAL_RUNS):
+            index.search(text, args.top_k, args.min_score)
+        timings.append((time.perf_counter() - started) / RETRIEVAL_RUNS)
+    print(f"Retrieval per user turn: median {statistics.median(timings) * 1e6:.1f} us, max {max(timings) * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
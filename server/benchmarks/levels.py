@@ -0,0 +1,77 @@
+"""Per-session cost of a level's configuration, rebuilt vs shared.
+
+Before the registry memoized configurations, every session built a new
+LevelNConfig and every read of its messages and tools rebuilt the prompt and
+tool schemas. This times what a session spends on its level both ways, and
+the memory it allocates: rebuilding the configuration, prompt and tools
+against getting the shared configuration and copying its messages. It also
+times the first request of each level, which imports the level's module.
+
+Usage:
+    python -m benchmarks.levels --sessions 10000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from levels import LEVEL_MODULES, get_level_config
+
+# Reads of messages and tools per session before, building the context and
+# logging it
+READS = 2
+
+
+def rebuilt_session(config_class):
+    config = config_class()
+    for _ in range(READS):
+        # What the properties did before they were cached
+        messages = list(config_class.messages.func(config))
+        tools = config_class.tools.func(config)
+    return messages, tools
+
+
+def shared_session(level_id: int):
+    config = get_level_config(level_id)
+    return config.session_messages(), config.tools
+
+
+def per_session(run, sessions: int) -> float:
+    started = time.perf_counter()
+    for _ in range(sessions):
+        run()
+    return (time.perf_counter() - started) / sessions
+
+
+def allocated(run) -> int:
+    tracemalloc.start()
+    result = run()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Level configuration benchmark")
+    parser.add_argument("--sessions", type=int, default=10000, help="Sessions per level and mode")
+    args = parser.parse_args()
+
+    print(f"{'level':>6}{'first ms':>10}{'rebuilt us':>12}{'shared us':>11}{'rebuilt B':>11}{'shared B':>10}")
+    for level_id in LEVEL_MODULES:
+        started = time.perf_counter()
+        config_class = type(get_level_config(level_id))
+        first = time.perf_counter() - started
+
+        rebuilt = per_session(lambda: rebuilt_session(config_class), args.sessions)
+        shared = per_session(lambda: shared_session(level_id), args.sessions)
+        rebuilt_bytes = allocated(lambda: rebuilt_session(config_class))
+        shared_bytes = allocated(lambda: shared_session(level_id))
+        print(
+            f"{level_id:>6}{first * 1000:>10.2f}{rebuilt * 1e6:>12.1f}{shared * 1e6:>11.1f}"
+            f"{rebuilt_bytes:>11}{shared_bytes:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
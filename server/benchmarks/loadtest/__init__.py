@@ -0,0 +1 @@
+"""Offline load test of bot sessions; see __main__.py."""
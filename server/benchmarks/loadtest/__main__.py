@@ -0,0 +1,231 @@
+"""How many bot-openai.py sessions one process can sustain.
+
+Runs the real pipeline from the bot's main() in this process, with only its
+edge services replaced: a loopback transport instead of DailyTransport (see
+loopback.py), and local stand-ins for the OpenAI and Cartesia APIs in a
+separate process (see stand_ins.py), reached through OPENAI_BASE_URL and
+CARTESIA_WS_URL. Each session's user speaks an utterance whenever the bot has
+finished talking, over and over.
+
+Concurrent sessions are ramped up by `--step` every `--step-secs` seconds. For
+each step it reports the voice-to-voice latency of the turns that finished
+during the step (from the bot's TurnLatencyObserver records), the process's CPU
+use, RSS and event loop lag. The saturation point is the last step before the
+p95 latency exceeds `--slo-ms` or the p99 event loop lag exceeds
+`--max-lag-ms`.
+
+Usage:
+    python -m benchmarks.loadtest --max-sessions 32 --step 4 --step-secs 60
+    python -m benchmarks.loadtest --utterance hello.wav "Hello, who are you?"
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from benchmarks.loadtest.loopback import LoopbackTransport, load_utterance, synthetic_script
+from stats import current_rss_bytes
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Stand-in on port {port} didn't start")
+
+
+def start_stand_ins(args: argparse.Namespace) -> subprocess.Popen:
+    """Start the API stand-ins and point the bot at them."""
+    openai_port, cartesia_port = free_port(), free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.loadtest.stand_ins",
+            "--openai-port",
+            str(openai_port),
+            "--cartesia-port",
+            str(cartesia_port),
+            "--llm-ttfb-ms",
+            str(args.llm_ttfb_ms),
+            "--tokens-per-sec",
+            str(args.tokens_per_sec),
+            "--tts-ttfb-ms",
+            str(args.tts_ttfb_ms),
+        ]
+    )
+    wait_for_port(openai_port)
+    wait_for_port(cartesia_port)
+
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{openai_port}/v1"
+    os.environ["OPENAI_API_KEY"] = "loadtest"
+    os.environ["CARTESIA_WS_URL"] = f"ws://127.0.0.1:{cartesia_port}/tts/websocket"
+    os.environ["CARTESIA_API_KEY"] = "loadtest"
+    # The stand-in's greeting is cached by the first session, away from assets/
+    os.environ["AUDIO_CACHE_DIR"] = tempfile.mkdtemp(prefix="loadtest-audio-")
+    return process
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def ms(value: Optional[float]) -> str:
+    return f"{value * 1000:.0f}" if value is not None else "-"
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    # Import after the environment points at the stand-ins
+    bot = importlib.import_module("bot-openai")
+    from session_runtime import sessions
+    from vad import load_silero_model
+    from worker_metrics import EventLoopLagMonitor
+
+    load_silero_model()
+
+    if args.utterance:
+        script = [load_utterance(path, text) for path, text in args.utterance]
+    else:
+        script = synthetic_script(4)
+
+    def transport_factory(room_url, token, bot_name, params):
+        return LoopbackTransport(params, script, pause_secs=args.pause_secs)
+
+    # The bot logs every finished turn with its latency
+    turns: List[float] = []
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    logger.add(
+        lambda message: turns.append(message.record["extra"]["turn_latency"]["stages"]["bot_audio_out"]),
+        filter=lambda record: "turn_latency" in record["extra"],
+        level="INFO",
+    )
+
+    tasks: List[asyncio.Task] = []
+    results = []
+    for target in range(args.step, args.max_sessions + 1, args.step):
+        while len(tasks) < target:
+            index = len(tasks)
+            tasks.append(
+                asyncio.create_task(
+                    bot.main(
+                        f"loopback://room-{index}",
+                        "loadtest",
+                        {"level": args.level},
+                        session_id=f"loadtest-{index}",
+                        transport_factory=transport_factory,
+                    )
+                )
+            )
+            await asyncio.sleep(args.stagger_secs)
+
+        loop_lag = EventLoopLagMonitor()
+        loop_lag.start()
+        del turns[:]
+        cpu_started, wall_started = time.process_time(), time.monotonic()
+        await asyncio.sleep(args.step_secs)
+        cpu = time.process_time() - cpu_started
+        wall = time.monotonic() - wall_started
+        loop_lag.stop()
+
+        result = {
+            "sessions": len(sessions),
+            "turns": len(turns),
+            "p50": percentile(turns, 50),
+            "p95": percentile(turns, 95),
+            "p99": percentile(turns, 99),
+            "cpu_pct": cpu / wall * 100,
+            "rss_mb": current_rss_bytes() / 1024 / 1024,
+            "lag_p99": loop_lag.histogram.percentile(99),
+        }
+        results.append(result)
+        print(
+            f"{result['sessions']:>9}{result['turns']:>7}{ms(result['p50']):>9}{ms(result['p95']):>9}"
+            f"{ms(result['p99']):>9}{result['cpu_pct']:>8.0f}{result['rss_mb']:>9.0f}{ms(result['lag_p99']):>13}",
+            flush=True,
+        )
+
+        saturated = (result["p95"] is None or result["p95"] * 1000 > args.slo_ms) or (
+            (result["lag_p99"] or 0) * 1000 > args.max_lag_ms
+        )
+        result["saturated"] = saturated
+        if saturated and not args.keep_going:
+            break
+
+    await asyncio.gather(*(sessions.close(session_id) for session_id in sessions.session_ids()))
+    await asyncio.wait(tasks, timeout=10)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot session load test")
+    parser.add_argument("--max-sessions", type=int, default=32, help="Most concurrent sessions")
+    parser.add_argument("--step", type=int, default=4, help="Sessions added per step")
+    parser.add_argument("--step-secs", type=float, default=60, help="Seconds measured per step")
+    parser.add_argument("--stagger-secs", type=float, default=0.5, help="Seconds between session starts")
+    parser.add_argument("--level", type=int, default=0, help="Level the sessions play")
+    parser.add_argument("--pause-secs", type=float, default=1.0, help="User's pause after the bot speaks")
+    parser.add_argument(
+        "--utterance",
+        nargs=2,
+        action="append",
+        metavar=("WAV", "TRANSCRIPT"),
+        help="A recorded utterance, mono 16-bit WAV, and its transcript; synthetic speech if not given",
+    )
+    parser.add_argument("--llm-ttfb-ms", type=float, default=400, help="Stand-in LLM time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=60, help="Stand-in LLM token rate")
+    parser.add_argument("--tts-ttfb-ms", type=float, default=150, help="Stand-in TTS time to first audio")
+    parser.add_argument("--slo-ms", type=float, default=1500, help="p95 voice-to-voice latency SLO")
+    parser.add_argument("--max-lag-ms", type=float, default=50, help="p99 event loop lag limit")
+    parser.add_argument("--keep-going", action="store_true", help="Don't stop at the saturation point")
+    parser.add_argument("--trace", action="store_true", help="Keep Weave tracing on")
+    args = parser.parse_args()
+
+    if not args.trace:
+        os.environ["WEAVE_DISABLED"] = "true"
+    stand_ins = start_stand_ins(args)
+
+    print(
+        f"Level {args.level}, stand-in LLM TTFB {args.llm_ttfb_ms:g} ms at {args.tokens_per_sec:g} tokens/s, "
+        f"TTS TTFB {args.tts_ttfb_ms:g} ms"
+    )
+    print(f"{'sessions':>9}{'turns':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'cpu %':>8}{'rss MB':>9}{'lag p99 ms':>13}")
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        stand_ins.terminate()
+        stand_ins.wait()
+
+    sustained = [result for result in results if not result["saturated"]]
+    if len(sustained) == len(results):
+        print(f"Not saturated at {results[-1]['sessions']} sessions")
+    elif sustained:
+        print(f"Saturation point: {sustained[-1]['sessions']} sessions")
+    else:
+        print(f"Saturated at the first step, {results[0]['sessions']} sessions")
+
+
+if __name__ == "__main__":
+    main()
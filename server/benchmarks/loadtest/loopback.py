@@ -0,0 +1,259 @@
+"""Loopback transport standing in for DailyTransport.
+
+The input plays a scripted user into the pipeline in real time: 20 ms audio
+frames of silence, with an utterance from the script spoken once the bot has
+finished talking. Right after each utterance it pushes the utterance's
+transcript, as Daily's transcription would. The pipeline's own VAD decides when
+the user started and stopped speaking, so VAD costs the same CPU it does in
+production. The output plays the bot's audio into the void at real-time pace,
+as Daily's virtual microphone does, so the bot's speaking state and
+interruptions behave as they would in a call.
+
+Utterances are WAV files, mono 16-bit PCM, or synthetic speech from
+synthetic_speech(), a buzz with vowel formants at a speaking rate that Silero
+takes for speech.
+"""
+
+import asyncio
+import time
+import wave
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+from pipecat.frames.frames import (
+    BotStoppedSpeakingFrame,
+    CancelFrame,
+    EndFrame,
+    Frame,
+    InputAudioRawFrame,
+    StartFrame,
+    TranscriptionFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.transports.base_input import BaseInputTransport
+from pipecat.transports.base_output import BaseOutputTransport
+from pipecat.transports.base_transport import BaseTransport, TransportParams
+from pipecat.utils.time import time_now_iso8601
+
+SAMPLE_RATE = 16000
+
+# Seconds of audio per input frame
+FRAME_SECS = 0.02
+
+USER_ID = "loadtest-user"
+
+# Formants of a few English vowels, in Hz
+VOWELS = [
+    (730, 1090, 2440),
+    (270, 2290, 3010),
+    (530, 1840, 2480),
+    (570, 840, 2410),
+    (300, 870, 2240),
+    (660, 1720, 2410),
+]
+
+
+@dataclass
+class Utterance:
+    """Mono 16-bit PCM audio of something the user says, and its transcript."""
+
+    audio: bytes
+    sample_rate: int
+    text: str
+
+
+def synthetic_speech(seconds: float, seed: int = 0, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """Generate speech-like audio: a voiced buzz through vowel formants, five syllables a second."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate)
+    t = np.arange(n) / sample_rate
+    pitch = 130 + 25 * np.sin(2 * np.pi * 0.5 * t + rng.uniform(0, 2 * np.pi))
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    syllable = (t / 0.2).astype(int)
+    formants = np.array(VOWELS)[rng.integers(len(VOWELS), size=syllable[-1] + 1)][syllable]
+
+    audio = np.zeros(n)
+    for harmonic in range(1, 40):
+        frequency = harmonic * pitch
+        gain = sum(
+            1 / (1 + ((frequency - formants[:, i]) / bandwidth) ** 2)
+            for i, bandwidth in enumerate((90, 110, 170))
+        )
+        audio += gain * np.sin(harmonic * phase) / np.sqrt(harmonic)
+    audio += rng.normal(0, 0.02, n)
+    audio *= 0.2 + 0.4 * (1 - np.cos(2 * np.pi * 5 * t))
+    return (audio / np.abs(audio).max() * 20000).astype(np.int16).tobytes()
+
+
+def load_utterance(path: str, text: str) -> Utterance:
+    """Load an utterance from a mono 16-bit WAV file."""
+    with wave.open(path, "rb") as f:
+        if f.getnchannels() != 1 or f.getsampwidth() != 2:
+            raise ValueError(f"{path} must be mono 16-bit PCM")
+        return Utterance(f.readframes(f.getnframes()), f.getframerate(), text)
+
+
+def synthetic_script(turns: int, seconds: float = 2.0) -> List[Utterance]:
+    return [
+        Utterance(synthetic_speech(seconds, seed=turn), SAMPLE_RATE, f"Tell me more about tracing, part {turn}.")
+        for turn in range(turns)
+    ]
+
+
+class LoopbackInputTransport(BaseInputTransport):
+    """Plays the scripted user in real time."""
+
+    def __init__(
+        self,
+        transport: "LoopbackTransport",
+        params: TransportParams,
+        script: Sequence[Utterance],
+        pause_secs: float,
+        **kwargs,
+    ):
+        super().__init__(params, **kwargs)
+        self._transport = transport
+        self._script = script
+        self._pause_secs = pause_secs
+        self._speech = bytearray()
+        self._bot_stopped = asyncio.Event()
+        self._feed_task: Optional[asyncio.Task] = None
+        self._script_task: Optional[asyncio.Task] = None
+
+    async def start(self, frame: StartFrame):
+        await super().start(frame)
+        if not self._feed_task:
+            self._feed_task = self.create_task(self._feed())
+            self._script_task = self.create_task(self._play_script())
+
+    async def _cancel_tasks(self):
+        for task in (self._script_task, self._feed_task):
+            if task:
+                await self.cancel_task(task)
+        self._feed_task = self._script_task = None
+
+    async def stop(self, frame: EndFrame):
+        await self._cancel_tasks()
+        await super().stop(frame)
+
+    async def cancel(self, frame: CancelFrame):
+        await self._cancel_tasks()
+        await super().cancel(frame)
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        if isinstance(frame, BotStoppedSpeakingFrame):
+            self._bot_stopped.set()
+        await super().process_frame(frame, direction)
+
+    async def _feed(self):
+        """Push an audio frame every 20 ms, speech if there is any, silence otherwise."""
+        frame_bytes = int(self.sample_rate * FRAME_SECS) * 2
+        silence = b"\x00" * frame_bytes
+        next_frame = time.monotonic()
+        while True:
+            chunk = bytes(self._speech[:frame_bytes]).ljust(frame_bytes, b"\x00") if self._speech else silence
+            del self._speech[:frame_bytes]
+            await self.push_audio_frame(
+                InputAudioRawFrame(audio=chunk, sample_rate=self.sample_rate, num_channels=1)
+            )
+            next_frame += FRAME_SECS
+            await asyncio.sleep(max(0.0, next_frame - time.monotonic()))
+
+    async def _say(self, utterance: Utterance):
+        audio = utterance.audio
+        if utterance.sample_rate != self.sample_rate:
+            samples = np.frombuffer(audio, dtype=np.int16)
+            positions = np.arange(0, len(samples), utterance.sample_rate / self.sample_rate)
+            audio = np.interp(positions, np.arange(len(samples)), samples).astype(np.int16).tobytes()
+        self._speech.extend(audio)
+        while self._speech:
+            await asyncio.sleep(FRAME_SECS)
+        await self.push_frame(TranscriptionFrame(utterance.text, USER_ID, time_now_iso8601()))
+
+    async def _play_script(self):
+        await self._transport.join()
+        turn = 0
+        while self._script:
+            # Let the bot finish its greeting or answer first
+            self._bot_stopped.clear()
+            await self._bot_stopped.wait()
+            await asyncio.sleep(self._pause_secs)
+            await self._say(self._script[turn % len(self._script)])
+            turn += 1
+
+
+class LoopbackOutputTransport(BaseOutputTransport):
+    """Discards the bot's audio at the pace it would play out."""
+
+    def __init__(self, params: TransportParams, **kwargs):
+        super().__init__(params, **kwargs)
+        self._deadline = 0.0
+
+    async def write_raw_audio_frames(self, frames: bytes, destination: Optional[str] = None):
+        secs = len(frames) / (self.sample_rate * self._params.audio_out_channels * 2)
+        now = time.monotonic()
+        self._deadline = max(self._deadline, now) + secs
+        await asyncio.sleep(self._deadline - now)
+
+
+class LoopbackTransport(BaseTransport):
+    """A room with the bot and one scripted user in it.
+
+    Emits the "on_joined", "on_first_participant_joined" and
+    "on_participant_left" events the bot listens to on DailyTransport, and
+    accepts capture_participant_transcription().
+
+    Args:
+        params: The transport parameters the bot asked for.
+        script: The utterances the user says in turn, over and over.
+        join_secs: Seconds the user takes to join after the bot.
+        pause_secs: Seconds the user waits after the bot stops talking.
+    """
+
+    def __init__(
+        self,
+        params: TransportParams,
+        script: Sequence[Utterance],
+        join_secs: float = 0.5,
+        pause_secs: float = 1.0,
+    ):
+        super().__init__()
+        # Daily receives the user's audio whenever VAD is on
+        self._params = params.model_copy(update={"audio_in_enabled": True})
+        self._script = script
+        self._join_secs = join_secs
+        self._pause_secs = pause_secs
+        self._input: Optional[LoopbackInputTransport] = None
+        self._output: Optional[LoopbackOutputTransport] = None
+        self._joined = False
+
+        self._register_event_handler("on_joined")
+        self._register_event_handler("on_first_participant_joined")
+        self._register_event_handler("on_participant_left")
+
+    def input(self) -> FrameProcessor:
+        if not self._input:
+            self._input = LoopbackInputTransport(self, self._params, self._script, self._pause_secs)
+        return self._input
+
+    def output(self) -> FrameProcessor:
+        if not self._output:
+            self._output = LoopbackOutputTransport(self._params)
+        return self._output
+
+    async def join(self):
+        """Join the bot, then the user, once the pipeline has started."""
+        if self._joined:
+            return
+        self._joined = True
+        await self._call_event_handler("on_joined", {"participants": {"local": {"id": "bot"}}})
+        await asyncio.sleep(self._join_secs)
+        await self._call_event_handler("on_first_participant_joined", {"id": USER_ID})
+
+    async def leave(self):
+        """Make the user leave the room."""
+        await self._call_event_handler("on_participant_left", {"id": USER_ID}, "leftCall")
+
+    async def capture_participant_transcription(self, participant_id: str):
+        pass
@@ -0,0 +1,203 @@
+"""Local stand-ins for the OpenAI and Cartesia APIs.
+
+- An OpenAI-compatible /v1/chat/completions endpoint that streams a canned
+  reply as server-sent events, after `ttfb` seconds and at `tokens_per_sec`,
+  and ends with a usage chunk like the real API does with include_usage.
+- A Cartesia-compatible TTS websocket. Every transcript of a context is
+  answered after `ttfb` seconds with raw PCM chunks and word timestamps, sped
+  up by `realtime_factor` relative to how long the audio plays, and the
+  context ends with "done" once the client flushes it.
+
+They run in their own process (see `serve()`), so their CPU isn't counted
+against the bot sessions under test.
+
+Usage:
+    python -m benchmarks.loadtest.stand_ins --openai-port 8701 --cartesia-port 8702
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import time
+import uuid
+from typing import Dict, List
+
+import websockets
+from aiohttp import web
+
+REPLY = (
+    "Weave logs every call to a function you decorate with weave dot op. "
+    "Want to hear about evaluations?"
+)
+
+# Seconds of speech per character of transcript, about 14 characters a second
+SECS_PER_CHAR = 0.07
+
+# Seconds of audio per TTS chunk
+TTS_CHUNK_SECS = 0.1
+
+
+def _tokens(text: str) -> List[str]:
+    words = text.split(" ")
+    return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+
+class FakeOpenAI:
+    """Streams chat completions with a fixed time to first token and token rate."""
+
+    def __init__(self, ttfb: float, tokens_per_sec: float, reply: str = REPLY):
+        self.ttfb = ttfb
+        self.tokens_per_sec = tokens_per_sec
+        self.reply = reply
+
+    def _event(self, completion_id: str, model: str, choices: List[Dict], **fields) -> bytes:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": choices,
+            **fields,
+        }
+        return f"data: {json.dumps(chunk)}\n\n".encode()
+
+    def _delta(self, completion_id: str, model: str, delta: Dict, finish_reason=None) -> bytes:
+        choice = {"index": 0, "delta": delta, "finish_reason": finish_reason}
+        return self._event(completion_id, model, [choice])
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "gpt-4o")
+        prompt_tokens = sum(len(str(m.get("content") or "")) // 4 for m in body.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await asyncio.sleep(self.ttfb)
+
+        tokens = _tokens(self.reply)
+        await response.write(self._delta(completion_id, model, {"role": "assistant", "content": ""}))
+        started = time.monotonic()
+        for index, token in enumerate(tokens):
+            await asyncio.sleep(max(0.0, started + index / self.tokens_per_sec - time.monotonic()))
+            await response.write(self._delta(completion_id, model, {"content": token}))
+        await response.write(self._delta(completion_id, model, {}, finish_reason="stop"))
+
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+        }
+        await response.write(self._event(completion_id, model, [], usage=usage))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        return app
+
+
+class FakeCartesia:
+    """Answers TTS websocket requests with silent PCM audio and word timestamps."""
+
+    def __init__(self, ttfb: float, realtime_factor: float):
+        self.ttfb = ttfb
+        self.realtime_factor = realtime_factor
+
+    async def _speak(self, websocket, message: Dict, offset: float) -> float:
+        """Send the audio of one transcript, returning the context's audio length."""
+        context_id = message["context_id"]
+        transcript = message.get("transcript", "")
+        sample_rate = message["output_format"]["sample_rate"]
+        secs = len(transcript) * SECS_PER_CHAR
+
+        words = transcript.split()
+        if words:
+            starts = [offset + i * secs / len(words) for i in range(len(words))]
+            await websocket.send(
+                json.dumps(
+                    {
+                        "type": "timestamps",
+                        "context_id": context_id,
+                        "word_timestamps": {"words": words, "start": starts},
+                    }
+                )
+            )
+
+        chunk = base64.b64encode(b"\x00\x00" * int(sample_rate * TTS_CHUNK_SECS)).decode()
+        started = time.monotonic()
+        for index in range(max(1, round(secs / TTS_CHUNK_SECS)) if words else 0):
+            target = started + index * TTS_CHUNK_SECS / self.realtime_factor
+            await asyncio.sleep(max(0.0, target - time.monotonic()))
+            await websocket.send(json.dumps({"type": "chunk", "context_id": context_id, "data": chunk}))
+        return offset + secs
+
+    async def handle(self, websocket):
+        # Audio sent so far per context, to place word timestamps
+        contexts: Dict[str, float] = {}
+        cancelled = set()
+        async for raw in websocket:
+            message = json.loads(raw)
+            context_id = message.get("context_id")
+            if message.get("cancel"):
+                cancelled.add(context_id)
+                contexts.pop(context_id, None)
+                continue
+            if context_id in cancelled:
+                continue
+            if context_id not in contexts:
+                contexts[context_id] = 0.0
+                await asyncio.sleep(self.ttfb)
+            contexts[context_id] = await self._speak(websocket, message, contexts[context_id])
+            if not message.get("continue", True):
+                contexts.pop(context_id, None)
+                await websocket.send(json.dumps({"type": "done", "context_id": context_id}))
+
+
+async def serve(
+    openai_port: int,
+    cartesia_port: int,
+    llm_ttfb: float,
+    tokens_per_sec: float,
+    tts_ttfb: float,
+    realtime_factor: float,
+):
+    """Run both stand-ins until cancelled."""
+    runner = web.AppRunner(FakeOpenAI(llm_ttfb, tokens_per_sec).app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", openai_port).start()
+    cartesia = FakeCartesia(tts_ttfb, realtime_factor)
+    async with websockets.serve(cartesia.handle, "127.0.0.1", cartesia_port, max_size=None):
+        try:
+            await asyncio.Future()
+        finally:
+            await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI and Cartesia stand-ins")
+    parser.add_argument("--openai-port", type=int, default=8701)
+    parser.add_argument("--cartesia-port", type=int, default=8702)
+    parser.add_argument("--llm-ttfb-ms", type=float, default=400, help="Time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=60, help="LLM token rate")
+    parser.add_argument("--tts-ttfb-ms", type=float, default=150, help="Time to first TTS audio")
+    parser.add_argument(
+        "--tts-realtime-factor", type=float, default=4, help="How much faster than real time TTS audio is sent"
+    )
+    args = parser.parse_args()
+    asyncio.run(
+        serve(
+            args.openai_port,
+            args.cartesia_port,
+            args.llm_ttfb_ms / 1000,
+            args.tokens_per_sec,
+            args.tts_ttfb_ms / 1000,
+            args.tts_realtime_factor,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""First-turn latency and cached prompt tokens per level, against the OpenAI API.
+
+Sends each level's first request, its system prompt and tools with the level's
+model, `--sessions` times in a row, the way new sessions of the level would,
+and reports the time to the first token and the prompt tokens OpenAI read
+from its prompt cache. The first request of a level usually misses the cache;
+the others should read the whole system prompt from it (see levels/prompts.py).
+The cache is kept for a few minutes, so run it twice to see warm numbers
+throughout.
+
+Needs OPENAI_API_KEY, and uses OPENAI_BASE_URL if set.
+
+Usage:
+    python -m benchmarks.prompt_cache --sessions 5
+    python -m benchmarks.prompt_cache --levels 1 4 --sessions 10
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import Any, Dict, List
+
+from openai import AsyncOpenAI
+
+from levels import LEVEL_MODULES, get_level_config
+from levels.prompts import WEAVE_KNOWLEDGE
+
+
+async def first_turn(client: AsyncOpenAI, model: str, config) -> Dict[str, Any]:
+    started = time.monotonic()
+    ttfb = None
+    usage = None
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=config.session_messages(),
+        tools=config.tools or None,
+        stream=True,
+        stream_options={"include_usage": True},
+        max_tokens=40,
+    )
+    async for chunk in stream:
+        if ttfb is None and chunk.choices:
+            ttfb = time.monotonic() - started
+        if chunk.usage:
+            usage = chunk.usage
+    details = usage.prompt_tokens_details if usage else None
+    return {
+        "ttfb": ttfb,
+        "prompt_tokens": usage.prompt_tokens if usage else 0,
+        "cached_tokens": (details.cached_tokens or 0) if details else 0,
+    }
+
+
+def ms(value) -> str:
+    return f"{value * 1000:.0f}" if value is not None else "-"
+
+
+async def run(args: argparse.Namespace):
+    client = AsyncOpenAI()
+    print(f"Shared knowledge prefix: {len(WEAVE_KNOWLEDGE.encode())} bytes")
+    print(f"{'level':>6}  {'model':<28}{'prompt':>8}{'cold ms':>9}{'cold cached':>13}{'warm ms':>9}{'warm cached':>13}")
+    for level_id in args.levels:
+        config = get_level_config(level_id)
+        model = config.get_llm_service().model_name
+        results: List[Dict[str, Any]] = [await first_turn(client, model, config) for _ in range(args.sessions)]
+        cold, warm = results[0], results[1:]
+        warm_ttfb = [result["ttfb"] for result in warm if result["ttfb"] is not None]
+        warm_cached = [result["cached_tokens"] for result in warm]
+        print(
+            f"{level_id:>6}  {model:<28}{cold['prompt_tokens']:>8}{ms(cold['ttfb']):>9}{cold['cached_tokens']:>13}"
+            f"{ms(statistics.median(warm_ttfb) if warm_ttfb else None):>9}"
+            f"{(statistics.median(warm_cached) if warm_cached else 0):>13.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt cache benchmark")
+    parser.add_argument("--levels", type=int, nargs="+", default=list(LEVEL_MODULES), help="Levels to run")
+    parser.add_argument("--sessions", type=int, default=5, help="First turns per level")
+    args = parser.parse_args()
+    if not os.getenv("OPENAI_API_KEY"):
+        parser.error("OPENAI_API_KEY is not set")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
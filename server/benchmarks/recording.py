@@ -0,0 +1,160 @@
+"""Conversation recording: in-memory WAV rebuild vs streaming to disk.
+
+Simulates a long session the way AudioBufferProcessor records it (24 kHz mono,
+20 ms frames, user audio continuous, bot speaking half of the time) and saves
+the recording either the old way, building the WAV in memory on the event loop
+when the call ends, or with ConversationRecorder. Each mode runs in its own
+process so peak RSS can be compared. Event-loop stalls are measured by a task
+that sleeps for 1 ms and records how late it wakes up.
+
+Usage:
+    python -m benchmarks.recording --minutes 30
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from typing import Dict, List
+
+from pipecat.audio.utils import mix_audio
+
+from recording import RECORDING_BUFFER_SIZE, ConversationRecorder
+from stats import current_rss_bytes
+
+SAMPLE_RATE = 24000
+FRAME_MS = 20
+FRAME_BYTES = SAMPLE_RATE * FRAME_MS // 1000 * 2
+
+# The bot alternates between speaking and listening for this many frames
+TURN_FRAMES = 250
+
+MODES = ["in-memory", "streaming"]
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def save_in_memory(audio: bytes) -> wave.Wave_read:
+    # What save_audio did before recordings were streamed to disk
+    with io.BytesIO() as buffer:
+        with wave.open(buffer, "wb") as wf:
+            wf.setsampwidth(2)
+            wf.setnchannels(1)
+            wf.setframerate(SAMPLE_RATE)
+            wf.writeframes(audio)
+        buffer.seek(0)
+        return wave.open(io.BytesIO(buffer.getvalue()), "rb")
+
+
+async def monitor_loop(stalls: List[float], stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        stalls.append(time.perf_counter() - started - 0.001)
+
+
+async def record(mode: str, minutes: float) -> Dict[str, float]:
+    frames = int(minutes * 60 * 1000 / FRAME_MS)
+    user_frame = b"\x01\x00" * (FRAME_BYTES // 2)
+    bot_frame = b"\x02\x00" * (FRAME_BYTES // 2)
+
+    stalls: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop(stalls, stop))
+
+    buffer_size = RECORDING_BUFFER_SIZE if mode == "streaming" else 0
+    directory = tempfile.TemporaryDirectory()
+    recorder = ConversationRecorder("benchmark", directory.name)
+    user_buffer = bytearray()
+    bot_buffer = bytearray()
+
+    started = time.perf_counter()
+    for i in range(frames):
+        user_buffer.extend(user_frame)
+        if (i // TURN_FRAMES) % 2:
+            bot_buffer.extend(bot_frame)
+        elif len(bot_buffer) < len(user_buffer):
+            bot_buffer.extend(b"\x00" * (len(user_buffer) - len(bot_buffer)))
+
+        if buffer_size and len(user_buffer) > buffer_size:
+            await recorder.write(mix_audio(bytes(user_buffer), bytes(bot_buffer)), SAMPLE_RATE, 1)
+            user_buffer = bytearray()
+            bot_buffer = bytearray()
+
+        # Frames arrive one at a time; let other tasks run in between
+        await asyncio.sleep(0)
+
+    merged = mix_audio(bytes(user_buffer), bytes(bot_buffer))
+    if mode == "streaming":
+        await recorder.write(merged, SAMPLE_RATE, 1)
+        await recorder.close()
+    else:
+        save_in_memory(merged)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await monitor
+    directory.cleanup()
+
+    stalls.sort()
+    return {
+        "elapsed_s": elapsed,
+        "stall_p99_ms": stalls[int(len(stalls) * 0.99)] * 1000,
+        "stall_max_ms": stalls[-1] * 1000,
+    }
+
+
+def run_mode(mode: str, minutes: float) -> Dict[str, float]:
+    rss_before = current_rss_bytes()
+    result = asyncio.run(record(mode, minutes))
+    result["peak_rss_mb"] = peak_rss_bytes() / 1024 / 1024
+    result["peak_rss_growth_mb"] = (peak_rss_bytes() - rss_before) / 1024 / 1024
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recording benchmark")
+    parser.add_argument("--minutes", type=float, default=30, help="Length of the session")
+    parser.add_argument("--mode", choices=MODES, help="Run a single mode and print JSON")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.minutes)))
+        return
+
+    # Peak RSS only ever grows, so every mode gets a fresh process
+    results = {}
+    for mode in MODES:
+        command = [sys.executable, "-m", "benchmarks.recording", "--mode", mode]
+        output = subprocess.run(
+            command + ["--minutes", str(args.minutes)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{args.minutes:g} minute session")
+    print(
+        f"{'mode':<12}{'peak RSS MB':>13}{'RSS growth MB':>15}"
+        f"{'stall p99 ms':>14}{'stall max ms':>14}{'time s':>9}"
+    )
+    for mode, result in results.items():
+        print(
+            f"{mode:<12}{result['peak_rss_mb']:>13.1f}{result['peak_rss_growth_mb']:>15.1f}"
+            f"{result['stall_p99_ms']:>14.2f}{result['stall_max_ms']:>14.2f}{result['elapsed_s']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
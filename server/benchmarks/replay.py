@@ -0,0 +1,200 @@
+"""Replay recorded sessions to catch latency and CPU regressions.
+
+Runs bot-openai.py's pipeline against sessions recorded with REPLAY_RECORD_DIR
+set (see replay.py), one at a time, with the LLM and TTS streaming their
+recorded responses at the recorded timing or `--speed` times faster. Each
+recording is replayed `--runs` times; the report has the median CPU time of
+its runs and the voice-to-voice latency of all their turns.
+
+Save a run with `--save` before a change (a pipecat upgrade, a prompt change,
+a new processor) and compare against it with `--baseline` after. A recording
+regresses when its CPU time or p95 latency grows by more than `--tolerance`,
+and the exit status is then 1. Compare runs at the same speed on the same
+machine.
+
+Usage:
+    python -m benchmarks.replay recordings/*.replay.jsonl.gz --speed 4 --runs 3 --save baseline.json
+    python -m benchmarks.replay recordings/*.replay.jsonl.gz --speed 4 --runs 3 --baseline baseline.json
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+# Milliseconds of p95 latency growth always allowed, for timer noise
+LATENCY_SLACK_MS = 20
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def ms(value: Optional[float]) -> str:
+    return f"{value * 1000:.0f}" if value is not None else "-"
+
+
+async def replay_once(bot, path: str, speed: float, run: int) -> Dict[str, Any]:
+    from levels import get_level_config
+    from replay import ReplayLevelConfig, ReplayTransport, SessionRecording
+
+    recording = SessionRecording.load(path)
+    config = ReplayLevelConfig(get_level_config(recording.level), recording, speed)
+
+    def transport_factory(room_url, token, bot_name, params):
+        return ReplayTransport(params, recording, speed)
+
+    turns: List[float] = []
+    first_word: List[float] = []
+    sinks = [
+        logger.add(
+            lambda message: turns.append(message.record["extra"]["turn_latency"]["stages"]["bot_audio_out"]),
+            filter=lambda record: "turn_latency" in record["extra"],
+            level="INFO",
+        ),
+        logger.add(
+            lambda message: first_word.append(
+                message.record["extra"]["session_timeline"]["durations"].get("total", 0.0)
+            ),
+            filter=lambda record: "session_timeline" in record["extra"],
+            level="INFO",
+        ),
+    ]
+    cpu_started, wall_started = time.process_time(), time.monotonic()
+    try:
+        await bot.main(
+            f"replay://{recording.session_id}",
+            "replay",
+            {"level": recording.level},
+            session_id=f"replay-{recording.session_id}-{run}",
+            transport_factory=transport_factory,
+            level_config=config,
+        )
+    finally:
+        for sink in sinks:
+            logger.remove(sink)
+    return {
+        "session_id": recording.session_id,
+        "cpu_seconds": time.process_time() - cpu_started,
+        "wall_seconds": time.monotonic() - wall_started,
+        "turns": turns,
+        "first_word": first_word[0] if first_word else None,
+    }
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine the runs of one recording."""
+    turns = [latency for run in runs for latency in run["turns"]]
+    first_word = [run["first_word"] for run in runs if run["first_word"] is not None]
+    return {
+        "runs": len(runs),
+        # Turns of the run with the fewest, since a replay should have all of them
+        "turns": min(len(run["turns"]) for run in runs),
+        "cpu_seconds": statistics.median(run["cpu_seconds"] for run in runs),
+        "wall_seconds": statistics.median(run["wall_seconds"] for run in runs),
+        "latency_p50": percentile(turns, 50),
+        "latency_p95": percentile(turns, 95),
+        "first_word": statistics.median(first_word) if first_word else None,
+    }
+
+
+def regressions(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Compare one recording's summary with its baseline."""
+    found = []
+    if result["cpu_seconds"] > baseline["cpu_seconds"] * (1 + tolerance):
+        found.append(f"CPU {baseline['cpu_seconds']:.2f} s -> {result['cpu_seconds']:.2f} s")
+    if result["latency_p95"] is not None and baseline["latency_p95"] is not None:
+        allowed = baseline["latency_p95"] * (1 + tolerance) + LATENCY_SLACK_MS / 1000
+        if result["latency_p95"] > allowed:
+            found.append(f"p95 latency {ms(baseline['latency_p95'])} ms -> {ms(result['latency_p95'])} ms")
+    if result["turns"] < baseline["turns"]:
+        found.append(f"turns {baseline['turns']} -> {result['turns']}")
+    return found
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    # Import after the environment is set up
+    bot = importlib.import_module("bot-openai")
+    from vad import load_silero_model
+
+    load_silero_model()
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    results = {}
+    for path in args.recordings:
+        runs = [await replay_once(bot, path, args.speed, run) for run in range(args.runs)]
+        result = summarize(runs)
+        results[runs[0]["session_id"]] = result
+        print(
+            f"{runs[0]['session_id'][:24]:<26}{result['turns']:>6}{result['cpu_seconds']:>9.2f}"
+            f"{result['wall_seconds']:>9.1f}{ms(result['latency_p50']):>9}{ms(result['latency_p95']):>9}"
+            f"{ms(result['first_word']):>12}",
+            flush=True,
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded sessions")
+    parser.add_argument("recordings", nargs="+", help="Recordings made with REPLAY_RECORD_DIR")
+    parser.add_argument("--speed", type=float, default=1.0, help="How much faster than recorded to replay")
+    parser.add_argument("--runs", type=int, default=1, help="Replays of each recording")
+    parser.add_argument("--save", help="Write the results to this file, to compare against later")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed growth of CPU and p95 latency")
+    parser.add_argument("--trace", action="store_true", help="Keep Weave tracing on")
+    args = parser.parse_args()
+
+    if not args.trace:
+        os.environ["WEAVE_DISABLED"] = "true"
+    # Replays aren't recorded, and the services never reach the APIs
+    os.environ.pop("REPLAY_RECORD_DIR", None)
+    os.environ.setdefault("OPENAI_API_KEY", "replay")
+    os.environ.setdefault("CARTESIA_API_KEY", "replay")
+    # Summaries of older turns would need the API
+    os.environ["CONTEXT_COMPACTION"] = "truncate"
+    # Every recorded turn was answered by the LLM stream, cache hits included
+    os.environ["RESPONSE_CACHE_SIZE"] = "0"
+    # The greeting was recorded as a TTS response, and is replayed as one
+    os.environ["AUDIO_CACHE_MAX_BYTES"] = "0"
+
+    print(f"Speed {args.speed:g}x, {args.runs} run(s) per recording")
+    print(f"{'session':<26}{'turns':>6}{'cpu s':>9}{'wall s':>9}{'p50 ms':>9}{'p95 ms':>9}{'first word':>12}")
+    results = asyncio.run(run(args))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"speed": args.speed, "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["speed"] != args.speed:
+            print(f"Warning: the baseline was replayed at {baseline['speed']:g}x")
+        failed = False
+        for session_id, result in results.items():
+            if session_id not in baseline["results"]:
+                print(f"{session_id}: not in the baseline")
+                continue
+            found = regressions(result, baseline["results"][session_id], args.tolerance)
+            if found:
+                failed = True
+                print(f"{session_id}: REGRESSED, {', '.join(found)}")
+            else:
+                print(f"{session_id}: ok")
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Pipeline latency with the tracing backend healthy, slow or down.
+
+Runs a simulated pipeline, a 20 ms frame clock calling traced ops, while the
+trace spool uploads to a local HTTP stand-in for the backend. The stand-in
+answers right away ("ok"), after a delay ("slow"), with 503s ("down"), or not at
+all because nothing is listening ("unreachable"). "disabled" runs the same
+pipeline without tracing as the baseline.
+
+Reports how late frames are, how many records were spooled and uploaded, and
+how many were still in the spool when the run ended.
+
+Usage:
+    python -m benchmarks.trace_spool --seconds 20
+"""
+
+import argparse
+import asyncio
+import socket
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import tracing
+from trace_spool import HttpSink
+from tracing import TRACE_FLUSH_INTERVAL, TraceExporter, traced
+
+FRAME_SECS = 0.02
+
+# Frames per simulated turn
+TURN_FRAMES = 50
+
+MODES = ["disabled", "ok", "slow", "down", "unreachable"]
+
+
+class StandIn(BaseHTTPRequestHandler):
+    mode = "ok"
+    delay = 5.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.mode == "slow":
+            time.sleep(self.delay)
+        self.send_response(503 if self.mode == "down" else 200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@traced()
+def process_frame(index: int, audio: bytes) -> int:
+    return len(audio)
+
+
+@traced()
+async def llm_turn(index: int, context: List[Dict[str, str]]) -> str:
+    return f"reply {index}"
+
+
+@traced()
+async def turn(index: int) -> str:
+    return await llm_turn(index, [{"role": "user", "content": "hello " * 50}])
+
+
+async def pipeline(seconds: float) -> List[float]:
+    audio = b"\x00" * 960
+    lateness = []
+    started = time.perf_counter()
+    for index in range(int(seconds / FRAME_SECS)):
+        target = started + index * FRAME_SECS
+        await asyncio.sleep(max(0.0, target - time.perf_counter()))
+        lateness.append(time.perf_counter() - target)
+        process_frame(index, audio)
+        if index % TURN_FRAMES == 0:
+            await turn(index)
+    return lateness
+
+
+def run_mode(mode: str, seconds: float, delay: float) -> Dict[str, float]:
+    server = None
+    port = free_port()
+    if mode not in ("disabled", "unreachable"):
+        StandIn.mode = mode
+        StandIn.delay = delay
+        server = ThreadingHTTPServer(("127.0.0.1", port), StandIn)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    directory = tempfile.TemporaryDirectory()
+    exporter = TraceExporter(
+        spool_dir=directory.name,
+        sink=HttpSink(f"http://127.0.0.1:{port}/traces", timeout=delay * 2),
+    )
+    if mode != "disabled":
+        exporter.project = "benchmark"
+    tracing.exporter = exporter
+
+    lateness = sorted(asyncio.run(pipeline(seconds)))
+    # Let the exporter spool the last records
+    time.sleep(2 * TRACE_FLUSH_INTERVAL)
+    stats = exporter.stats()
+    spool = stats["spool"] or {}
+    exporter.stop(1)
+
+    if server:
+        server.shutdown()
+    directory.cleanup()
+    return {
+        "p50_ms": lateness[len(lateness) // 2] * 1000,
+        "p99_ms": lateness[int(len(lateness) * 0.99)] * 1000,
+        "max_ms": lateness[-1] * 1000,
+        "spooled": stats["exported"],
+        "uploaded": spool.get("uploaded", 0),
+        "pending": stats["exported"] - spool.get("uploaded", 0),
+        "failures": spool.get("upload_failures", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trace spool benchmark")
+    parser.add_argument("--seconds", type=float, default=20, help="Length of each run")
+    parser.add_argument("--delay", type=float, default=5, help="Response delay of the slow stand-in")
+    args = parser.parse_args()
+
+    print(f"{args.seconds:g}s of 20 ms frames per mode")
+    print(
+        f"{'backend':<13}{'late p50 ms':>12}{'late p99 ms':>12}{'late max ms':>12}"
+        f"{'spooled':>9}{'uploaded':>10}{'pending':>9}{'failures':>10}"
+    )
+    for mode in MODES:
+        result = run_mode(mode, args.seconds, args.delay)
+        print(
+            f"{mode:<13}{result['p50_ms']:>12.2f}{result['p99_ms']:>12.2f}{result['max_ms']:>12.2f}"
+            f"{result['spooled']:>9}{result['uploaded']:>10}{result['pending']:>9}{result['failures']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
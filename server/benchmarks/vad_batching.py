@@ -0,0 +1,113 @@
+"""CPU cost per stream of VAD inference against concurrency.
+
+Simulates N concurrent sessions, each analyzing one 32 ms chunk of 16 kHz
+audio in real time from its own thread (like a transport's VAD executor).
+Compares pipecat's per-session SileroVADAnalyzer with analyzers batched
+through VADBatchScheduler, and reports process CPU time per stream and the
+p99 time each analysis call took.
+
+Usage:
+    python -m benchmarks.vad_batching --duration 5 --window-ms 5
+"""
+
+import argparse
+import threading
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+from loguru import logger
+from pipecat.audio.vad.silero import SileroVADAnalyzer
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer
+
+from vad import BatchedSileroVADAnalyzer, VADBatchScheduler, load_silero_model
+
+SAMPLE_RATE = 16000
+CHUNK_SAMPLES = 512
+CHUNK_SECS = CHUNK_SAMPLES / SAMPLE_RATE
+
+
+def _synthetic_speech(seconds: float) -> bytes:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 0.5 * t))
+    tone = np.sin(2 * np.pi * 180 * t) + 0.5 * np.sin(2 * np.pi * 360 * t)
+    noise = np.random.default_rng(0).normal(0, 0.05, t.size)
+    return ((tone * envelope + noise) * 6000).astype(np.int16).tobytes()
+
+
+def _stream(analyzer: VADAnalyzer, audio: bytes, until: float, latencies: List[float]):
+    chunk_bytes = CHUNK_SAMPLES * 2
+    offset = 0
+    next_chunk = time.monotonic()
+    while next_chunk < until:
+        chunk = audio[offset : offset + chunk_bytes]
+        offset = (offset + chunk_bytes) % (len(audio) - chunk_bytes)
+
+        started = time.monotonic()
+        analyzer.voice_confidence(chunk)
+        latencies.append(time.monotonic() - started)
+
+        next_chunk += CHUNK_SECS
+        time.sleep(max(0.0, next_chunk - time.monotonic()))
+
+
+def measure(factory: Callable[[], VADAnalyzer], streams: int, duration: float) -> Dict[str, float]:
+    analyzers = [factory() for _ in range(streams)]
+    for analyzer in analyzers:
+        analyzer.set_sample_rate(SAMPLE_RATE)
+    audio = _synthetic_speech(10)
+
+    latencies: List[float] = []
+    until = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=_stream, args=(analyzer, audio, until, latencies))
+        for analyzer in analyzers
+    ]
+
+    cpu_started = time.process_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cpu = time.process_time() - cpu_started
+
+    latencies.sort()
+    return {
+        # CPU milliseconds spent per second of audio, per stream
+        "cpu_ms_per_stream_sec": cpu / streams / duration * 1000,
+        "call_p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched VAD benchmark")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per run")
+    parser.add_argument("--window-ms", type=float, default=5.0, help="Batch window")
+    parser.add_argument(
+        "--streams", type=int, nargs="+", default=[1, 8, 32, 128], help="Concurrency levels"
+    )
+    args = parser.parse_args()
+
+    logger.remove()
+    load_silero_model()
+    scheduler = VADBatchScheduler(window=args.window_ms / 1000)
+
+    print(f"{'streams':>8}{'analyzer':>12}{'CPU ms/stream-s':>18}{'call p99 ms':>14}")
+    for streams in args.streams:
+        runs = {
+            "baseline": SileroVADAnalyzer,
+            "batched": lambda: BatchedSileroVADAnalyzer(scheduler=scheduler),
+        }
+        for name, factory in runs.items():
+            result = measure(factory, streams, args.duration)
+            print(
+                f"{streams:>8}{name:>12}{result['cpu_ms_per_stream_sec']:>18.2f}"
+                f"{result['call_p99_ms']:>14.2f}"
+            )
+
+    scheduler.stop()
+    print(f"average batch size: {scheduler.chunks / max(scheduler.batches, 1):.1f}")
+
+
+if __name__ == "__main__":
+    main()
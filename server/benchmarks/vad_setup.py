@@ -0,0 +1,77 @@
+"""Per-session VAD setup cost: pipecat's SileroVADAnalyzer vs the shared model.
+
+Creates one analyzer per simulated session, configures it for 16 kHz and runs
+a first inference, keeping every analyzer alive like concurrent sessions
+would. Reports the setup time per session and the RSS added per session.
+
+Usage:
+    python -m benchmarks.vad_setup --sessions 50
+"""
+
+import argparse
+import gc
+import time
+from typing import Callable, Dict
+
+from loguru import logger
+from pipecat.audio.vad.silero import SileroVADAnalyzer
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer
+
+from stats import current_rss_bytes
+from vad import SharedSileroVADAnalyzer, load_silero_model
+
+SAMPLE_RATE = 16000
+
+# One VAD window of silence at 16 kHz
+SILENCE = b"\x00\x00" * 512
+
+
+def measure(factory: Callable[[], VADAnalyzer], sessions: int) -> Dict[str, float]:
+    gc.collect()
+    rss_before = current_rss_bytes()
+
+    analyzers = []
+    setup_times = []
+    for _ in range(sessions):
+        started = time.perf_counter()
+        analyzer = factory()
+        analyzer.set_sample_rate(SAMPLE_RATE)
+        analyzer.voice_confidence(SILENCE)
+        setup_times.append(time.perf_counter() - started)
+        analyzers.append(analyzer)
+
+    rss_after = current_rss_bytes()
+    setup_times.sort()
+    return {
+        "setup_p50_ms": setup_times[len(setup_times) // 2] * 1000,
+        "setup_max_ms": setup_times[-1] * 1000,
+        "rss_per_session_kb": (rss_after - rss_before) / sessions / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VAD setup benchmark")
+    parser.add_argument("--sessions", type=int, default=50, help="Number of sessions")
+    args = parser.parse_args()
+
+    # Keep the analyzers' debug logging out of the timings
+    logger.remove()
+
+    # The shared model is loaded at worker startup, not per session
+    load_silero_model()
+
+    results = {
+        "SileroVADAnalyzer": measure(SileroVADAnalyzer, args.sessions),
+        "SharedSileroVADAnalyzer": measure(SharedSileroVADAnalyzer, args.sessions),
+    }
+
+    print(f"{'analyzer':<26}{'setup p50 ms':>14}{'setup max ms':>14}{'RSS/session KB':>16}")
+    for name, result in results.items():
+        print(
+            f"{name:<26}{result['setup_p50_ms']:>14.2f}{result['setup_max_ms']:>14.2f}"
+            f"{result['rss_per_session_kb']:>16.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -12,20 +12,17 @@ the conversation flow.
 """
 
 import asyncio
-import io
+import functools
 import os
 import sys
 import wave
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, Optional, List
 
-import aiohttp
 from dotenv import load_dotenv
 from loguru import logger
 # from PIL import Image
 import weave
 
-from openai.types.chat import ChatCompletionToolParam, ChatCompletionMessageParam
-from pipecat.audio.vad.silero import SileroVADAnalyzer
 # from pipecat.frames.frames import (
 #     BotStartedSpeakingFrame,
 #     BotStoppedSpeakingFrame,
@@ -42,48 +39,83 @@ from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
 from pipecat.processors.audio.audio_buffer_processor import AudioBufferProcessor
 from pipecat.processors.frameworks.rtvi import RTVIConfig, RTVIProcessor, RTVIObserver
 # from pipecat.services.elevenlabs import ElevenLabsTTSService
-from pipecat.services.cartesia import CartesiaTTSService
-from pipecat.services.openai import OpenAILLMService
+from pipecat.transports.base_transport import BaseTransport
 from pipecat.transports.services.daily import DailyParams, DailyTransport
 from pipecatcloud.agent import DailySessionArguments
 
 # Use relative import to avoid issues when deploying
+import context_logging
+from audio_cache import CachedSpeech
+from audio_codecs import encode_recording, get_encoder
+from context_budget import ContextBudget
+from knowledge import KNOWLEDGE_TOP_K, KnowledgeInjector, without_knowledge
+from latency import TurnLatencyObserver
 from levels import get_level_config
+from levels.base import BaseLevelConfig
+from recording import RECORDING_BUFFER_SIZE, ConversationRecorder, TurnIndexer, discard
+from replay import REPLAY_RECORD_DIR, SessionRecorder
+from response_cache import RESPONSE_CACHE_SIZE, SessionResponseCache
+from session_runtime import BotSession, sessions
+from timeline import SessionTimeline, TimelineObserver
+import tracing
+from tracing import traced
+from vad import create_vad_analyzer
+from worker_metrics import UsageObserver
 
 load_dotenv(override=True)
 # logger.remove(0)
 logger.add(sys.stderr, level="DEBUG")
 
-weave.init(project_name="starter-challenge/level0")
+# Trace LLM requests through the exporter, logging each session's context
+# once, then only what each turn appends
+context_logging.patch_openai()
+tracing.init("starter-challenge/level0")
 
 sprites = []
 script_dir = os.path.dirname(__file__)
 print("SCRIPT_DIR:", script_dir)
 
-# Global variables
-rtvi_processor = None
-current_level_config = None
-
-
-@weave.op()
-async def save_audio(audio: bytes, sample_rate: int, num_channels: int, name: str):
-    if len(audio) > 0:
-        # filename = f"conversation_recording{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.wav"
-        with io.BytesIO() as buffer:
-            with wave.open(buffer, "wb") as wf:
-                wf.setsampwidth(2)
-                wf.setnchannels(num_channels)
-                wf.setframerate(sample_rate)
-                wf.writeframes(audio)
-            print("saving file")
-            buffer.seek(0)
-            return wave.open(io.BytesIO(buffer.getvalue()), "rb")
-    else:
+
+@traced()
+async def save_audio(
+    path: str,
+    sample_rate: int,
+    num_channels: int,
+    name: str,
+    turns: Optional[List[Dict[str, Any]]] = None,
+):
+    # The recording is already on disk, encoded with RECORDING_CODEC; tracing
+    # reads it from the file. User audio is on the left channel, bot audio on
+    # the right, and `turns` holds the sample offsets of every turn. Content
+    # reads and hashes the whole file, so it's opened off the event loop.
+    print("saving file")
+    if path.endswith(".wav"):
+        return await asyncio.to_thread(wave.open, path, "rb")
+    return await asyncio.to_thread(weave.Content.from_path, path, mimetype=get_encoder().mimetype)
+
+
+async def trace_recording(
+    path: Optional[str],
+    sample_rate: int,
+    num_channels: int,
+    name: str,
+    turns: Optional[List[Dict[str, Any]]] = None,
+):
+    """Encode a recording, hand it to tracing and remove the files if they were temporary."""
+    if not path:
         print("No audio data to save")
+        return
+    encoded_path = await encode_recording(path)
+    await save_audio(encoded_path, sample_rate, num_channels, name, turns)
+    if encoded_path != path:
+        discard(encoded_path)
+    discard(path)
 
 
 # Handle function calls and send challenge completion events
-async def handle_function_call(function_name, tool_call_id, args, llm, context, result_callback):
+async def handle_function_call(
+    session_id, function_name, tool_call_id, args, llm, context, result_callback
+):
     """Generic function handler that delegates to level-specific handlers.
     
     This function is called when the language model calls any registered function.
@@ -91,6 +123,7 @@ async def handle_function_call(function_name, tool_call_id, args, llm, context,
     events when necessary.
     
     Args:
+        session_id: The ID of the session the call belongs to.
         function_name: The name of the function that was called.
         tool_call_id: The ID of the tool call.
         args: The arguments passed to the function.
@@ -100,8 +133,9 @@ async def handle_function_call(function_name, tool_call_id, args, llm, context,
     """
     logger.info(f"Function call: {function_name}")
     
-    # Get the current level configuration
-    global current_level_config
+    # Get the level configuration for this session
+    session = sessions.get(session_id)
+    current_level_config = session.level_config if session else None
     if not current_level_config:
         logger.error("No level configuration found")
         result = {"message": "Error: No level configuration found"}
@@ -123,7 +157,7 @@ async def handle_function_call(function_name, tool_call_id, args, llm, context,
     
     # If the challenge was completed, send a challenge completion event
     if challenge_completed:
-        global rtvi_processor
+        rtvi_processor = session.rtvi_processor
         if rtvi_processor:
             logger.info(f"Sending challenge_completed event to client for level {current_level_config.level_id}")
             frame = RTVIServerMessageFrame(
@@ -135,8 +169,15 @@ async def handle_function_call(function_name, tool_call_id, args, llm, context,
             await rtvi_processor.push_frame(frame)
 
 
-@weave.op()
-async def main(room_url: str, token: str, custom_data: Optional[Dict[str, Any]] = None):
+@traced()
+async def main(
+    room_url: str,
+    token: str,
+    custom_data: Optional[Dict[str, Any]] = None,
+    session_id: Optional[str] = None,
+    transport_factory: Callable[[str, str, str, DailyParams], BaseTransport] = DailyTransport,
+    level_config: Optional[BaseLevelConfig] = None,
+):
     """Main bot execution function.
 
     Sets up and runs the bot pipeline including:
@@ -145,11 +186,21 @@ async def main(room_url: str, token: str, custom_data: Optional[Dict[str, Any]]
     - Language model integration
     - Animation processing
     - RTVI event handling
+
+    Many sessions can run concurrently in the same process; all per-session
+    state is kept in the session registry.
     
     Args:
         room_url: The Daily room URL
         token: The Daily room token
         custom_data: Custom data passed from the client, including the level ID
+        session_id: The session ID. A new one is generated if not given.
+        transport_factory: Creates the transport from the room URL, token, bot
+            name and transport parameters. Load tests replace DailyTransport
+            with a local one.
+        level_config: The level configuration to use instead of the one
+            custom_data selects. Replays pass one whose services play a
+            recording.
     """
     log = logger
     log.debug("Starting bot in room: {}", room_url)
@@ -159,110 +210,191 @@ async def main(room_url: str, token: str, custom_data: Optional[Dict[str, Any]]
     if custom_data and isinstance(custom_data, dict):
         level_id = custom_data.get("level", 0)
     
-    # Get the level configuration
-    global current_level_config
-    current_level_config = get_level_config(level_id)
+    # Get the level configuration and register the session
+    current_level_config = level_config or get_level_config(level_id)
     log.info(f"Using level configuration for level {level_id}")
+    # The server passes the session ID in custom_data to correlate its timeline
+    if session_id is None and custom_data and isinstance(custom_data, dict):
+        session_id = custom_data.get("session_id")
+    session = sessions.create(room_url, current_level_config, session_id)
+    session.timeline = SessionTimeline.from_custom_data(session.session_id, level_id, custom_data)
+    session.timeline.mark("bot_started")
+    context_logging.start_session(session.session_id)
 
-    async with aiohttp.ClientSession() as session:
-
-        # Set up Daily transport with video/audio parameters
-        transport = DailyTransport(
-            room_url,
-            token,
-            "Chatbot",
-            DailyParams(
-                audio_out_enabled=True,
-                camera_out_enabled=True,
-                camera_out_width=1024,
-                camera_out_height=576,
-                vad_enabled=True,
-                vad_analyzer=SileroVADAnalyzer(),
-                transcription_enabled=True,
-            ),
-        )
-
-        # Initialize text-to-speech service using level-specific configuration
-        tts = current_level_config.get_tts_service()
-
-        # Initialize LLM service using level-specific configuration
-        llm = current_level_config.get_llm_service()
-
-        # Set up conversation context and management with level-specific messages and tools
-        context = OpenAILLMContext(current_level_config.messages, tools=current_level_config.tools)
-        context_aggregator = llm.create_context_aggregator(context)
-
-        audiobuffer = AudioBufferProcessor(enable_turn_audio=True)
-
-        # RTVI events for Pipecat client UI
-        rtvi = RTVIProcessor(config=RTVIConfig(config=[]))
-
-        global rtvi_processor
-        rtvi_processor = rtvi
-
-        # Register function handlers
-        for function_name in current_level_config.function_handlers:
-            llm.register_function(
-                function_name,
-                handle_function_call
-            )
+    try:
+        await _run_session(session, room_url, token, transport_factory)
+    finally:
+        sessions.remove(session.session_id)
+
+
+async def _run_session(
+    session: BotSession,
+    room_url: str,
+    token: str,
+    transport_factory: Callable[[str, str, str, DailyParams], BaseTransport],
+):
+    """Build and run the pipeline for a registered session."""
+    current_level_config = session.level_config
+
+    # Set up Daily transport with video/audio parameters
+    transport = transport_factory(
+        room_url,
+        token,
+        "Chatbot",
+        DailyParams(
+            audio_out_enabled=True,
+            camera_out_enabled=True,
+            camera_out_width=1024,
+            camera_out_height=576,
+            vad_enabled=True,
+            vad_analyzer=create_vad_analyzer(),
+            transcription_enabled=True,
+        ),
+    )
 
-        pipeline = Pipeline(
-            [
-                transport.input(),
-                rtvi,
-                context_aggregator.user(),
-                llm,
-                tts,
-                audiobuffer,
-                transport.output(),
-                context_aggregator.assistant(),
-            ]
+    # Initialize text-to-speech service using level-specific configuration
+    tts = current_level_config.get_tts_service()
+
+    # The level's fixed greeting is spoken from the audio cache, see
+    # audio_cache.py
+    cached_speech = CachedSpeech(tts)
+
+    # Initialize LLM service using level-specific configuration
+    llm = current_level_config.get_llm_service()
+
+    # Set up conversation context and management with level-specific messages and tools
+    messages = current_level_config.session_messages()
+    # Only the Weave knowledge each user turn needs is added to the
+    # context, see knowledge.py
+    knowledge_injector = None
+    if KNOWLEDGE_TOP_K > 0:
+        messages, in_prompt = without_knowledge(messages, current_level_config.tools)
+        knowledge_injector = KnowledgeInjector(in_prompt=in_prompt)
+    context = OpenAILLMContext(messages, tools=current_level_config.tools)
+    context_aggregator = llm.create_context_aggregator(context)
+    # Older turns are compacted to keep requests within the level's budget
+    context_budget = ContextBudget(budget=current_level_config.context_token_budget)
+    # Repeated questions about Weave are answered without the LLM, see
+    # response_cache.py
+    response_cache = None
+    if RESPONSE_CACHE_SIZE > 0:
+        response_cache = SessionResponseCache(current_level_config.level_id, current_level_config.tools)
+
+    # One stereo recording, user on the left and bot on the right, appended
+    # to a file on disk as it comes in. Turns are indexed into it rather
+    # than captured separately.
+    recorder = ConversationRecorder(session.session_id)
+    turn_indexer = TurnIndexer()
+    audiobuffer = AudioBufferProcessor(buffer_size=RECORDING_BUFFER_SIZE, num_channels=2)
+
+    # RTVI events for Pipecat client UI
+    rtvi = RTVIProcessor(config=RTVIConfig(config=[]))
+
+    session.rtvi_processor = rtvi
+
+    # Recorded for offline replay, see replay.py
+    session_recorder = None
+    if REPLAY_RECORD_DIR:
+        session_recorder = SessionRecorder(session.session_id, current_level_config.level_id, transport)
+
+    # Register function handlers
+    for function_name in current_level_config.function_handlers:
+        llm.register_function(
+            function_name,
+            functools.partial(handle_function_call, session.session_id)
         )
 
-        task = PipelineTask(
-            pipeline,
-            params=PipelineParams(
-                allow_interruptions=True,
-                enable_metrics=True,
-                enable_usage_metrics=True,
+    processors = [
+        transport.input(),
+        session_recorder and session_recorder.input(),
+        rtvi,
+        context_aggregator.user(),
+        response_cache and response_cache.lookup(),
+        knowledge_injector,
+        context_budget,
+        llm,
+        response_cache and response_cache.capture(),
+        session_recorder and session_recorder.llm(),
+        tts,
+        cached_speech,
+        session_recorder and session_recorder.tts(),
+        turn_indexer,
+        audiobuffer,
+        transport.output(),
+        context_aggregator.assistant(),
+    ]
+    pipeline = Pipeline([processor for processor in processors if processor])
+
+    task = PipelineTask(
+        pipeline,
+        params=PipelineParams(
+            allow_interruptions=True,
+            enable_metrics=True,
+            enable_usage_metrics=True,
+        ),
+        observers=[
+            RTVIObserver(rtvi),
+            TurnLatencyObserver(
+                session_id=session.session_id,
+                level=current_level_config.level_id,
+                llm=llm,
+                tts=tts,
+                output=transport.output(),
+                started_at=session.started_at,
             ),
-            observers=[RTVIObserver(rtvi)],
-        )
-
-        @audiobuffer.event_handler("on_audio_data")
-        async def on_audio_data(buffer, audio, sample_rate, num_channels):
-            await save_audio(audio, sample_rate, num_channels, "full")
-        
-        @audiobuffer.event_handler("on_user_turn_audio_data")
-        async def on_user_turn_audio_data(buffer, audio, sample_rate, num_channels):
-            print("on_user_turn_audio_data")
-            await save_audio(audio, sample_rate, num_channels, "user")
-        
-        @audiobuffer.event_handler("on_bot_turn_audio_data")
-        async def on_bot_turn_audio_data(buffer, audio, sample_rate, num_channels):
-            print("on_bot_turn_audio_data")
-            await save_audio(audio, sample_rate, num_channels, "bot")
-
-        @rtvi.event_handler("on_client_ready")
-        async def on_client_ready(rtvi):
-            await rtvi.set_bot_ready()
-
-        @transport.event_handler("on_first_participant_joined")
-        async def on_first_participant_joined(transport, participant):
-            await audiobuffer.start_recording()
-            await transport.capture_participant_transcription(participant["id"])
+            UsageObserver(level=current_level_config.level_id, llm=llm, tts=tts),
+            TimelineObserver(session.timeline, llm=llm, tts=tts, output=transport.output()),
+        ],
+    )
+    session.task = task
+
+    @audiobuffer.event_handler("on_audio_data")
+    async def on_audio_data(buffer, audio, sample_rate, num_channels):
+        await recorder.write(audio, sample_rate, num_channels)
+
+    @rtvi.event_handler("on_client_ready")
+    async def on_client_ready(rtvi):
+        await rtvi.set_bot_ready()
+
+    @transport.event_handler("on_joined")
+    async def on_joined(transport, data):
+        session.timeline.mark("bot_joined")
+
+    @transport.event_handler("on_first_participant_joined")
+    async def on_first_participant_joined(transport, participant):
+        session.timeline.mark("participant_joined")
+        await audiobuffer.start_recording()
+        turn_indexer.start_recording()
+        await transport.capture_participant_transcription(participant["id"])
+        greeting = current_level_config.greeting
+        if greeting:
+            # The LLM sees the greeting as its own first message
+            context.add_message({"role": "assistant", "content": greeting})
+            await cached_speech.say(greeting)
+        else:
             await task.queue_frames([context_aggregator.user().get_context_frame()])
+        session.timeline.mark("context_kickoff")
 
-        @transport.event_handler("on_participant_left")
-        @weave.op()
-        async def on_participant_left(transport, participant, reason):
-            print(f"Participant left: {participant}")
-            await task.cancel()
+    @transport.event_handler("on_participant_left")
+    @traced()
+    async def on_participant_left(transport, participant, reason):
+        print(f"Participant left: {participant}")
+        await task.cancel()
 
-        runner = PipelineRunner()
+    # Signals are handled by the process hosting the sessions
+    runner = PipelineRunner(handle_sigint=False)
 
+    try:
         await runner.run(task)
+    finally:
+        if session_recorder:
+            await session_recorder.close()
+        # The last chunk was written when the pipeline ended
+        index = turn_indexer.stop_recording()
+        path = await recorder.close()
+        await trace_recording(
+            path, recorder.sample_rate, recorder.num_channels, "full", index.to_list()
+        )
 
 
 if __name__ == "__main__":
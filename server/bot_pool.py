@@ -0,0 +1,409 @@
+"""Pool of pre-warmed bot workers.
+
+Instead of spawning a fresh interpreter for every connection, the server keeps
+`size` workers with free session slots (see bot_worker.py) that have already
+imported the bot and are waiting on their control channel. Handing a room to a
+worker only costs one message on a pipe. Each worker can host up to
+`sessions_per_worker` conversations on its event loop. The pool refills itself
+in the background after every handoff, and falls back to spawning a worker on
+demand when no worker has a free slot. Workers are started and reaped by a
+BotSupervisor, which also keeps the room index. The latest metrics each worker
+reports are kept in `worker_metrics` (see metrics.py).
+"""
+
+import asyncio
+import json
+import sys
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from loguru import logger
+
+from metrics import WorkerMetrics
+from stats import LatencyWindow
+from supervisor import BotSupervisor, SupervisedProcess
+
+# Seconds to wait before retrying after a worker failed to start
+REFILL_RETRY_DELAY = 5.0
+
+
+def _fail(future: Optional[asyncio.Future], exc: Exception):
+    if future is not None and not future.done():
+        future.set_exception(exc)
+        # Mark the exception as retrieved; nobody may be waiting on it.
+        future.exception()
+
+
+class BotWorker:
+    """A bot worker process and its control channel."""
+
+    def __init__(
+        self,
+        process: asyncio.subprocess.Process,
+        capacity: int,
+        supervisor: BotSupervisor,
+        on_change: Callable[[], None],
+        metrics: Optional[WorkerMetrics] = None,
+    ):
+        self.process = process
+        self.capacity = capacity
+        self.supervisor = supervisor
+        self.spawned_at = time.monotonic()
+        self.ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Running sessions: {session_id: room_url}
+        self.sessions: Dict[str, str] = {}
+        # Handoffs waiting for their "started" event: {session_id: future}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._reserved = 0
+        # Retired: takes no new sessions and exits once the running ones end
+        self.draining = False
+        self._on_change = on_change
+        self._metrics = metrics
+        self._reader = asyncio.create_task(self._read_events())
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    @property
+    def running(self) -> bool:
+        return self.process.returncode is None and not self._reader.done()
+
+    @property
+    def load(self) -> int:
+        return len(self.sessions) + self._reserved
+
+    @property
+    def has_free_slot(self) -> bool:
+        return self.running and not self.draining and self.load < self.capacity
+
+    @property
+    def available(self) -> bool:
+        return self.has_free_slot and self.ready.done()
+
+    def reserve(self):
+        """Reserve a session slot ahead of a handoff."""
+        self._reserved += 1
+
+    def release(self):
+        """Release a slot reserved with reserve()."""
+        self._reserved -= 1
+        self._exit_if_idle()
+
+    def retire(self):
+        """Take no new sessions, and exit once the running ones have ended."""
+        if not self.draining:
+            logger.warning(f"Retiring bot worker {self.pid} with {len(self.sessions)} running sessions")
+        self.draining = True
+        self._exit_if_idle()
+
+    def _exit_if_idle(self):
+        if self.draining and not self.sessions and not self._reserved:
+            self.terminate()
+
+    async def _read_events(self):
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                break
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logger.warning(f"Ignoring malformed message from bot worker {self.pid}: {line!r}")
+                continue
+            self._handle_event(message)
+
+        closed = ConnectionError(f"Bot worker {self.pid} closed its control channel")
+        _fail(self.ready, closed)
+        for future in self._pending.values():
+            _fail(future, closed)
+        self._pending.clear()
+        for session_id, room_url in self.sessions.items():
+            self.supervisor.remove_session(self.pid, room_url)
+        self.sessions.clear()
+        if self._metrics:
+            self._metrics.retire(self.pid)
+        self._on_change()
+
+    def _handle_event(self, message: Dict[str, Any]):
+        event = message.get("event")
+        session_id = message.get("session_id")
+        if event == "ready" and not self.ready.done():
+            self.ready.set_result(message)
+        elif event == "started":
+            future = self._pending.pop(session_id, None)
+            if future is None or future.done():
+                # Its handoff timed out, and the worker was told to cancel it:
+                # it never counts toward the room's or the worker's sessions
+                logger.warning(f"Ignoring session {session_id} started by bot worker {self.pid} after its handoff")
+                return
+            self.sessions[session_id] = message.get("room_url")
+            self.supervisor.add_session(self.pid, self.sessions[session_id])
+            future.set_result(message)
+        elif event == "ended":
+            room_url = self.sessions.pop(session_id, None)
+            if room_url is not None:
+                self.supervisor.remove_session(self.pid, room_url)
+            self._exit_if_idle()
+            self._on_change()
+        elif event == "metrics" and self._metrics:
+            message.pop("event")
+            self._metrics.update(self.pid, message)
+
+    async def assign(
+        self,
+        session_id: str,
+        room_url: str,
+        token: str,
+        custom_data: Optional[Dict[str, Any]],
+        timeout: float,
+    ):
+        """Hand a room to the worker and wait until it has started the session.
+
+        The slot must have been reserved with reserve() beforehand. If the
+        worker doesn't acknowledge in time, it's told to cancel the session,
+        in case it starts it later.
+
+        Args:
+            session_id: The ID of the new session.
+            room_url: The Daily room URL.
+            token: The Daily room token.
+            custom_data: Custom data forwarded to the bot's main().
+            timeout: Seconds to wait for the worker to acknowledge.
+        """
+        started = asyncio.get_running_loop().create_future()
+        self._pending[session_id] = started
+        assignment = {
+            "session_id": session_id,
+            "room_url": room_url,
+            "token": token,
+            "custom_data": custom_data,
+        }
+        try:
+            self.process.stdin.write(json.dumps(assignment).encode() + b"\n")
+            await self.process.stdin.drain()
+            await asyncio.wait_for(started, timeout)
+        except BaseException:
+            self._cancel(session_id)
+            raise
+        finally:
+            self._pending.pop(session_id, None)
+
+    def _cancel(self, session_id: str):
+        if not self.running:
+            return
+        try:
+            self.process.stdin.write(json.dumps({"cancel": session_id}).encode() + b"\n")
+        except (ConnectionError, RuntimeError) as e:
+            logger.warning(f"Couldn't cancel session {session_id} on bot worker {self.pid}: {e}")
+
+    def terminate(self):
+        if self.process.returncode is None:
+            self.process.terminate()
+
+
+class BotWorkerPool:
+    """Keeps a number of pre-warmed bot workers with free session slots."""
+
+    def __init__(
+        self,
+        size: int,
+        cwd: str,
+        sessions_per_worker: int = 1,
+        handoff_timeout: float = 10.0,
+        ready_timeout: float = 120.0,
+        supervisor: Optional[BotSupervisor] = None,
+    ):
+        self.size = size
+        self.sessions_per_worker = sessions_per_worker
+        self._cwd = cwd
+        self._handoff_timeout = handoff_timeout
+        self._ready_timeout = ready_timeout
+        self._supervisor = supervisor or BotSupervisor()
+
+        self._bot_file = "bot-openai"
+        self._workers: List[BotWorker] = []
+        self._launch_lock = asyncio.Lock()
+        self._refill_event: Optional[asyncio.Event] = None
+        self._refill_task: Optional[asyncio.Task] = None
+        # Crashed workers waiting for a replacement
+        self._crashed: Deque[int] = deque()
+
+        self.hits = 0
+        self.misses = 0
+        self.handoff_latency = LatencyWindow()
+        self.warmup_latency = LatencyWindow()
+        self.worker_metrics = WorkerMetrics()
+
+    async def start(self, bot_file: str):
+        """Start filling the pool in the background.
+
+        Args:
+            bot_file: The bot module the workers should load.
+        """
+        self._bot_file = bot_file
+        self._refill_event = asyncio.Event()
+        self._refill_task = asyncio.create_task(self._refill_loop())
+        self._refill_event.set()
+
+    async def stop(self):
+        """Stop refilling and terminate all workers."""
+        if self._refill_task:
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
+        await self._supervisor.shutdown([worker.pid for worker in self._workers])
+        self._workers.clear()
+
+    async def assign(
+        self,
+        room_url: str,
+        token: str,
+        custom_data: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> BotWorker:
+        """Hand a room to a worker, preferring a pre-warmed one with a free slot.
+
+        Args:
+            room_url: The Daily room URL.
+            token: The Daily room token.
+            custom_data: Custom data forwarded to the bot's main().
+            session_id: The ID of the new session. A new one is generated if not given.
+
+        Returns:
+            The worker now running the session for this room.
+        """
+        started = time.monotonic()
+
+        # Pick a worker and reserve its slot atomically, so concurrent requests
+        # share a worker that is still warming up instead of each spawning one.
+        async with self._launch_lock:
+            worker = self._least_loaded()
+            if worker is None:
+                logger.warning("No bot worker has a free slot, spawning a worker on demand")
+                worker = await self._launch()
+            worker.reserve()
+
+        if worker.ready.done():
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        try:
+            await asyncio.wait_for(asyncio.shield(worker.ready), self._ready_timeout)
+            await worker.assign(
+                session_id or uuid.uuid4().hex,
+                room_url,
+                token,
+                custom_data,
+                self._handoff_timeout,
+            )
+        except Exception:
+            # A worker that can't acknowledge a handoff is not trusted with
+            # more, but its other sessions are left to end on their own
+            worker.retire()
+            raise
+        finally:
+            worker.release()
+            self._request_refill()
+
+        self.handoff_latency.record(time.monotonic() - started)
+        return worker
+
+    def count_sessions(self, room_url: str) -> int:
+        """Get the number of running sessions in a room."""
+        return self._supervisor.count_in_room(room_url)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the pool size, hit rate and handoff latency."""
+        requests = self.hits + self.misses
+        return {
+            "size": self.size,
+            "sessions_per_worker": self.sessions_per_worker,
+            "workers": len(self._workers),
+            "available": sum(1 for worker in self._workers if worker.available),
+            "warming": sum(1 for worker in self._workers if not worker.ready.done()),
+            "draining": sum(1 for worker in self._workers if worker.draining and worker.ready.done()),
+            "sessions": sum(len(worker.sessions) for worker in self._workers),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else None,
+            "handoff": self.handoff_latency.snapshot(),
+            "warmup": self.warmup_latency.snapshot(),
+        }
+
+    def _least_loaded(self) -> Optional[BotWorker]:
+        # Ready workers first, then the least loaded one
+        candidates = [worker for worker in self._workers if worker.has_free_slot]
+        return min(
+            candidates,
+            key=lambda worker: (not worker.ready.done(), worker.load),
+            default=None,
+        )
+
+    def _request_refill(self):
+        if self._refill_event:
+            self._refill_event.set()
+
+    async def _launch(self) -> BotWorker:
+        """Start a worker process and add it to the pool without waiting for it."""
+        process = await self._supervisor.spawn(
+            sys.executable,
+            "-m",
+            "bot_worker",
+            "--bot",
+            self._bot_file,
+            "--max-sessions",
+            str(self.sessions_per_worker),
+            replaces=self._crashed.popleft() if self._crashed else None,
+            on_exit=self._on_exit,
+            cwd=self._cwd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        worker = BotWorker(
+            process,
+            self.sessions_per_worker,
+            self._supervisor,
+            self._request_refill,
+            self.worker_metrics,
+        )
+        worker.ready.add_done_callback(lambda _: self._on_ready(worker))
+        self._workers.append(worker)
+        return worker
+
+    def _on_ready(self, worker: BotWorker):
+        if worker.ready.cancelled() or worker.ready.exception():
+            logger.error(f"Bot worker {worker.pid} failed to start")
+            worker.terminate()
+            asyncio.get_running_loop().call_later(REFILL_RETRY_DELAY, self._request_refill)
+            return
+        self.warmup_latency.record(time.monotonic() - worker.spawned_at)
+        logger.debug(f"Bot worker {worker.pid} ready")
+
+    def _on_exit(self, entry: SupervisedProcess):
+        if entry.crashed:
+            self._crashed.append(entry.pid)
+        self._request_refill()
+
+    async def _refill_loop(self):
+        while True:
+            await self._refill_event.wait()
+            self._refill_event.clear()
+
+            self._workers = [worker for worker in self._workers if worker.running]
+            free = sum(1 for worker in self._workers if worker.has_free_slot)
+            async with self._launch_lock:
+                for _ in range(self.size - free):
+                    try:
+                        await self._launch()
+                    except Exception as e:
+                        logger.error(f"Failed to start bot worker: {e}")
+                        asyncio.get_running_loop().call_later(
+                            REFILL_RETRY_DELAY, self._request_refill
+                        )
+                        break
@@ -0,0 +1,201 @@
+"""Pre-warmed, multi-session bot worker.
+
+The server keeps a pool of these processes running so that joining a room does
+not pay for interpreter start-up, the pipecat/weave/openai imports and the rest
+of the bot module initialization. A worker imports the bot module, reports that
+it is ready and then waits for assignments on its control channel:
+
+    {"session_id": "...", "room_url": "...", "token": "...", "custom_data": {...}}
+
+Every assignment starts a new session on the worker's event loop, up to
+`--max-sessions` at a time. The worker reports "started" and "ended" events for
+each session so the server can track its capacity, and a "metrics" event every
+BOT_METRICS_INTERVAL seconds with a snapshot of its metrics (see
+worker_metrics.py). The server cancels a session whose "started" event it gave
+up waiting for with:
+
+    {"cancel": "<session_id>"}
+
+The control channel is the worker's stdin/stdout pair, one JSON message per
+line in both directions. Anything the bot itself prints is redirected to stderr
+so it can't corrupt the channel.
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import signal
+import sys
+import time
+from typing import Any, Dict, Optional, Set, TextIO
+
+from loguru import logger
+
+from context_budget import close_summary_client
+from knowledge import knowledge_index
+from session_runtime import sessions
+from vad import load_silero_model
+from worker_metrics import BOT_METRICS_INTERVAL, EventLoopLagMonitor, snapshot
+
+# Seconds to wait for sessions to wind down after being cancelled
+SHUTDOWN_TIMEOUT = 10.0
+
+
+def _open_control_channel() -> TextIO:
+    """Take over the original stdout for control messages.
+
+    Returns:
+        A line-buffered text stream writing to the original stdout.
+    """
+    channel = os.fdopen(os.dup(sys.stdout.fileno()), "w", buffering=1)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return channel
+
+
+def _send(channel: TextIO, event: str, **fields: Any):
+    channel.write(json.dumps({"event": event, **fields}) + "\n")
+    channel.flush()
+
+
+async def _open_assignments() -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    await asyncio.get_running_loop().connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+    )
+    return reader
+
+
+async def _read_assignment(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    while True:
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            logger.warning(f"Ignoring malformed assignment: {line!r}")
+
+
+async def _run_session(bot, channel: TextIO, assignment: Dict[str, Any]):
+    session_id = assignment["session_id"]
+    _send(channel, "started", session_id=session_id, room_url=assignment["room_url"])
+    try:
+        await bot.main(
+            assignment["room_url"],
+            assignment["token"],
+            assignment.get("custom_data"),
+            session_id=session_id,
+        )
+    except Exception as e:
+        logger.exception(f"Session {session_id} failed: {e}")
+    finally:
+        _send(channel, "ended", session_id=session_id)
+
+
+async def _report_metrics(channel: TextIO, loop_lag: EventLoopLagMonitor):
+    while True:
+        await asyncio.sleep(BOT_METRICS_INTERVAL)
+        _send(channel, "metrics", **snapshot(loop_lag))
+
+
+async def _shutdown(tasks: Set[asyncio.Task]):
+    """Cancel every running session and wait for them to tear down."""
+    await asyncio.gather(*(sessions.close(session_id) for session_id in sessions.session_ids()))
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=SHUTDOWN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+
+
+async def serve(bot_file: str, max_sessions: int):
+    """Import the bot module and run sessions as assignments arrive.
+
+    Args:
+        bot_file: The bot module name, e.g. "bot-openai".
+        max_sessions: The maximum number of concurrent sessions.
+    """
+    channel = _open_control_channel()
+
+    started = time.monotonic()
+    bot = importlib.import_module(bot_file)
+    load_silero_model()
+    knowledge_index()
+    _send(
+        channel,
+        "ready",
+        pid=os.getpid(),
+        capacity=max_sessions,
+        warmup_secs=time.monotonic() - started,
+    )
+
+    loop_lag = EventLoopLagMonitor()
+    loop_lag.start()
+    reporter = asyncio.create_task(_report_metrics(channel, loop_lag))
+
+    tasks: Set[asyncio.Task] = set()
+    assignments = await _open_assignments()
+    reader = asyncio.create_task(_accept_assignments(bot, channel, assignments, tasks))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    # Run until asked to stop, or until the server closes the channel and the
+    # last session has finished.
+    stopped = asyncio.create_task(stop.wait())
+    await asyncio.wait({reader, stopped}, return_when=asyncio.FIRST_COMPLETED)
+    if not stop.is_set() and tasks:
+        drained = asyncio.ensure_future(asyncio.wait(set(tasks)))
+        await asyncio.wait({drained, stopped}, return_when=asyncio.FIRST_COMPLETED)
+        drained.cancel()
+    if stop.is_set():
+        reader.cancel()
+        await _shutdown(tasks)
+    stopped.cancel()
+    await close_summary_client()
+
+    # Report what the last sessions added before exiting
+    reporter.cancel()
+    loop_lag.stop()
+    try:
+        _send(channel, "metrics", **snapshot(loop_lag))
+    except OSError:
+        # The server has gone away
+        pass
+
+
+async def _accept_assignments(
+    bot, channel: TextIO, assignments: asyncio.StreamReader, tasks: Set[asyncio.Task]
+):
+    running: Dict[str, asyncio.Task] = {}
+    while True:
+        assignment = await _read_assignment(assignments)
+        if assignment is None:
+            return
+        if "cancel" in assignment:
+            # The server gave up on the handoff: it never counted the session
+            task = running.get(assignment["cancel"])
+            if task:
+                logger.warning(f"Cancelling session {assignment['cancel']}, its handoff timed out")
+                task.cancel()
+            continue
+        session_id = assignment["session_id"]
+        task = asyncio.create_task(_run_session(bot, channel, assignment))
+        tasks.add(task)
+        running[session_id] = task
+        task.add_done_callback(tasks.discard)
+        task.add_done_callback(lambda _, session_id=session_id: running.pop(session_id, None))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-warmed bot worker")
+    parser.add_argument("--bot", type=str, default="bot-openai", help="Bot module to load")
+    parser.add_argument(
+        "--max-sessions", type=int, default=1, help="Maximum number of concurrent sessions"
+    )
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.bot, args.max_sessions))
@@ -0,0 +1,222 @@
+"""Incremental logging of LLM contexts.
+
+Every chat completion request carries the whole conversation, system prompt
+and tools included, and a trace of every request's inputs would grow with the
+square of the conversation length.
+
+patch_openai() traces OpenAI's async chat completions through tracing.py's
+exporter, like any op traced with `@traced()`, so they're queued, sampled and
+spooled with the rest of the session (TRACE_POLICY names the op
+OPENAI_OP_NAME). Weave's own OpenAI integration, which would log them straight
+through its client, is never patched in (see WEAVE_SETTINGS in
+trace_spool.py). A session's first request logs its messages and tools in
+full. Later requests log only the messages appended since the previous one,
+plus a hash chain:
+
+    hash_0 = sha256("")
+    hash_n = sha256(hash_{n-1} + canonical JSON of message n)
+
+Each record carries the hash of the context it extends (`prev_hash`) and of the
+context it produces (`hash`), so rebuild() can put the full context of any
+turn back together from a session's records and verify it. If the context was
+edited rather than appended to, the record starts over with the full context.
+Tools are logged again only when they change. Deltas are only taken for
+requests that are exported, so the records of a session chain up even when
+some of its requests aren't sampled. A streamed response is logged as such:
+the reply is in the next request's context.
+"""
+
+import copy
+import functools
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from openai import AsyncStream
+from openai.resources.chat.completions import AsyncCompletions
+
+import tracing
+
+# How LLM requests are logged: "delta" logs appended messages, "full" logs
+# every request's whole context
+TRACE_LLM_CONTEXT = os.getenv("TRACE_LLM_CONTEXT", "delta").lower().strip()
+
+GENESIS_HASH = hashlib.sha256(b"").hexdigest()
+
+# Name of the traced chat completion op
+OPENAI_OP_NAME = "openai.chat.completions.create"
+
+# Whether patch_openai() has run
+_patched = False
+
+
+def canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def chain_hash(previous: str, message: Any) -> str:
+    return hashlib.sha256((previous + canonical(message)).encode()).hexdigest()
+
+
+class ContextLog:
+    """Tracks what of a session's LLM context has been logged so far."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.turn = 0
+        # Copies of the logged messages, and the chain hash after each of
+        # them, GENESIS_HASH first
+        self._logged: List[Any] = []
+        self._hashes: List[str] = [GENESIS_HASH]
+        self._tools: Any = None
+        self._tools_hash: Optional[str] = None
+
+    def delta(self, messages: List[Any], tools: Any = None) -> Dict[str, Any]:
+        """Get the record for a request, and remember its context as logged.
+
+        Args:
+            messages: The request's full message list.
+            tools: The request's tools, if any.
+
+        Returns:
+            A record with the messages appended since the last request.
+        """
+        # Comparing against copies is much cheaper than hashing the whole
+        # context again, and catches messages edited in place
+        logged = len(self._logged)
+        base = logged if messages[:logged] == self._logged else 0
+        if base == 0:
+            self._logged = []
+            del self._hashes[1:]
+        appended = messages[base:]
+        for message in appended:
+            self._hashes.append(chain_hash(self._hashes[-1], message))
+        self._logged.extend(copy.deepcopy(appended))
+
+        record: Dict[str, Any] = {
+            "session_id": self.session_id,
+            "turn": self.turn,
+            "base": base,
+            "prev_hash": self._hashes[base],
+            "hash": self._hashes[-1],
+            # Copies, so later edits to the context can't change the record
+            "messages": self._logged[base:],
+        }
+        if base == 0 and logged:
+            record["reset"] = True
+
+        if tools:
+            if tools != self._tools:
+                self._tools = copy.deepcopy(tools)
+                self._tools_hash = hashlib.sha256(canonical(tools).encode()).hexdigest()
+                record["tools"] = self._tools
+            record["tools_hash"] = self._tools_hash
+
+        self.turn += 1
+        return record
+
+
+def rebuild(records: Iterable[Dict[str, Any]]) -> Tuple[List[Any], Any]:
+    """Rebuild a session's context from its records, oldest first.
+
+    Returns:
+        The messages and tools of the context after the last record.
+
+    Raises:
+        ValueError: If a record doesn't extend the context before it, or its
+            messages don't hash to the logged hash.
+    """
+    messages: List[Any] = []
+    hashes = [GENESIS_HASH]
+    tools = None
+    for record in records:
+        base = record["base"]
+        if base > len(messages) or hashes[base] != record["prev_hash"]:
+            raise ValueError(f"Turn {record['turn']} doesn't extend the rebuilt context")
+        del messages[base:]
+        del hashes[base + 1 :]
+        for message in record["messages"]:
+            messages.append(message)
+            hashes.append(chain_hash(hashes[-1], message))
+        if hashes[-1] != record["hash"]:
+            raise ValueError(f"Hash mismatch at turn {record['turn']}")
+        if "tools" in record:
+            tools = record["tools"]
+    return messages, tools
+
+
+_current_log: ContextVar[Optional[ContextLog]] = ContextVar("context_log", default=None)
+
+
+def start_session(session_id: str) -> ContextLog:
+    """Log LLM requests made from the current context as deltas of this session.
+
+    Call from the session's main() before its pipeline starts, so the pipeline
+    tasks inherit the context.
+    """
+    log = ContextLog(session_id)
+    _current_log.set(log)
+    return log
+
+
+@contextmanager
+def unlogged():
+    """Log LLM requests made inside as their own, not as deltas of the session.
+
+    For requests that aren't the session's conversation, like a summary of it.
+    """
+    token = _current_log.set(None)
+    try:
+        yield
+    finally:
+        _current_log.reset(token)
+
+
+def postprocess_inputs(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace a chat completion's messages and tools with a context delta."""
+    log = _current_log.get()
+    messages = inputs.get("messages")
+    if log is None or not isinstance(messages, list):
+        return inputs
+    tools = inputs.get("tools")
+    processed = {k: v for k, v in inputs.items() if k not in ("messages", "tools")}
+    processed["context"] = log.delta(messages, tools if isinstance(tools, list) else None)
+    return processed
+
+
+def request_inputs(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Log a chat completion's request, its context as a delta with TRACE_LLM_CONTEXT=delta."""
+    request = {key: value for key, value in inputs.items() if key != "self"}
+    return postprocess_inputs(request) if TRACE_LLM_CONTEXT == "delta" else request
+
+
+def response_output(output: Any) -> Any:
+    """Log a chat completion's response, or only that it was streamed."""
+    if isinstance(output, AsyncStream):
+        return {"stream": True}
+    return output.model_dump() if hasattr(output, "model_dump") else output
+
+
+def patch_openai():
+    """Trace OpenAI's async chat completions through the exporter.
+
+    Raises:
+        ValueError: If TRACE_LLM_CONTEXT is not "delta" or "full"
+    """
+    if TRACE_LLM_CONTEXT not in ("delta", "full"):
+        raise ValueError(f"Invalid TRACE_LLM_CONTEXT: {TRACE_LLM_CONTEXT}. Must be 'delta' or 'full'")
+    global _patched
+    if _patched:
+        return
+    _patched = True
+    create = AsyncCompletions.create
+
+    @tracing.traced(OPENAI_OP_NAME, postprocess_inputs=request_inputs, postprocess_output=response_output)
+    @functools.wraps(create)
+    async def traced_create(self, **kwargs):
+        return await create(self, **kwargs)
+
+    AsyncCompletions.create = traced_create
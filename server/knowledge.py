@@ -0,0 +1,280 @@
+"""Retrieval of the Weave knowledge the current turn needs.
+
+Every level's system prompt starts with the whole overview of Weave (see
+levels/prompts.py), around a thousand tokens sent with every request, even
+when the user only says hello. With KNOWLEDGE_TOP_K set, as by default, the
+system prompt keeps the bot's instructions, the level's rules and only the
+first sections of the overview, and KnowledgeInjector, a stage between the
+user context aggregator and the LLM, adds the other sections relevant to each
+user turn instead. OpenAI only caches prompts of at least
+PROMPT_CACHE_MIN_TOKENS, so without_knowledge() keeps sections, in their
+order, until the tools and the system prompt, the prefix every request of a
+level shares, are estimated at CACHED_PREFIX_TOKENS: every session reads it
+from the prompt cache from its first request, as with the whole overview.
+
+The sections are indexed with BM25 once per process, in memory. For each new
+user message, the best `top_k` sections scoring at least KNOWLEDGE_MIN_SCORE
+are appended to the context as a system message right after it, starting
+with KNOWLEDGE_HEADER. A section is added only if it isn't in the context
+already, and added sections stay in the context, so follow-up questions still
+see them and the context is only ever appended to: once a conversation is past
+the minimum, its requests share their prefix for the prompt cache, and the
+context logging in context_logging.py keeps logging deltas. When the context
+is over its budget, context_budget.py drops added knowledge along with the
+turn it was added for, and a later turn needing it gets it again.
+"""
+
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from openai.types.chat import ChatCompletionMessageParam
+from pipecat.frames.frames import Frame
+from pipecat.processors.aggregators.openai_llm_context import (
+    OpenAILLMContext,
+    OpenAILLMContextFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from levels.prompts import WEAVE_KNOWLEDGE
+
+# Sections of the Weave overview added per user turn, 0 sends the whole
+# overview in the system prompt instead
+KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "2"))
+
+# Fewest prompt tokens OpenAI caches
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+# Estimated tokens of the tools and system prompt the overview's sections are
+# kept in the system prompt up to, above the minimum as the estimate is rough
+CACHED_PREFIX_TOKENS = PROMPT_CACHE_MIN_TOKENS + 64
+
+# Characters per token, roughly, for English text
+CHARS_PER_TOKEN = 4
+
+# Lowest BM25 score of a section worth adding
+KNOWLEDGE_MIN_SCORE = float(os.getenv("KNOWLEDGE_MIN_SCORE", "2.0"))
+
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Paragraphs of WEAVE_KNOWLEDGE that are instructions rather than knowledge:
+# the persona and response length at the start, and what to do without an
+# answer at the end
+INSTRUCTION_HEAD = 2
+INSTRUCTION_TAIL = 1
+
+# Introduces the sections added to the context, and tells them apart from the
+# system messages compaction keeps
+KNOWLEDGE_HEADER = "Parts of the overview of Weave relevant to the user's last message:"
+
+STOPWORDS = frozenset(
+    """a about all also an and any are as at be but by can could do does for from
+    have hi hello hey how i if in into is it its just know like me more my no of ok
+    okay on or our please so sure tell thank thanks that the their them then there
+    these they this to us use used using want was we what when where which who why
+    will with would yes you your""".split()
+)
+
+_WORD = re.compile(r"[a-z0-9@]+(?:[.'][a-z0-9]+)*")
+
+
+def terms(text: str) -> List[str]:
+    """Split text into index terms: lowercase words without stopwords or plural s."""
+    found = []
+    for word in _WORD.findall(text.lower()):
+        word = word.split("'")[0]
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        found.append(word)
+    return found
+
+
+def split_knowledge(knowledge: str = WEAVE_KNOWLEDGE) -> Tuple[str, List[str]]:
+    """Split the Weave overview into the bot's instructions and its sections.
+
+    Args:
+        knowledge: The shared start of the levels' system prompts.
+
+    Returns:
+        The instructions, and the paragraphs of knowledge in their order.
+    """
+    paragraphs = knowledge.split("\n\n")
+    instructions = paragraphs[:INSTRUCTION_HEAD] + paragraphs[len(paragraphs) - INSTRUCTION_TAIL:]
+    return "\n\n".join(instructions), paragraphs[INSTRUCTION_HEAD:len(paragraphs) - INSTRUCTION_TAIL]
+
+
+class KnowledgeIndex:
+    """BM25 index over sections of text, with an inverted index of their terms.
+
+    Args:
+        sections: The sections to index.
+    """
+
+    def __init__(self, sections: List[str]):
+        self.sections = sections
+        self._lengths = []
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        for section_id, section in enumerate(sections):
+            counts = Counter(terms(section))
+            self._lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                self._postings.setdefault(term, []).append((section_id, count))
+        self._average_length = sum(self._lengths) / max(1, len(sections))
+        self._idf = {
+            term: math.log(1 + (len(sections) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def search(self, query: str, top_k: int, min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """Find the sections that best match a query.
+
+        Args:
+            query: The text to search for.
+            top_k: The most sections to return.
+            min_score: The lowest score of a section to return.
+
+        Returns:
+            Section IDs and their scores, best first.
+        """
+        scores: Dict[int, float] = {}
+        for term in set(terms(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for section_id, count in self._postings[term]:
+                norm = 1 - BM25_B + BM25_B * self._lengths[section_id] / self._average_length
+                scores[section_id] = scores.get(section_id, 0.0) + idf * count * (BM25_K1 + 1) / (
+                    count + BM25_K1 * norm
+                )
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(section_id, score) for section_id, score in ranked if score >= min_score][:top_k]
+
+
+@lru_cache(maxsize=None)
+def knowledge_index() -> KnowledgeIndex:
+    """Get the index of the Weave overview's sections, built once per process."""
+    started = time.perf_counter()
+    index = KnowledgeIndex(split_knowledge()[1])
+    logger.debug(
+        f"Indexed {len(index.sections)} knowledge sections in {(time.perf_counter() - started) * 1000:.2f} ms"
+    )
+    return index
+
+
+def without_knowledge(
+    messages: List[ChatCompletionMessageParam], tools: Optional[List[Any]] = None
+) -> Tuple[List[ChatCompletionMessageParam], List[int]]:
+    """Take the Weave overview out of a level's system prompt, but what the prompt cache needs.
+
+    Args:
+        messages: A session's initial messages, built by levels.prompts.
+        tools: The level's tools, sent ahead of the messages.
+
+    Returns:
+        The messages with the overview's instructions kept, and its first
+        sections up to CACHED_PREFIX_TOKENS with the tools, and the IDs of the
+        sections kept. Messages not starting with the overview are returned as
+        they are, with all of them.
+    """
+    _, sections = split_knowledge()
+    if not messages or not str(messages[0].get("content", "")).startswith(WEAVE_KNOWLEDGE):
+        return messages, list(range(len(sections)))
+    paragraphs = WEAVE_KNOWLEDGE.split("\n\n")
+    head, tail = paragraphs[:INSTRUCTION_HEAD], paragraphs[len(paragraphs) - INSTRUCTION_TAIL:]
+    rest = str(messages[0]["content"])[len(WEAVE_KNOWLEDGE):]
+    tools_tokens = len(json.dumps(tools or [], default=str)) // CHARS_PER_TOKEN
+
+    system = dict(messages[0])
+    for kept in range(len(sections) + 1):
+        system["content"] = "\n\n".join(head + sections[:kept] + tail) + rest
+        if tools_tokens + len(json.dumps(system)) // CHARS_PER_TOKEN >= CACHED_PREFIX_TOKENS:
+            break
+    return [system, *messages[1:]], list(range(kept))  # type: ignore[list-item]
+
+
+def _text(message: Any) -> str:
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+class KnowledgeInjector(FrameProcessor):
+    """Adds the Weave knowledge relevant to each user turn to the context.
+
+    Goes between the user context aggregator and the LLM, in a session whose
+    system prompt went through without_knowledge().
+
+    Args:
+        top_k: The most sections to add per user message.
+        min_score: The lowest BM25 score of a section to add.
+        index: The index to search, the Weave overview's by default.
+        in_prompt: The sections without_knowledge() kept in the system prompt.
+    """
+
+    def __init__(
+        self,
+        *,
+        top_k: int = KNOWLEDGE_TOP_K,
+        min_score: float = KNOWLEDGE_MIN_SCORE,
+        index: Optional[KnowledgeIndex] = None,
+        in_prompt: Iterable[int] = (),
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._top_k = top_k
+        self._min_score = min_score
+        self._index = index or knowledge_index()
+        self._in_prompt = frozenset(in_prompt)
+        # The knowledge messages added, and their sections
+        self._injected: List[Tuple[Any, List[int]]] = []
+        # The user message searched for last. Compared by identity, since
+        # compaction (context_budget.py) moves messages to other positions and
+        # a repeated message is still a new turn.
+        self._searched: Optional[Any] = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, OpenAILLMContextFrame) and direction == FrameDirection.DOWNSTREAM:
+            self._inject(frame.context)
+
+        await self.push_frame(frame, direction)
+
+    def _inject(self, context: OpenAILLMContext):
+        messages = context.messages
+        if not messages or messages[-1].get("role") != "user":
+            # Nothing new from the user, e.g. a function call's result
+            return
+        if messages[-1] is self._searched:
+            return
+        self._searched = messages[-1]
+
+        started = time.perf_counter()
+        # Sections whose message compaction dropped can be added again
+        present = {id(message) for message in messages}
+        self._injected = [(message, ids) for message, ids in self._injected if id(message) in present]
+        added = self._in_prompt.union(*(ids for _, ids in self._injected))
+        found = self._index.search(_text(messages[-1]), self._top_k + len(added), self._min_score)
+        new = sorted([section_id for section_id, _ in found if section_id not in added][: self._top_k])
+        if not new:
+            return
+        sections = "\n\n".join(self._index.sections[section_id] for section_id in new)
+        message = {"role": "system", "content": f"{KNOWLEDGE_HEADER}\n\n{sections}"}
+        context.add_message(message)
+        self._injected.append((message, new))
+        logger.debug(
+            f"{self}: added knowledge sections {new} in {(time.perf_counter() - started) * 1000:.2f} ms"
+        )
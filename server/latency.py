@@ -0,0 +1,241 @@
+"""Per-turn voice-to-voice latency.
+
+TurnLatencyObserver watches a session's pipeline and timestamps every stage of
+each user turn, relative to the moment VAD decided the user stopped speaking:
+
+- transcription: the final transcription of the turn
+- llm_first_token: the first text from the LLM
+- tts_first_sentence: the TTS starting on the first sentence
+- tts_first_audio: the first audio from the TTS
+- bot_audio_out: the first audio frame out of the output transport, which is
+  the end-of-speech-to-bot-audio latency the user hears
+
+Each finished turn is logged as a structured record and added to per-level,
+per-model histograms in `turn_latencies`. The TTFB metrics pipecat reports for
+the LLM and TTS with `enable_metrics=True` are added to the record as well.
+
+A turn is dropped if the user starts speaking again before the bot answers.
+
+Given the session's start time, the observer also records the time to the
+bot's first audio in the session, usually its greeting, as the
+"first_bot_audio" stage.
+"""
+
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    LLMTextFrame,
+    MetricsFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.metrics.metrics import TTFBMetricsData
+from pipecat.observers.base_observer import BaseObserver
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from stats import LatencyHistogram
+
+# Stages of a turn, in the order they normally happen
+STAGES = (
+    "transcription",
+    "llm_first_token",
+    "tts_first_sentence",
+    "tts_first_audio",
+    "bot_audio_out",
+)
+
+# Seconds from the session starting to the bot's first audio
+FIRST_BOT_AUDIO = "first_bot_audio"
+
+
+@dataclass
+class TurnLatency:
+    """Latency of each stage of a user turn, in seconds after VAD stop."""
+
+    session_id: str
+    level: int
+    model: str
+    turn: int
+    stages: Dict[str, float] = field(default_factory=dict)
+    # TTFB reported by pipecat's metrics: {"llm": seconds, "tts": seconds}
+    ttfb: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def total(self) -> Optional[float]:
+        return self.stages.get("bot_audio_out")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class TurnLatencyStats:
+    """Latency histograms per level, model and stage."""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[int, str, str], LatencyHistogram] = {}
+        self.turns = 0
+
+    def record(self, turn: TurnLatency):
+        self.turns += 1
+        samples = dict(turn.stages)
+        samples.update({f"{name}_ttfb": value for name, value in turn.ttfb.items()})
+        for stage, seconds in samples.items():
+            if seconds < 0:
+                # Transcription finished before VAD stop, off the critical path
+                continue
+            self._histogram(turn.level, turn.model, stage).record(seconds)
+
+    def record_first_audio(self, level: int, model: str, seconds: float):
+        self._histogram(level, model, FIRST_BOT_AUDIO).record(seconds)
+
+    def _histogram(self, level: int, model: str, stage: str) -> LatencyHistogram:
+        key = (level, model, stage)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = LatencyHistogram()
+        return histogram
+
+    def histograms(self) -> Dict[Tuple[int, str, str], LatencyHistogram]:
+        return dict(self._histograms)
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Get the histograms as {"level:model": {stage: summary}}."""
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for (level, model, stage), histogram in sorted(self._histograms.items()):
+            result.setdefault(f"{level}:{model}", {})[stage] = histogram.snapshot()
+        return result
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Get the full histograms as JSON, for reporting to the server."""
+        return [
+            {"level": level, "model": model, "stage": stage, "histogram": histogram.to_dict()}
+            for (level, model, stage), histogram in sorted(self._histograms.items())
+        ]
+
+
+turn_latencies = TurnLatencyStats()
+
+
+class TurnLatencyObserver(BaseObserver):
+    """Timestamps the stages of every user turn in a pipeline.
+
+    Observers see a frame at every hop through the pipeline. Stage frames are
+    matched by the processor that pushes them, and VAD frames by their ID, so
+    each is only counted once.
+    """
+
+    def __init__(
+        self,
+        *,
+        session_id: str,
+        level: int,
+        llm: FrameProcessor,
+        tts: FrameProcessor,
+        output: FrameProcessor,
+        started_at: Optional[float] = None,
+        stats: TurnLatencyStats = turn_latencies,
+        on_turn: Optional[Callable[[TurnLatency], None]] = None,
+    ):
+        self.session_id = session_id
+        self.level = level
+        self.model = getattr(llm, "model_name", "") or "unknown"
+        self._llm = llm
+        self._tts = tts
+        self._output = output
+        self._stats = stats
+        self._on_turn = on_turn
+        # time.monotonic() when the session started, until its first audio
+        self._started_at = started_at
+
+        self._turns = 0
+        self._vad_stop: Optional[int] = None
+        self._vad_start_frame: Optional[int] = None
+        self._vad_stop_frame: Optional[int] = None
+        # Transcriptions can be final before VAD stop
+        self._transcribed_at: Optional[int] = None
+        self._current: Optional[TurnLatency] = None
+
+    def _start_turn(self, timestamp: int):
+        self._vad_stop = timestamp
+        self._current = TurnLatency(self.session_id, self.level, self.model, self._turns)
+        self._turns += 1
+        if self._transcribed_at is not None:
+            self._mark("transcription", self._transcribed_at)
+
+    def _mark(self, stage: str, timestamp: int):
+        if self._current is None or stage in self._current.stages:
+            return
+        self._current.stages[stage] = (timestamp - self._vad_stop) / 1e9
+
+    def _finish_turn(self):
+        turn, self._current = self._current, None
+        self._stats.record(turn)
+        logger.bind(turn_latency=turn.to_dict()).info(
+            f"Turn {turn.turn} latency: {turn.total * 1000:.0f} ms end of speech to bot audio"
+        )
+        if self._on_turn:
+            self._on_turn(turn)
+
+    def _record_ttfb(self, frame: MetricsFrame):
+        if self._current is None:
+            return
+        for data in frame.data:
+            if not isinstance(data, TTFBMetricsData) or not data.value:
+                continue
+            if data.processor == self._llm.name:
+                self._current.ttfb.setdefault("llm", data.value)
+            elif data.processor == self._tts.name:
+                self._current.ttfb.setdefault("tts", data.value)
+
+    async def on_push_frame(
+        self,
+        src: FrameProcessor,
+        dst: FrameProcessor,
+        frame: Any,
+        direction: FrameDirection,
+        timestamp: int,
+    ):
+        if direction != FrameDirection.DOWNSTREAM:
+            return
+
+        if isinstance(frame, UserStartedSpeakingFrame):
+            if frame.id != self._vad_start_frame:
+                # The user kept talking; the turn ends at the next VAD stop
+                self._vad_start_frame = frame.id
+                self._current = None
+                self._transcribed_at = None
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            if frame.id != self._vad_stop_frame:
+                self._vad_stop_frame = frame.id
+                self._start_turn(timestamp)
+        elif isinstance(frame, TranscriptionFrame):
+            if self._current is None:
+                if self._transcribed_at is None:
+                    self._transcribed_at = timestamp
+            else:
+                self._mark("transcription", timestamp)
+        elif isinstance(frame, LLMTextFrame) and src is self._llm:
+            self._mark("llm_first_token", timestamp)
+        elif isinstance(frame, TTSStartedFrame) and src is self._tts:
+            self._mark("tts_first_sentence", timestamp)
+        elif isinstance(frame, TTSAudioRawFrame) and src is self._tts:
+            self._mark("tts_first_audio", timestamp)
+        elif isinstance(frame, BotStartedSpeakingFrame) and src is self._output:
+            if self._started_at is not None:
+                first_audio = time.monotonic() - self._started_at
+                self._started_at = None
+                self._stats.record_first_audio(self.level, self.model, first_audio)
+                logger.info(f"First bot audio {first_audio * 1000:.0f} ms after session start")
+            if self._current is not None:
+                self._mark("bot_audio_out", timestamp)
+                self._finish_turn()
+                self._transcribed_at = None
+        elif isinstance(frame, MetricsFrame):
+            self._record_ttfb(frame)
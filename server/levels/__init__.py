@@ -10,41 +10,51 @@ Each level has its own module with specific configurations for:
 - Function handlers
 
 The get_level_config function is used to get the configuration for a specific level.
+A level's module is imported when the level is first requested, and its
+configuration is built once and shared by all sessions of the level.
 """
 
-from typing import Dict, Any, Optional, Callable
-
-# Import level-specific configurations
-from .level0 import Level0Config
-from .level1 import Level1Config
-from .level2 import Level2Config
-from .level3 import Level3Config
-from .level4 import Level4Config
-from .level5 import Level5Config
-
-# Map of level ID to level configuration class
-LEVEL_CONFIGS = {
-    0: Level0Config,
-    1: Level1Config,
-    2: Level2Config,
-    3: Level3Config,
-    4: Level4Config,
-    5: Level5Config,
-}
-
-def get_level_config(level_id: int):
+import importlib
+from types import MappingProxyType
+from typing import Dict
+
+from .base import BaseLevelConfig
+
+# Map of level ID to the module and class of its configuration
+LEVEL_MODULES = MappingProxyType({
+    0: ("level0", "Level0Config"),
+    1: ("level1", "Level1Config"),
+    2: ("level2", "Level2Config"),
+    3: ("level3", "Level3Config"),
+    4: ("level4", "Level4Config"),
+    5: ("level5", "Level5Config"),
+})
+
+# Configurations built so far, by level ID
+_configs: Dict[int, BaseLevelConfig] = {}
+
+def get_level_config(level_id: int) -> BaseLevelConfig:
     """Get the configuration for a specific level.
-    
+
+    The configuration is shared by every session of the level; a session's
+    context should use its session_messages() rather than its messages.
+
     Args:
         level_id: The ID of the level to get the configuration for.
-        
+
     Returns:
         The configuration for the specified level.
-        
+
     Raises:
         ValueError: If the level ID is not valid.
     """
-    if level_id not in LEVEL_CONFIGS:
-        raise ValueError(f"Invalid level ID: {level_id}. Valid levels are {list(LEVEL_CONFIGS.keys())}")
-    
-    return LEVEL_CONFIGS[level_id]()
+    config = _configs.get(level_id)
+    if config is not None:
+        return config
+    if level_id not in LEVEL_MODULES:
+        raise ValueError(f"Invalid level ID: {level_id}. Valid levels are {list(LEVEL_MODULES.keys())}")
+
+    module_name, class_name = LEVEL_MODULES[level_id]
+    module = importlib.import_module(f".{module_name}", __name__)
+    config = _configs[level_id] = getattr(module, class_name)()
+    return config
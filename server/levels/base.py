@@ -3,17 +3,71 @@
 This module defines the base configuration class that all level-specific
 configurations inherit from. It provides default values and methods that
 can be overridden by level-specific configurations.
+
+A configuration is built once per process and shared by every session of its
+level, so its prompt, tools and function handlers are built once too (with
+cached_property) and must be treated as read-only. A session's context gets its
+own copy of the messages from session_messages(), since the context appends to
+them; the tools are never changed by a context and are shared as they are.
 """
 
+import copy
+import json
 import os
+from functools import cached_property
 from typing import Dict, Any, List, Callable, Optional, TypeVar, Union, cast
 from abc import ABC, abstractmethod
 
 import aiohttp
 from openai.types.chat import ChatCompletionToolParam, ChatCompletionMessageParam
+from pipecat.metrics.metrics import LLMTokenUsage
 from pipecat.services.cartesia import CartesiaTTSService
 from pipecat.services.openai import OpenAILLMService
 
+from .prompts import GREETING
+
+# Cartesia TTS websocket. OpenAI's base URL is read by its client from
+# OPENAI_BASE_URL.
+CARTESIA_WS_URL = os.getenv("CARTESIA_WS_URL", "wss://api.cartesia.ai/tts/websocket")
+
+# Default most tokens of a session's LLM context, see context_budget.py
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+
+# Whether the bot opens with the levels' fixed greeting rather than asking the
+# LLM for one
+FIXED_GREETING = os.getenv("FIXED_GREETING", "true").lower() in ("1", "true", "yes")
+
+
+class PromptCacheLLMService(OpenAILLMService):
+    """OpenAI LLM service that reports cached prompt tokens in its usage metrics.
+
+    OpenAI reports the prompt tokens it read from its prompt cache in each
+    response's usage, which pipecat's OpenAI service leaves out. This passes
+    them on as the usage's cache_read_input_tokens, so they're counted per
+    level with the rest of the usage (see worker_metrics.py).
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._cached_tokens: Optional[int] = None
+
+    async def _stream_chat_completions(self, context):
+        return self._read_cached_tokens(await super()._stream_chat_completions(context))
+
+    async def _read_cached_tokens(self, chunks):
+        async for chunk in chunks:
+            if chunk.usage:
+                details = chunk.usage.prompt_tokens_details
+                self._cached_tokens = details.cached_tokens if details else None
+            yield chunk
+
+    async def start_llm_usage_metrics(self, tokens: LLMTokenUsage):
+        # Called with the usage of the chunk just read
+        if self._cached_tokens is not None:
+            tokens.cache_read_input_tokens = self._cached_tokens
+            self._cached_tokens = None
+        await super().start_llm_usage_metrics(tokens)
+
 
 class BaseLevelConfig(ABC):
     """Base configuration for a challenge level.
@@ -46,7 +100,7 @@ class BaseLevelConfig(ABC):
         """
         pass
     
-    @property
+    @cached_property
     def tools(self) -> List[ChatCompletionToolParam]:
         """The tools available to the language model for this level.
         
@@ -55,7 +109,7 @@ class BaseLevelConfig(ABC):
         """
         return []
     
-    @property
+    @cached_property
     def function_handlers(self) -> Dict[str, Callable[..., Any]]:
         """The function handlers for this level.
         
@@ -64,6 +118,46 @@ class BaseLevelConfig(ABC):
         """
         return {}
     
+    @cached_property
+    def tools_json(self) -> str:
+        """The tools serialized as canonical JSON, with sorted keys.
+        
+        Returns:
+            The JSON string, built once per configuration.
+        """
+        return json.dumps(self.tools, sort_keys=True, separators=(",", ":"))
+    
+    @property
+    def context_token_budget(self) -> int:
+        """The most tokens of messages and tools a request of this level carries.
+        
+        Older turns are compacted to stay within it (see context_budget.py).
+        
+        Returns:
+            The budget in estimated tokens.
+        """
+        return CONTEXT_TOKEN_BUDGET
+    
+    @property
+    def greeting(self) -> Optional[str]:
+        """The bot's first message, spoken without asking the LLM.
+        
+        Being the same every session, its audio comes from the audio cache
+        (see audio_cache.py), so the bot can speak as soon as the user joins.
+        
+        Returns:
+            The greeting, or None to have the LLM write one from the system prompt.
+        """
+        return GREETING if FIXED_GREETING else None
+    
+    def session_messages(self) -> List[ChatCompletionMessageParam]:
+        """Get the initial messages for a new session's context.
+        
+        Returns:
+            A deep copy of messages, which the session's context may change.
+        """
+        return copy.deepcopy(self.messages)
+    
     def get_tts_service(self) -> CartesiaTTSService:
         """Get the text-to-speech service for this level.
         
@@ -77,6 +171,7 @@ class BaseLevelConfig(ABC):
         return CartesiaTTSService(
             api_key=api_key,
             voice_id="6f84f4b8-58a2-430c-8c79-688dad597532",
+            url=CARTESIA_WS_URL,
         )
     
     def get_llm_service(self) -> OpenAILLMService:
@@ -89,7 +184,7 @@ class BaseLevelConfig(ABC):
         if api_key is None:
             raise ValueError("OPENAI_API_KEY environment variable is not set")
         
-        return OpenAILLMService(
+        return PromptCacheLLMService(
             api_key=api_key,
             model="gpt-4o",  # Default model
         )
@@ -0,0 +1,272 @@
+"""Prometheus metrics for the server and its bot workers.
+
+Each bot worker sends a snapshot of its metrics on its control channel (see
+worker_metrics.py). WorkerMetrics keeps the latest snapshot of every worker,
+and render() writes them in the Prometheus text format together with the
+worker pool's own numbers:
+
+- bot_sessions_active{level}: running sessions per level
+- bot_worker_spawn_seconds: time from spawning a worker until it is ready
+- bot_handoff_seconds: time from a request until a worker started its session
+- bot_first_audio_seconds{level,model}: time from a session starting to the
+  bot's first audio
+- bot_turn_latency_seconds{level,model,stage}: per-turn latency of each stage
+- bot_usage_total{level,service,model,kind}: LLM tokens and TTS characters
+- bot_first_word_phase_seconds{level,phase}: time spent in each phase of the
+  session timeline before the first word (see timeline.py), and in total
+- bot_first_word_slo_breaches_total{level,phase}: sessions over a phase's SLO
+- bot_response_cache_total{level,result}: response cache lookups by result
+  (hit, miss, bypass) and answers stored (store), see response_cache.py
+- bot_worker_rss_bytes{pid}, bot_worker_cpu_seconds_total{pid}
+- bot_worker_event_loop_lag_seconds{pid}: how late each worker's event loop
+  runs a task
+
+Histograms and counters of exited workers are kept, so they only go up.
+"""
+
+import math
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from latency import FIRST_BOT_AUDIO
+from stats import LatencyHistogram, LatencyWindow
+
+if TYPE_CHECKING:
+    from bot_pool import BotWorkerPool
+
+# Histogram buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histograms and counters in worker snapshots, and the labels of their entries
+HISTOGRAMS = {
+    "latency": ("level", "model", "stage"),
+    "first_word": ("level", "phase"),
+}
+COUNTERS = {
+    "usage": ("level", "service", "model", "kind"),
+    "first_word_breaches": ("level", "phase"),
+    "response_cache": ("level", "result"),
+}
+
+Key = Tuple[str, ...]
+
+
+class WorkerMetrics:
+    """The latest metrics snapshot of every bot worker."""
+
+    def __init__(self):
+        self._latest: Dict[int, Dict[str, Any]] = {}
+        # Histograms and counters of workers that have exited
+        self._retired_histograms: Dict[str, Dict[Key, LatencyHistogram]] = {
+            name: {} for name in HISTOGRAMS
+        }
+        self._retired_counters: Dict[str, Dict[Key, float]] = {name: {} for name in COUNTERS}
+
+    def update(self, pid: int, snapshot: Dict[str, Any]):
+        """Replace a worker's snapshot with a newer one."""
+        self._latest[pid] = snapshot
+
+    def retire(self, pid: int):
+        """Forget an exited worker, keeping its histograms and counters."""
+        snapshot = self._latest.pop(pid, None)
+        if snapshot is None:
+            return
+        for name, histograms in self._retired_histograms.items():
+            _add_histograms(histograms, name, snapshot)
+        for name, counters in self._retired_counters.items():
+            _add_counters(counters, name, snapshot)
+
+    def workers(self) -> Dict[int, Dict[str, Any]]:
+        return dict(self._latest)
+
+    def sessions(self) -> Dict[str, int]:
+        """Get the running sessions per level across the workers."""
+        result: Dict[str, int] = {}
+        for snapshot in self._latest.values():
+            for level, count in snapshot.get("sessions", {}).items():
+                result[level] = result.get(level, 0) + count
+        return result
+
+    def histograms(self, name: str) -> Dict[Key, LatencyHistogram]:
+        """Get a histogram merged across workers, exited ones included."""
+        result = {
+            key: LatencyHistogram.from_dict(histogram.to_dict())
+            for key, histogram in self._retired_histograms[name].items()
+        }
+        for snapshot in self._latest.values():
+            _add_histograms(result, name, snapshot)
+        return result
+
+    def counters(self, name: str) -> Dict[Key, float]:
+        """Get a counter summed across workers, exited ones included."""
+        result = dict(self._retired_counters[name])
+        for snapshot in self._latest.values():
+            _add_counters(result, name, snapshot)
+        return result
+
+
+def _add_histograms(histograms: Dict[Key, LatencyHistogram], name: str, snapshot: Dict[str, Any]):
+    for entry in snapshot.get(name, []):
+        key = tuple(str(entry[label]) for label in HISTOGRAMS[name])
+        histogram = LatencyHistogram.from_dict(entry["histogram"])
+        if key in histograms:
+            histograms[key].merge(histogram)
+        else:
+            histograms[key] = histogram
+
+
+def _add_counters(counters: Dict[Key, float], name: str, snapshot: Dict[str, Any]):
+    for entry in snapshot.get(name, []):
+        key = tuple(str(entry[label]) for label in COUNTERS[name])
+        counters[key] = counters.get(key, 0) + entry["value"]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Writer:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def family(self, name: str, kind: str, help: str):
+        self.lines.append(f"# HELP {name} {help}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, labels: Dict[str, Any], value: float):
+        self.lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def histogram(
+        self,
+        name: str,
+        labels: Dict[str, Any],
+        histogram: LatencyHistogram,
+        bounds: Sequence[float],
+    ):
+        for bound, count in zip(bounds, histogram.cumulative(bounds)):
+            self.sample(f"{name}_bucket", {**labels, "le": _number(bound)}, count)
+        self.sample(f"{name}_bucket", {**labels, "le": "+Inf"}, histogram.count)
+        self.sample(f"{name}_sum", labels, histogram.total)
+        self.sample(f"{name}_count", labels, histogram.count)
+
+    def summary(self, name: str, labels: Dict[str, Any], window: LatencyWindow):
+        for quantile in (0.5, 0.95, 0.99):
+            value: Optional[float] = window.percentile(quantile * 100)
+            self.sample(name, {**labels, "quantile": quantile}, value if value is not None else math.nan)
+        self.sample(f"{name}_sum", labels, window.total)
+        self.sample(f"{name}_count", labels, window.count)
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def _sorted(items: Iterable[Tuple[Any, Any]]) -> List[Tuple[Any, Any]]:
+    return sorted(items, key=lambda item: item[0])
+
+
+def render(pool: "BotWorkerPool") -> str:
+    """Render the pool's and its workers' metrics in the Prometheus text format.
+
+    Args:
+        pool: The bot worker pool.
+
+    Returns:
+        The metrics, to be served with CONTENT_TYPE.
+    """
+    workers = pool.worker_metrics
+    out = _Writer()
+
+    out.family("bot_pool_workers", "gauge", "Bot workers by state")
+    stats = pool.stats()
+    out.sample("bot_pool_workers", {"state": "available"}, stats["available"])
+    out.sample("bot_pool_workers", {"state": "warming"}, stats["warming"])
+    out.sample("bot_pool_workers", {"state": "draining"}, stats["draining"])
+    full = stats["workers"] - stats["available"] - stats["warming"] - stats["draining"]
+    out.sample("bot_pool_workers", {"state": "full"}, full)
+
+    out.family("bot_pool_handoffs_total", "counter", "Sessions handed to a worker, by whether it was warm")
+    out.sample("bot_pool_handoffs_total", {"warm": "true"}, pool.hits)
+    out.sample("bot_pool_handoffs_total", {"warm": "false"}, pool.misses)
+
+    out.family("bot_worker_spawn_seconds", "summary", "Seconds from spawning a bot worker until it is ready")
+    out.summary("bot_worker_spawn_seconds", {}, pool.warmup_latency)
+
+    out.family("bot_handoff_seconds", "summary", "Seconds from a bot request until its session started")
+    out.summary("bot_handoff_seconds", {}, pool.handoff_latency)
+
+    out.family("bot_sessions_active", "gauge", "Running bot sessions per level")
+    for level, count in _sorted(workers.sessions().items()):
+        out.sample("bot_sessions_active", {"level": level}, count)
+
+    latency = _sorted(workers.histograms("latency").items())
+    out.family(
+        "bot_first_audio_seconds", "histogram", "Seconds from a session starting to the bot's first audio"
+    )
+    for (level, model, stage), histogram in latency:
+        if stage == FIRST_BOT_AUDIO:
+            labels = {"level": level, "model": model}
+            out.histogram("bot_first_audio_seconds", labels, histogram, LATENCY_BUCKETS)
+
+    out.family(
+        "bot_turn_latency_seconds", "histogram", "Seconds from the user's end of speech to each stage of a turn"
+    )
+    for (level, model, stage), histogram in latency:
+        if stage != FIRST_BOT_AUDIO:
+            labels = {"level": level, "model": model, "stage": stage}
+            out.histogram("bot_turn_latency_seconds", labels, histogram, LATENCY_BUCKETS)
+
+    out.family("bot_usage_total", "counter", "LLM tokens and TTS characters used")
+    for (level, service, model, kind), value in _sorted(workers.counters("usage").items()):
+        labels = {"level": level, "service": service, "model": model, "kind": kind}
+        out.sample("bot_usage_total", labels, value)
+
+    out.family(
+        "bot_first_word_phase_seconds",
+        "histogram",
+        "Seconds spent in each phase from /connect to the bot's first audio, and in total",
+    )
+    for (level, phase), histogram in _sorted(workers.histograms("first_word").items()):
+        labels = {"level": level, "phase": phase}
+        out.histogram("bot_first_word_phase_seconds", labels, histogram, LATENCY_BUCKETS)
+
+    out.family("bot_first_word_slo_breaches_total", "counter", "Sessions over a time to first word SLO")
+    for (level, phase), value in _sorted(workers.counters("first_word_breaches").items()):
+        out.sample("bot_first_word_slo_breaches_total", {"level": level, "phase": phase}, value)
+
+    out.family("bot_response_cache_total", "counter", "Response cache lookups by result, and answers stored")
+    for (level, result), value in _sorted(workers.counters("response_cache").items()):
+        out.sample("bot_response_cache_total", {"level": level, "result": result}, value)
+
+    snapshots = _sorted(workers.workers().items())
+    out.family("bot_worker_rss_bytes", "gauge", "Resident set size of each bot worker")
+    for pid, snapshot in snapshots:
+        out.sample("bot_worker_rss_bytes", {"pid": pid}, snapshot["rss_bytes"])
+
+    out.family("bot_worker_cpu_seconds_total", "counter", "CPU time used by each bot worker")
+    for pid, snapshot in snapshots:
+        out.sample("bot_worker_cpu_seconds_total", {"pid": pid}, snapshot["cpu_seconds"])
+
+    out.family(
+        "bot_worker_event_loop_lag_seconds", "histogram", "How late each bot worker's event loop runs a task"
+    )
+    for pid, snapshot in snapshots:
+        histogram = LatencyHistogram.from_dict(snapshot["loop_lag"])
+        out.histogram("bot_worker_event_loop_lag_seconds", {"pid": pid}, histogram, LOOP_LAG_BUCKETS)
+
+    return out.text()
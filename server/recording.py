@@ -0,0 +1,238 @@
+"""Streaming conversation recordings.
+
+The bot used to keep the whole conversation in memory and build a WAV file from
+it on the event loop when the call ended, copying the audio twice on the way.
+ConversationRecorder instead appends the audio to a WAV file on disk as the
+AudioBufferProcessor hands it over in `RECORDING_BUFFER_SIZE` chunks, so memory
+stays flat however long the call is. File writes run in a worker thread, and
+the WAV header is patched once when the recording is closed.
+
+A recording is a single stereo track, user audio on the left channel and bot
+audio on the right. Instead of capturing every turn a second time, TurnIndexer
+notes where each turn starts and ends in the recording, and the index is
+traced together with the recording.
+"""
+
+import asyncio
+import os
+import tempfile
+import wave
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from loguru import logger
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    BotStoppedSpeakingFrame,
+    Frame,
+    InputAudioRawFrame,
+    StartFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+# Directory for recordings. Defaults to a temporary directory; recordings there
+# are removed once they have been handed to tracing.
+RECORDING_DIR = os.getenv("RECORDING_DIR", "")
+
+# Bytes of user audio the AudioBufferProcessor buffers before handing the
+# recording over, 5 seconds of 16-bit audio at 24 kHz
+RECORDING_BUFFER_SIZE = int(os.getenv("RECORDING_BUFFER_SIZE", str(24000 * 2 * 5)))
+
+# Channel of each speaker in a recording
+CHANNELS = {"user": 0, "bot": 1}
+
+# Seconds of audio kept before a user turn, since VAD reports speech late.
+# Same as pipecat's AudioBufferProcessor turn audio.
+USER_TURN_PREROLL = 1.0
+
+
+def recording_dir() -> str:
+    path = RECORDING_DIR or os.path.join(tempfile.gettempdir(), "recordings")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class StreamingWavWriter:
+    """Appends 16-bit PCM to a WAV file, patching the header on close.
+
+    Not thread-safe; use one thread per writer.
+    """
+
+    def __init__(self, path: str, sample_rate: int, num_channels: int):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.frames = 0
+        self._wav = wave.open(path, "wb")
+        self._wav.setsampwidth(2)
+        self._wav.setnchannels(num_channels)
+        self._wav.setframerate(sample_rate)
+
+    def write(self, audio: bytes):
+        # writeframesraw() leaves the header alone, close() patches it
+        self._wav.writeframesraw(audio)
+        self.frames += len(audio) // (2 * self.num_channels)
+
+    def close(self):
+        self._wav.close()
+
+
+@dataclass
+class Turn:
+    """A turn of one speaker, in samples from the start of the recording."""
+
+    speaker: str
+    start: int
+    end: int
+
+
+class TurnIndex:
+    """Start and end offsets of every turn in a recording."""
+
+    def __init__(self):
+        self.turns: List[Turn] = []
+        self._open: Dict[str, int] = {}
+
+    def start_turn(self, speaker: str, position: int):
+        self._open.setdefault(speaker, position)
+
+    def end_turn(self, speaker: str, position: int):
+        start = self._open.pop(speaker, None)
+        if start is not None:
+            self.turns.append(Turn(speaker, start, position))
+
+    def close(self, position: int):
+        """End the turns still open when the recording stops."""
+        for speaker in list(self._open):
+            self.end_turn(speaker, position)
+
+    def to_list(self) -> List[Dict[str, int]]:
+        return [{"speaker": t.speaker, "start": t.start, "end": t.end} for t in self.turns]
+
+
+class TurnIndexer(FrameProcessor):
+    """Records turn boundaries as sample offsets into the conversation recording.
+
+    Place it next to the AudioBufferProcessor and start it together with the
+    recording. The recording's timeline follows the user's continuous input
+    audio, so the position is the number of input samples seen so far,
+    converted to the recording's sample rate.
+    """
+
+    def __init__(self, *, sample_rate: Optional[int] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.index = TurnIndex()
+        self._init_sample_rate = sample_rate
+        self._sample_rate = 0
+        self._position = 0.0
+        self._recording = False
+
+    @property
+    def position(self) -> int:
+        return int(self._position)
+
+    def start_recording(self):
+        self.index = TurnIndex()
+        self._position = 0.0
+        self._recording = True
+
+    def stop_recording(self) -> TurnIndex:
+        self.index.close(self.position)
+        self._recording = False
+        return self.index
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, StartFrame):
+            self._sample_rate = self._init_sample_rate or frame.audio_out_sample_rate
+
+        if self._recording:
+            if isinstance(frame, InputAudioRawFrame):
+                self._position += frame.num_frames * self._sample_rate / frame.sample_rate
+            elif isinstance(frame, UserStartedSpeakingFrame):
+                preroll = int(USER_TURN_PREROLL * self._sample_rate)
+                self.index.start_turn("user", max(0, self.position - preroll))
+            elif isinstance(frame, UserStoppedSpeakingFrame):
+                self.index.end_turn("user", self.position)
+            elif isinstance(frame, BotStartedSpeakingFrame):
+                self.index.start_turn("bot", self.position)
+            elif isinstance(frame, BotStoppedSpeakingFrame):
+                self.index.end_turn("bot", self.position)
+
+        await self.push_frame(frame, direction)
+
+
+class ConversationRecorder:
+    """Records one session's audio to disk without blocking the event loop.
+
+    The file is created on the first chunk, once the sample rate and channel
+    count are known.
+    """
+
+    def __init__(self, session_id: str, directory: Optional[str] = None):
+        self.session_id = session_id
+        self._directory = directory or recording_dir()
+        self._writer: Optional[StreamingWavWriter] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def path(self) -> Optional[str]:
+        return self._writer.path if self._writer else None
+
+    @property
+    def sample_rate(self) -> int:
+        return self._writer.sample_rate if self._writer else 0
+
+    @property
+    def num_channels(self) -> int:
+        return self._writer.num_channels if self._writer else 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._directory, f"{self.session_id}-{name}.wav")
+
+    async def write(self, audio: bytes, sample_rate: int, num_channels: int):
+        """Append a chunk of audio to the recording.
+
+        Args:
+            audio: 16-bit PCM audio, interleaved if there is more than one channel.
+            sample_rate: The sample rate of the audio.
+            num_channels: The number of channels.
+        """
+        if not audio:
+            return
+        # Chunks are written in the order they arrive
+        async with self._lock:
+            if self._writer is None:
+                self._writer = await asyncio.to_thread(
+                    StreamingWavWriter, self._path("full"), sample_rate, num_channels
+                )
+            await asyncio.to_thread(self._writer.write, audio)
+
+    async def close(self) -> Optional[str]:
+        """Finish the recording.
+
+        Returns:
+            The path of the recording, or None if no audio was recorded.
+        """
+        async with self._lock:
+            if self._writer is None:
+                return None
+            await asyncio.to_thread(self._writer.close)
+            logger.debug(
+                f"Recorded {self._writer.frames / self._writer.sample_rate:.1f}s "
+                f"of audio to {self._writer.path}"
+            )
+            return self._writer.path
+
+
+def discard(path: str):
+    """Remove a recording once it has been traced, unless RECORDING_DIR is set."""
+    if RECORDING_DIR:
+        return
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Failed to remove recording {path}: {e}")
@@ -0,0 +1,743 @@
+"""Session record and replay, for offline performance regression tests.
+
+With REPLAY_RECORD_DIR set, the bot records every session with a
+SessionRecorder. It taps the pipeline in three places:
+
+- after the input transport: the user's audio and Daily's transcriptions
+- after the LLM: each response's streamed text, tool calls and token usage,
+  timed from the start of the response
+- after the TTS: each response's audio chunks and words, timed from the start
+  of the TTS request
+
+together with when the user joined and left. A recording is a gzipped JSON
+lines file. Consecutive input audio frames are stored as one segment of up to
+SEGMENT_SECS; writes run in a worker thread.
+
+A replay runs the bot's pipeline against a recording (see
+benchmarks/replay.py). ReplayTransport plays the user's side, and
+ReplayLevelConfig swaps the level's services for ReplayLLMService and
+ReplayTTSService. Those keep the real OpenAI and Cartesia client code and stub
+only the network: the n-th request gets the n-th recorded response, streamed at
+the recorded timing, or `speed` times faster. VAD, context aggregation,
+sentence splitting, resampling, observers and our own processors all run for
+real, so a replay's latency and CPU time move with pipecat upgrades, level
+prompt changes and our own code, and not with the APIs.
+"""
+
+import asyncio
+import base64
+import gzip
+import heapq
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+from openai.types.chat import ChatCompletionChunk
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    Frame,
+    FunctionCallInProgressFrame,
+    InputAudioRawFrame,
+    InterimTranscriptionFrame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    LLMTextFrame,
+    MetricsFrame,
+    StartFrame,
+    StartInterruptionFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+    TTSTextFrame,
+)
+from pipecat.metrics.metrics import LLMUsageMetricsData
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.services.cartesia import CartesiaTTSService
+from pipecat.services.openai import OpenAILLMService
+from pipecat.transports.base_input import BaseInputTransport
+from pipecat.transports.base_output import BaseOutputTransport
+from pipecat.transports.base_transport import BaseTransport, TransportParams
+from pipecat.utils.time import time_now_iso8601
+from websockets.protocol import State
+
+from levels.base import BaseLevelConfig, PromptCacheLLMService
+
+# Directory to record sessions to for replay. Sessions aren't recorded if unset.
+REPLAY_RECORD_DIR = os.getenv("REPLAY_RECORD_DIR", "")
+
+FORMAT_VERSION = 1
+
+EXTENSION = ".replay.jsonl.gz"
+
+# Longest run of input audio frames stored as one segment, in seconds
+SEGMENT_SECS = 1.0
+
+# Input audio arriving this much later than the segment's pace starts a new one
+SEGMENT_GAP_SECS = 0.1
+
+# Bytes of records buffered before they are written out
+FLUSH_BYTES = 256 * 1024
+
+# Seconds a replay goes on after the last recorded input if the user never left
+END_GRACE_SECS = 5.0
+
+USER_ID = "replay-user"
+
+
+class _RecorderTap(FrameProcessor):
+    """Hands the frames going downstream past it to a SessionRecorder."""
+
+    def __init__(self, on_frame: Callable[[Frame], None], **kwargs):
+        super().__init__(**kwargs)
+        self._on_frame = on_frame
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if direction == FrameDirection.DOWNSTREAM:
+            self._on_frame(frame)
+        await self.push_frame(frame, direction)
+
+
+class SessionRecorder:
+    """Records a session for replay.
+
+    Place input() after the input transport, llm() after the LLM and tts()
+    after the TTS, and close() the recorder when the pipeline has ended.
+
+    Args:
+        session_id: The session ID, which names the recording.
+        level: The level the session plays.
+        transport: The session's transport, to record when the user joins and leaves.
+        directory: Directory to record to. Defaults to REPLAY_RECORD_DIR.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        level: int,
+        transport: Optional[BaseTransport] = None,
+        directory: Optional[str] = None,
+    ):
+        directory = directory or REPLAY_RECORD_DIR
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{session_id}{EXTENSION}")
+        self._started: Optional[float] = None
+        self._lines: List[str] = []
+        self._buffered = 0
+        self._file = None
+        self._lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._segment: Optional[Dict[str, Any]] = None
+        self._segment_audio = bytearray()
+        self._llm: Optional[Dict[str, Any]] = None
+        self._tts: Optional[Dict[str, Any]] = None
+        self._input = _RecorderTap(self._on_input)
+        self._llm_tap = _RecorderTap(self._on_llm)
+        self._tts_tap = _RecorderTap(self._on_tts)
+
+        self._write(
+            {
+                "type": "session",
+                "version": FORMAT_VERSION,
+                "session_id": session_id,
+                "level": level,
+                "recorded_at": time.time(),
+            }
+        )
+        if transport:
+            transport.add_event_handler("on_first_participant_joined", self._event("participant_joined"))
+            transport.add_event_handler("on_participant_left", self._event("participant_left"))
+
+    def input(self) -> FrameProcessor:
+        return self._input
+
+    def llm(self) -> FrameProcessor:
+        return self._llm_tap
+
+    def tts(self) -> FrameProcessor:
+        return self._tts_tap
+
+    def _now(self) -> float:
+        now = time.monotonic()
+        if self._started is None:
+            self._started = now
+        return now - self._started
+
+    def _event(self, name: str):
+        async def handler(transport, *args):
+            self._write({"type": "event", "t": self._now(), "name": name})
+
+        return handler
+
+    def _on_input(self, frame: Frame):
+        if isinstance(frame, StartFrame):
+            self._now()
+        elif isinstance(frame, InputAudioRawFrame):
+            self._add_input_audio(frame)
+        elif isinstance(frame, (TranscriptionFrame, InterimTranscriptionFrame)):
+            self._write(
+                {
+                    "type": "transcription",
+                    "t": self._now(),
+                    "text": frame.text,
+                    "user_id": frame.user_id,
+                    "interim": isinstance(frame, InterimTranscriptionFrame),
+                }
+            )
+
+    def _add_input_audio(self, frame: InputAudioRawFrame):
+        now = self._now()
+        secs = frame.num_frames / frame.sample_rate
+        segment = self._segment
+        if segment is not None:
+            due = segment["t"] + segment["frames"] * secs
+            if (
+                (segment["sample_rate"], segment["num_channels"], segment["frame_bytes"])
+                != (frame.sample_rate, frame.num_channels, len(frame.audio))
+                or now - due > SEGMENT_GAP_SECS
+                or segment["frames"] * secs >= SEGMENT_SECS
+            ):
+                self._finish_segment()
+                segment = None
+        if segment is None:
+            segment = self._segment = {
+                "type": "input_audio",
+                "t": now,
+                "sample_rate": frame.sample_rate,
+                "num_channels": frame.num_channels,
+                "frame_bytes": len(frame.audio),
+                "frames": 0,
+            }
+        segment["frames"] += 1
+        self._segment_audio.extend(frame.audio)
+
+    def _finish_segment(self):
+        if self._segment is None:
+            return
+        self._segment["audio"] = base64.b64encode(self._segment_audio).decode()
+        self._write(self._segment)
+        self._segment = None
+        self._segment_audio = bytearray()
+
+    def _on_llm(self, frame: Frame):
+        if isinstance(frame, LLMFullResponseStartFrame):
+            self._finish_llm()
+            self._llm = {"type": "llm", "t": self._now(), "chunks": [], "tool_calls": [], "usage": None}
+            return
+        response = self._llm
+        if response is None:
+            return
+        offset = self._now() - response["t"]
+        if isinstance(frame, LLMTextFrame):
+            response["chunks"].append([offset, frame.text])
+        elif isinstance(frame, FunctionCallInProgressFrame):
+            # Function calls start after the response has ended
+            response["tool_calls"].append(
+                {"id": frame.tool_call_id, "name": frame.function_name, "arguments": json.dumps(frame.arguments)}
+            )
+        elif isinstance(frame, MetricsFrame):
+            for data in frame.data:
+                if isinstance(data, LLMUsageMetricsData):
+                    response["usage"] = {
+                        "prompt_tokens": data.value.prompt_tokens,
+                        "completion_tokens": data.value.completion_tokens,
+                        "cached_tokens": data.value.cache_read_input_tokens,
+                    }
+        elif isinstance(frame, LLMFullResponseEndFrame):
+            response["end"] = offset
+
+    def _finish_llm(self):
+        if self._llm is not None:
+            self._write(self._llm)
+            self._llm = None
+
+    def _on_tts(self, frame: Frame):
+        if isinstance(frame, TTSStartedFrame):
+            self._finish_tts()
+            self._tts = {"type": "tts", "t": self._now(), "chunks": [], "words": []}
+            return
+        stream = self._tts
+        if stream is None:
+            return
+        offset = self._now() - stream["t"]
+        if isinstance(frame, TTSAudioRawFrame):
+            stream["sample_rate"] = frame.sample_rate
+            stream["chunks"].append([offset, base64.b64encode(frame.audio).decode()])
+        elif isinstance(frame, TTSTextFrame):
+            stream["words"].append([offset, frame.text])
+        elif isinstance(frame, TTSStoppedFrame):
+            stream["end"] = offset
+            self._finish_tts()
+        elif isinstance(frame, StartInterruptionFrame):
+            stream["end"] = offset
+            stream["interrupted"] = True
+            self._finish_tts()
+
+    def _finish_tts(self):
+        if self._tts is not None:
+            self._write(self._tts)
+            self._tts = None
+
+    def _write(self, record: Dict[str, Any]):
+        line = json.dumps(record, separators=(",", ":"))
+        self._lines.append(line)
+        self._buffered += len(line)
+        if self._buffered >= FLUSH_BYTES and not self._flush_task:
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        async with self._lock:
+            lines, self._lines, self._buffered = self._lines, [], 0
+            if lines:
+                await asyncio.to_thread(self._write_lines, lines)
+        self._flush_task = None
+
+    def _write_lines(self, lines: List[str]):
+        if self._file is None:
+            self._file = gzip.open(self.path, "wt", encoding="utf-8")
+        self._file.write("\n".join(lines) + "\n")
+
+    async def close(self) -> str:
+        """Write out what is left of the recording.
+
+        Returns:
+            The path of the recording.
+        """
+        self._finish_segment()
+        self._finish_llm()
+        self._finish_tts()
+        if self._flush_task:
+            await self._flush_task
+        await self._flush()
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+        logger.debug(f"Recorded session for replay to {self.path}")
+        return self.path
+
+
+@dataclass
+class SessionRecording:
+    """A recorded session, ready to replay."""
+
+    session_id: str
+    level: int
+    # Input audio segments, transcriptions and transport events, by time
+    input: List[Dict[str, Any]]
+    llm: List[Dict[str, Any]]
+    tts: List[Dict[str, Any]]
+
+    @classmethod
+    def load(cls, path: str) -> "SessionRecording":
+        """Load a recording.
+
+        Raises:
+            ValueError: If the file isn't a recording of a version this code reads
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        if not records or records[0].get("type") != "session":
+            raise ValueError(f"{path} isn't a session recording")
+        header = records[0]
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError(f"{path} has version {header['version']}, expected {FORMAT_VERSION}")
+        by_type: Dict[str, List[Dict[str, Any]]] = {"llm": [], "tts": [], "input": []}
+        for record in records[1:]:
+            by_type.get(record["type"], by_type["input"]).append(record)
+        return cls(
+            session_id=header["session_id"],
+            level=header["level"],
+            input=sorted(by_type["input"], key=lambda record: record["t"]),
+            llm=sorted(by_type["llm"], key=lambda record: record["t"]),
+            tts=sorted(by_type["tts"], key=lambda record: record["t"]),
+        )
+
+    @property
+    def duration(self) -> float:
+        """Seconds from the start of the recording to its last input."""
+        end = 0.0
+        for record in self.input:
+            if record["type"] == "input_audio":
+                secs = record["frame_bytes"] // (2 * record["num_channels"]) / record["sample_rate"]
+                end = max(end, record["t"] + record["frames"] * secs)
+            else:
+                end = max(end, record["t"])
+        return end
+
+    def event_time(self, name: str) -> Optional[float]:
+        for record in self.input:
+            if record["type"] == "event" and record["name"] == name:
+                return record["t"]
+        return None
+
+
+async def _sleep_until(started: float, offset: float, speed: float):
+    await asyncio.sleep(max(0.0, started + offset / speed - time.monotonic()))
+
+
+class ReplayLLMService(PromptCacheLLMService):
+    """OpenAI LLM service streaming recorded responses instead of calling the API.
+
+    Args:
+        responses: The recorded responses, in the order they are requested.
+        speed: How much faster than recorded to stream them.
+    """
+
+    def __init__(self, responses: List[Dict[str, Any]], *, speed: float = 1.0, **kwargs):
+        super().__init__(api_key="replay", **kwargs)
+        self._responses = iter(responses)
+        self._speed = speed
+
+    async def get_chat_completions(self, context, messages):
+        response = next(self._responses, None)
+        if response is None:
+            logger.warning(f"{self}: the recording has no more LLM responses, replying with nothing")
+            response = {"chunks": [], "tool_calls": [], "usage": None}
+        return self._stream(response)
+
+    def _chunk(self, completion_id: str, **fields) -> ChatCompletionChunk:
+        return ChatCompletionChunk.model_validate(
+            {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": self.model_name,
+                **fields,
+            }
+        )
+
+    async def _stream(self, response: Dict[str, Any]):
+        started = time.monotonic()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        for offset, text in response["chunks"]:
+            await _sleep_until(started, offset, self._speed)
+            choice = {"index": 0, "delta": {"content": text}, "finish_reason": None}
+            yield self._chunk(completion_id, choices=[choice])
+
+        end = response.get("end")
+        if end is not None:
+            await _sleep_until(started, end, self._speed)
+        for index, call in enumerate(response["tool_calls"]):
+            tool_call = {
+                "index": index,
+                "id": call["id"],
+                "type": "function",
+                "function": {"name": call["name"], "arguments": call["arguments"]},
+            }
+            choice = {"index": 0, "delta": {"tool_calls": [tool_call]}, "finish_reason": None}
+            yield self._chunk(completion_id, choices=[choice])
+
+        if response["usage"]:
+            prompt, completion = response["usage"]["prompt_tokens"], response["usage"]["completion_tokens"]
+            usage = {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+            if response["usage"].get("cached_tokens") is not None:
+                usage["prompt_tokens_details"] = {"cached_tokens": response["usage"]["cached_tokens"]}
+            yield self._chunk(completion_id, choices=[], usage=usage)
+
+
+class _RecordedTTSSocket:
+    """Stands in for Cartesia's websocket, answering each context with a recorded stream."""
+
+    def __init__(self, streams: Iterator[Dict[str, Any]], speed: float):
+        self._streams = streams
+        self._speed = speed
+        self._messages: asyncio.Queue = asyncio.Queue()
+        self._contexts = set()
+        self._playing: Dict[str, asyncio.Task] = {}
+        self.state = State.OPEN
+
+    @property
+    def open(self) -> bool:
+        return self.state == State.OPEN
+
+    @property
+    def closed(self) -> bool:
+        return self.state == State.CLOSED
+
+    async def send(self, raw: str):
+        message = json.loads(raw)
+        context_id = message["context_id"]
+        if message.get("cancel"):
+            task = self._playing.pop(context_id, None)
+            if task:
+                task.cancel()
+        elif context_id not in self._contexts:
+            # The rest of the context's text is already in the recorded stream
+            self._contexts.add(context_id)
+            stream = next(self._streams, None)
+            if stream is None:
+                logger.warning("The recording has no more TTS audio, replying with silence")
+                stream = {"chunks": [], "words": []}
+            self._playing[context_id] = asyncio.create_task(self._play(context_id, stream))
+
+    async def _play(self, context_id: str, stream: Dict[str, Any]):
+        started = time.monotonic()
+        chunks = stream["chunks"]
+        if chunks and stream["words"]:
+            # Word timestamps count from the start of the context's audio
+            first_audio = chunks[0][0]
+            words = [word for _, word in stream["words"]]
+            starts = [max(0.0, offset - first_audio) for offset, _ in stream["words"]]
+            await _sleep_until(started, first_audio, self._speed)
+            self._put("timestamps", context_id, word_timestamps={"words": words, "start": starts})
+        for offset, audio in chunks:
+            await _sleep_until(started, offset, self._speed)
+            self._put("chunk", context_id, data=audio)
+        end = stream.get("end")
+        if end is not None:
+            await _sleep_until(started, end, self._speed)
+        self._put("done", context_id)
+        self._playing.pop(context_id, None)
+
+    def _put(self, kind: str, context_id: str, **fields):
+        self._messages.put_nowait(json.dumps({"type": kind, "context_id": context_id, **fields}))
+
+    async def ping(self):
+        pass
+
+    async def close(self):
+        for task in self._playing.values():
+            task.cancel()
+        self._playing.clear()
+        self.state = State.CLOSED
+        self._messages.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        message = await self._messages.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+
+class ReplayTTSService(CartesiaTTSService):
+    """Cartesia TTS service playing recorded audio instead of calling the API.
+
+    Args:
+        streams: The recorded audio streams, in the order they are requested.
+        speed: How much faster than recorded to send them.
+    """
+
+    def __init__(self, streams: List[Dict[str, Any]], *, speed: float = 1.0, **kwargs):
+        super().__init__(api_key="replay", **kwargs)
+        self._streams = iter(streams)
+        self._speed = speed
+
+    async def _connect_websocket(self):
+        if self._websocket and self._websocket.open:
+            return
+        self._websocket = _RecordedTTSSocket(self._streams, self._speed)
+
+
+class ReplayLevelConfig(BaseLevelConfig):
+    """A level configuration whose LLM and TTS services play a recording.
+
+    Args:
+        config: The recorded level's configuration.
+        recording: The recording to play.
+        speed: How much faster than recorded to play it.
+    """
+
+    def __init__(self, config: BaseLevelConfig, recording: SessionRecording, speed: float = 1.0):
+        self._config = config
+        self._recording = recording
+        self._speed = speed
+
+    @property
+    def level_id(self) -> int:
+        return self._config.level_id
+
+    @property
+    def weave_project(self) -> str:
+        return self._config.weave_project
+
+    @property
+    def messages(self):
+        return self._config.messages
+
+    @property
+    def tools(self):
+        return self._config.tools
+
+    @property
+    def function_handlers(self):
+        return self._config.function_handlers
+
+    @property
+    def context_token_budget(self) -> int:
+        return self._config.context_token_budget
+
+    @property
+    def greeting(self):
+        return self._config.greeting
+
+    def get_llm_service(self) -> OpenAILLMService:
+        llm = self._config.get_llm_service()
+        return ReplayLLMService(self._recording.llm, speed=self._speed, model=llm.model_name)
+
+    def get_tts_service(self) -> CartesiaTTSService:
+        tts = self._config.get_tts_service()
+        return ReplayTTSService(
+            self._recording.tts, speed=self._speed, voice_id=tts._voice_id, model=tts.model_name
+        )
+
+
+class ReplayInputTransport(BaseInputTransport):
+    """Plays the user's side of a recording: audio, transcriptions, joining and leaving."""
+
+    def __init__(
+        self,
+        transport: "ReplayTransport",
+        params: TransportParams,
+        recording: SessionRecording,
+        speed: float,
+        **kwargs,
+    ):
+        super().__init__(params, **kwargs)
+        self._transport = transport
+        self._recording = recording
+        self._speed = speed
+        self._play_task: Optional[asyncio.Task] = None
+
+    async def start(self, frame: StartFrame):
+        await super().start(frame)
+        if not self._play_task:
+            self._play_task = self.create_task(self._play())
+
+    async def _cancel_play(self):
+        if self._play_task:
+            await self.cancel_task(self._play_task)
+            self._play_task = None
+
+    async def stop(self, frame: EndFrame):
+        await self._cancel_play()
+        await super().stop(frame)
+
+    async def cancel(self, frame: CancelFrame):
+        await self._cancel_play()
+        await super().cancel(frame)
+
+    def _audio_frames(self) -> Iterator[Tuple[float, int, Frame]]:
+        for record in self._recording.input:
+            if record["type"] != "input_audio":
+                continue
+            audio = base64.b64decode(record["audio"])
+            size = record["frame_bytes"]
+            secs = size // (2 * record["num_channels"]) / record["sample_rate"]
+            for index in range(record["frames"]):
+                frame = InputAudioRawFrame(
+                    audio=audio[index * size : (index + 1) * size],
+                    sample_rate=record["sample_rate"],
+                    num_channels=record["num_channels"],
+                )
+                yield record["t"] + index * secs, 0, frame
+
+    def _events(self) -> Iterator[Tuple[float, int, Any]]:
+        for record in self._recording.input:
+            if record["type"] != "input_audio":
+                yield record["t"], 1, record
+
+    async def _play(self):
+        await self._transport.joined()
+        started = time.monotonic()
+        for t, _, item in heapq.merge(self._audio_frames(), self._events(), key=lambda item: item[:2]):
+            await _sleep_until(started, t, self._speed)
+            if isinstance(item, InputAudioRawFrame):
+                await self.push_audio_frame(item)
+            elif item["type"] == "transcription":
+                frame_class = InterimTranscriptionFrame if item["interim"] else TranscriptionFrame
+                await self.push_frame(frame_class(item["text"], item["user_id"], time_now_iso8601()))
+            elif item["name"] == "participant_joined":
+                await self._transport.participant_joined()
+            elif item["name"] == "participant_left":
+                await self._transport.leave()
+                return
+        await asyncio.sleep(END_GRACE_SECS / self._speed)
+        await self._transport.leave()
+
+
+class ReplayOutputTransport(BaseOutputTransport):
+    """Discards the bot's audio at the pace it would play out, sped up with the replay."""
+
+    def __init__(self, params: TransportParams, speed: float, **kwargs):
+        super().__init__(params, **kwargs)
+        self._speed = speed
+        self._deadline = 0.0
+
+    async def write_raw_audio_frames(self, frames: bytes, destination: Optional[str] = None):
+        secs = len(frames) / (self.sample_rate * self._params.audio_out_channels * 2) / self._speed
+        now = time.monotonic()
+        self._deadline = max(self._deadline, now) + secs
+        await asyncio.sleep(self._deadline - now)
+
+
+class ReplayTransport(BaseTransport):
+    """A room replaying a recorded user.
+
+    Emits the "on_joined", "on_first_participant_joined" and
+    "on_participant_left" events the bot listens to on DailyTransport, at the
+    recorded times, and accepts capture_participant_transcription().
+
+    Args:
+        params: The transport parameters the bot asked for.
+        recording: The recording to play.
+        speed: How much faster than recorded to play it.
+    """
+
+    def __init__(self, params: TransportParams, recording: SessionRecording, speed: float = 1.0):
+        super().__init__()
+        # Daily receives the user's audio whenever VAD is on
+        self._params = params.model_copy(update={"audio_in_enabled": True})
+        self._recording = recording
+        self._speed = speed
+        self._input: Optional[ReplayInputTransport] = None
+        self._output: Optional[ReplayOutputTransport] = None
+        self._joined = False
+        self._participant_joined = False
+        self._left = False
+
+        self._register_event_handler("on_joined")
+        self._register_event_handler("on_first_participant_joined")
+        self._register_event_handler("on_participant_left")
+
+    def input(self) -> FrameProcessor:
+        if not self._input:
+            self._input = ReplayInputTransport(self, self._params, self._recording, self._speed)
+        return self._input
+
+    def output(self) -> FrameProcessor:
+        if not self._output:
+            self._output = ReplayOutputTransport(self._params, self._speed)
+        return self._output
+
+    async def joined(self):
+        """Join the bot, once the pipeline has started."""
+        if self._joined:
+            return
+        self._joined = True
+        await self._call_event_handler("on_joined", {"participants": {"local": {"id": "bot"}}})
+        if self._recording.event_time("participant_joined") is None:
+            await self.participant_joined()
+
+    async def participant_joined(self):
+        if self._participant_joined:
+            return
+        self._participant_joined = True
+        await self._call_event_handler("on_first_participant_joined", {"id": USER_ID})
+
+    async def leave(self):
+        """Make the user leave the room."""
+        if self._left:
+            return
+        self._left = True
+        await self._call_event_handler("on_participant_left", {"id": USER_ID}, "leftCall")
+
+    async def capture_participant_transcription(self, participant_id: str):
+        pass
@@ -0,0 +1,390 @@
+"""Per-level cache of the bot's answers to frequently asked Weave questions.
+
+Most users ask the same few questions about Weave, and every one costs an
+LLM round trip before the bot can speak. ResponseCache keeps the answers to
+such questions per level, in each worker process. A question matches a cached
+one when its normalized text is the same, or when the MinHash estimate of the
+Jaccard similarity of their character shingles is at least
+RESPONSE_CACHE_SIMILARITY. A hit is served straight to the TTS, and the LLM
+is not called for the turn.
+
+Only plain knowledge questions are looked up and stored: starting with a
+question word, short, about Weave (sharing a term with the knowledge index of
+knowledge.py), and without any of the words of the level's tools, the
+challenge or instructions, such as transfer, password or answer.
+A session stops using the cache for good once the user says anything that
+isn't such a question, or the LLM calls a tool, so the challenge itself always
+goes to the LLM, and no instruction from one user shapes an answer served to
+another. Only the answer to a session's first question is stored, so it comes
+from the system prompt alone, and only when the LLM answered in full without
+calling a tool.
+
+Entries are evicted least recently used first, beyond RESPONSE_CACHE_SIZE, and
+after RESPONSE_CACHE_TTL seconds. Lookups are counted per level and result
+(hit, miss, bypass) along with stores, and reported in /metrics.
+"""
+
+import os
+import re
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+import numpy as np
+from loguru import logger
+from pipecat.frames.frames import (
+    Frame,
+    FunctionCallInProgressFrame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    LLMTextFrame,
+    StartInterruptionFrame,
+)
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContextFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from knowledge import knowledge_index, terms
+
+# Most answers cached per level, 0 disables the cache
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+
+# Seconds an answer stays cached
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+# Lowest estimated similarity of a question to a cached one to serve its answer
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.85"))
+
+# Most words in a question that is looked up or stored
+RESPONSE_CACHE_MAX_WORDS = int(os.getenv("RESPONSE_CACHE_MAX_WORDS", "20"))
+
+# Characters per shingle
+SHINGLE_SIZE = 3
+
+# MinHash permutations, split into LSH bands of rows to find candidates
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+
+_PRIME = np.uint64((1 << 31) - 1)
+_random = np.random.default_rng(20250501)
+_A = _random.integers(1, int(_PRIME), size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _random.integers(0, int(_PRIME), size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+# Words of the challenge, on top of those of a level's tools, that send a
+# session around the cache
+SENSITIVE_TERMS = frozenset(
+    terms(
+        """transfer bank password passcode passphrase otp account money dollars payment
+        authorize authorization verify verification identity identify ceo secret admin
+        ignore instructions prompt pretend roleplay rules system developer jailbreak
+        answer respond reply act speak talk style tone voice persona character insult"""
+    )
+)
+
+# Words a cacheable question starts with, after any filler
+QUESTION_WORDS = frozenset(
+    "what what's whats how which does do is are can could should where why who when will would".split()
+)
+
+# Words said before a question that don't change it
+FILLER = frozenset("um uh er hmm oh ok okay so well hey hi hello bee please".split())
+
+NEGATIONS = frozenset("not no never nothing none cannot".split())
+
+_PUNCTUATION = re.compile(r"[^\w\s']+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase a transcription, drop punctuation and leading filler words."""
+    words = _PUNCTUATION.sub(" ", text.lower().replace("’", "'")).split()
+    while words and words[0] in FILLER:
+        words.pop(0)
+    return " ".join(words)
+
+
+def _negated(question: str) -> bool:
+    return any(word in NEGATIONS or word.endswith("n't") for word in question.split())
+
+
+def signature(question: str) -> np.ndarray:
+    """Get the MinHash signature of a question's character shingles."""
+    padded = f" {question} "
+    shingles = {padded[i:i + SHINGLE_SIZE] for i in range(max(1, len(padded) - SHINGLE_SIZE + 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.uint64)
+    return ((hashes[:, None] * _A + _B) % _PRIME).min(axis=0)
+
+
+def _bands(signature: np.ndarray) -> List[Tuple[int, bytes]]:
+    return [(band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()) for band in range(LSH_BANDS)]
+
+
+@dataclass
+class _Entry:
+    answer: str
+    signature: np.ndarray
+    expires_at: float
+
+
+class ResponseCache:
+    """One level's cached answers, least recently used first.
+
+    Args:
+        size: The most answers kept.
+        ttl: Seconds an answer is kept.
+        similarity: The lowest estimated similarity of a matching question.
+    """
+
+    def __init__(
+        self,
+        size: int = RESPONSE_CACHE_SIZE,
+        ttl: float = RESPONSE_CACHE_TTL,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+    ):
+        self.size = size
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # LSH buckets: questions by band of their signature
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, question: str) -> Optional[str]:
+        """Get the answer to a normalized question, or to one close enough.
+
+        Args:
+            question: The normalized question.
+
+        Returns:
+            The cached answer, or None.
+        """
+        self._expire()
+        entry = self._entries.get(question)
+        if entry is None:
+            key = self._similar(question)
+            if key is None:
+                return None
+            question, entry = key, self._entries[key]
+        self._entries.move_to_end(question)
+        return entry.answer
+
+    def put(self, question: str, answer: str):
+        """Cache the answer to a normalized question."""
+        if self.size <= 0:
+            return
+        if question in self._entries:
+            self._remove(question)
+        entry = _Entry(answer, signature(question), time.monotonic() + self.ttl)
+        self._entries[question] = entry
+        for band in _bands(entry.signature):
+            self._buckets.setdefault(band, set()).add(question)
+        while len(self._entries) > self.size:
+            self._remove(next(iter(self._entries)))
+
+    def _similar(self, question: str) -> Optional[str]:
+        query = signature(question)
+        negated = _negated(question)
+        candidates = set()
+        for band in _bands(query):
+            candidates.update(self._buckets.get(band, ()))
+        best, best_similarity = None, self.similarity
+        for candidate in candidates:
+            if _negated(candidate) != negated:
+                continue
+            similarity = float(np.mean(self._entries[candidate].signature == query))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [question for question, entry in self._entries.items() if entry.expires_at <= now]
+        for question in expired:
+            self._remove(question)
+
+    def _remove(self, question: str):
+        entry = self._entries.pop(question)
+        for band in _bands(entry.signature):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(question)
+                if not bucket:
+                    del self._buckets[band]
+
+
+class ResponseCaches:
+    """The response caches of all levels in this process, and their counters."""
+
+    def __init__(self):
+        self._caches: Dict[int, ResponseCache] = {}
+        self._counters: Dict[Tuple[int, str], int] = {}
+
+    def level(self, level: int) -> ResponseCache:
+        cache = self._caches.get(level)
+        if cache is None:
+            cache = self._caches[level] = ResponseCache()
+        return cache
+
+    def count(self, level: int, result: str):
+        key = (level, result)
+        self._counters[key] = self._counters.get(key, 0) + 1
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Get the counters as JSON, for reporting to the server."""
+        return [
+            {"level": level, "result": result, "value": value}
+            for (level, result), value in sorted(self._counters.items())
+        ]
+
+
+response_caches = ResponseCaches()
+
+
+def tool_terms(tools: Any) -> FrozenSet[str]:
+    """Get the words of a level's tools: their names, descriptions and parameters."""
+    words = []
+    for tool in tools or []:
+        function = tool.get("function", {})
+        words.append(function.get("name", "").replace("_", " "))
+        words.append(function.get("description", ""))
+        for name, parameter in function.get("parameters", {}).get("properties", {}).items():
+            words.append(name.replace("_", " "))
+            words.append(parameter.get("description", ""))
+    return frozenset(terms(" ".join(words)))
+
+
+def _text(message: Any) -> str:
+    content = message.get("content")
+    return content if isinstance(content, str) else ""
+
+
+class _CacheTap(FrameProcessor):
+    def __init__(self, session: "SessionResponseCache", handler, **kwargs):
+        super().__init__(**kwargs)
+        self._session = session
+        self._handler = handler
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if not await self._handler(self, frame, direction):
+            await self.push_frame(frame, direction)
+
+
+class SessionResponseCache:
+    """A session's use of its level's response cache.
+
+    lookup() goes between the user context aggregator and the LLM, and
+    answers the user from the cache when it can. capture() goes right after
+    the LLM, and stores the answers to questions that missed.
+
+    Args:
+        level: The session's level.
+        tools: The level's tools.
+        caches: The caches to use, the process's by default.
+    """
+
+    def __init__(self, level: int, tools: Any = None, caches: ResponseCaches = response_caches):
+        self.level = level
+        self._caches = caches
+        self._cache = caches.level(level)
+        self._sensitive = SENSITIVE_TERMS | tool_terms(tools)
+        self._bypass = False
+        # The question the LLM is answering, to store its answer
+        self._pending: Optional[str] = None
+        self._answer: List[str] = []
+        self._answering = False
+        # The user messages checked by question(), by identity
+        self._checked: Set[int] = set()
+        self._asked = False
+        self._lookup = _CacheTap(self, self._on_lookup_frame, name=f"ResponseCacheLookup#{level}")
+        self._capture = _CacheTap(self, self._on_capture_frame, name=f"ResponseCacheCapture#{level}")
+
+    def lookup(self) -> FrameProcessor:
+        return self._lookup
+
+    def capture(self) -> FrameProcessor:
+        return self._capture
+
+    def question(self, text: str) -> Optional[str]:
+        """Get a user message as a cacheable question, or None.
+
+        A message that isn't one sends the session around the cache from then
+        on: it could be an instruction, e.g. to answer in some voice, that
+        shapes the answers to later questions, which mustn't be served to
+        other users.
+        """
+        question = normalize(text)
+        if not question:
+            # Nothing but filler, e.g. "hi", which can't instruct the bot
+            return None
+        words = set(terms(question))
+        if (
+            question.split()[0] not in QUESTION_WORDS
+            or len(question.split()) > RESPONSE_CACHE_MAX_WORDS
+            or words & self._sensitive
+            or not knowledge_index().search(question, 1)
+        ):
+            self._bypass = True
+            return None
+        return question
+
+    async def _on_lookup_frame(self, tap: FrameProcessor, frame: Frame, direction: FrameDirection) -> bool:
+        if isinstance(frame, FunctionCallInProgressFrame):
+            self._bypass = True
+            return False
+        if not isinstance(frame, OpenAILLMContextFrame) or direction != FrameDirection.DOWNSTREAM:
+            return False
+        self._pending = None
+        messages = frame.context.messages
+        if not messages or messages[-1].get("role") != "user" or self._cache.size <= 0:
+            return False
+
+        # Every user message must be a clean question, including any the
+        # aggregator added without a request of their own
+        question = None
+        for message in messages:
+            if message.get("role") == "user" and id(message) not in self._checked:
+                self._checked.add(id(message))
+                question = self.question(_text(message))
+        if self._bypass or question is None:
+            self._caches.count(self.level, "bypass")
+            return False
+        first, self._asked = not self._asked, True
+        answer = self._cache.get(question)
+        if answer is None:
+            self._caches.count(self.level, "miss")
+            # Only the session's first question is answered from the system
+            # prompt and nothing the user said before
+            if first:
+                self._pending = question
+            return False
+
+        self._caches.count(self.level, "hit")
+        logger.debug(f"{tap}: answering {question!r} from the cache")
+        await tap.push_frame(LLMFullResponseStartFrame())
+        await tap.push_frame(LLMTextFrame(answer))
+        await tap.push_frame(LLMFullResponseEndFrame())
+        return True
+
+    async def _on_capture_frame(self, tap: FrameProcessor, frame: Frame, direction: FrameDirection) -> bool:
+        if isinstance(frame, FunctionCallInProgressFrame):
+            self._bypass = True
+            self._pending = None
+        elif isinstance(frame, StartInterruptionFrame):
+            self._pending = None
+        elif isinstance(frame, LLMFullResponseStartFrame):
+            self._answering = True
+            self._answer = []
+        elif isinstance(frame, LLMTextFrame) and self._answering:
+            self._answer.append(frame.text)
+        elif isinstance(frame, LLMFullResponseEndFrame) and self._answering:
+            self._answering = False
+            answer = "".join(self._answer).strip()
+            if self._pending and answer and not self._bypass:
+                self._cache.put(self._pending, answer)
+                self._caches.count(self.level, "store")
+            self._pending = None
+        return False
@@ -0,0 +1,258 @@
+"""Pool of pre-provisioned Daily rooms and meeting tokens.
+
+Creating a room and a meeting token takes two sequential Daily REST calls,
+which used to sit on the critical path of every connection. DailyRoomPool keeps
+`depth` rooms with ready tokens, refilled in the background with at most
+`refill_concurrency` REST calls in flight. Rooms and tokens are created with
+the same expiry; entries that get too close to it are evicted and their rooms
+deleted.
+
+FakeDailyRESTHelper is a local stand-in for DailyRESTHelper, so the pool and
+the server can be exercised without a Daily account.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Optional
+
+from loguru import logger
+from pipecat.transports.services.helpers.daily_rest import (
+    DailyRoomObject,
+    DailyRoomParams,
+    DailyRoomProperties,
+)
+
+from stats import LatencyWindow
+
+# Seconds between checks for entries close to expiry
+SWEEP_INTERVAL = 30.0
+
+# Seconds to wait before refilling again after a REST call failed
+REFILL_RETRY_DELAY = 5.0
+
+
+@dataclass
+class PooledRoom:
+    """A Daily room with a meeting token."""
+
+    url: str
+    token: str
+    # Unix time at which both the room and the token expire
+    expires_at: float
+    # Whether the room came from the pool or was created on demand
+    pooled: bool = False
+
+
+class FakeDailyRESTHelper:
+    """Local stand-in for DailyRESTHelper.
+
+    Implements the calls used by the server without any network access.
+    `latency` adds a delay to every call to mimic the real API.
+    """
+
+    def __init__(self, latency: float = 0.0, domain: str = "fake.daily.co"):
+        self.latency = latency
+        self.domain = domain
+        self.rooms: Dict[str, DailyRoomObject] = {}
+
+    async def create_room(self, params: DailyRoomParams) -> DailyRoomObject:
+        await asyncio.sleep(self.latency)
+        name = params.name or uuid.uuid4().hex[:12]
+        room = DailyRoomObject(
+            id=uuid.uuid4().hex,
+            name=name,
+            api_created=True,
+            privacy=params.privacy,
+            url=f"https://{self.domain}/{name}",
+            created_at=datetime.now(timezone.utc).isoformat(),
+            config=params.properties,
+        )
+        self.rooms[room.url] = room
+        return room
+
+    async def get_token(self, room_url: str, expiry_time: float = 60 * 60, **kwargs: Any) -> str:
+        await asyncio.sleep(self.latency)
+        if room_url not in self.rooms:
+            raise Exception(f"Failed to create meeting token (status: 404): {room_url}")
+        return f"fake-token-{uuid.uuid4().hex}"
+
+    async def delete_room_by_url(self, room_url: str) -> bool:
+        await asyncio.sleep(self.latency)
+        return self.rooms.pop(room_url, None) is not None
+
+
+class DailyRoomPool:
+    """Keeps a number of Daily rooms with meeting tokens ready to hand out."""
+
+    def __init__(
+        self,
+        depth: int = 2,
+        refill_concurrency: int = 2,
+        room_ttl: float = 60 * 60,
+        min_remaining: float = 10 * 60,
+    ):
+        """Initialize the pool.
+
+        Args:
+            depth: Number of ready rooms to keep. 0 disables pre-provisioning.
+            refill_concurrency: Maximum number of rooms being created at once.
+            room_ttl: Seconds until a new room and its token expire.
+            min_remaining: Entries with less lifetime left than this are evicted.
+        """
+        self.depth = depth
+        self.room_ttl = room_ttl
+        self.min_remaining = min_remaining
+
+        self._rest = None
+        self._ready: Deque[PooledRoom] = deque()
+        self._creating = 0
+        self._refill_concurrency = refill_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._refill_event: Optional[asyncio.Event] = None
+        self._refill_task: Optional[asyncio.Task] = None
+        self._background: set = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.pooled_latency = LatencyWindow()
+        self.direct_latency = LatencyWindow()
+
+    async def start(self, rest):
+        """Start filling the pool in the background.
+
+        Args:
+            rest: A DailyRESTHelper, or a FakeDailyRESTHelper.
+        """
+        self._rest = rest
+        self._semaphore = asyncio.Semaphore(self._refill_concurrency)
+        self._refill_event = asyncio.Event()
+        self._refill_task = asyncio.create_task(self._refill_loop())
+        self._refill_event.set()
+
+    async def stop(self):
+        """Stop refilling and delete the rooms nobody used."""
+        if self._refill_task:
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
+        for task in list(self._background):
+            task.cancel()
+        rooms, self._ready = list(self._ready), deque()
+        await asyncio.gather(
+            *(self._rest.delete_room_by_url(room.url) for room in rooms), return_exceptions=True
+        )
+
+    async def acquire(self) -> PooledRoom:
+        """Get a room and token, from the pool if one is ready.
+
+        Returns:
+            The room with its meeting token.
+        """
+        started = time.monotonic()
+        room = self._pop_ready()
+        if room:
+            self.hits += 1
+            room.pooled = True
+            self.pooled_latency.record(time.monotonic() - started)
+        else:
+            self.misses += 1
+            room = await self._create()
+            self.direct_latency.record(time.monotonic() - started)
+        self._request_refill()
+        return room
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the pool depth, hit rate and acquisition latency with and without the pool."""
+        requests = self.hits + self.misses
+        return {
+            "depth": self.depth,
+            "ready": len(self._ready),
+            "creating": self._creating,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else None,
+            "evicted": self.evicted,
+            "acquire_latency": {
+                "pooled": self.pooled_latency.snapshot(),
+                "direct": self.direct_latency.snapshot(),
+            },
+        }
+
+    def _usable(self, room: PooledRoom) -> bool:
+        return room.expires_at - time.time() > self.min_remaining
+
+    def _pop_ready(self) -> Optional[PooledRoom]:
+        while self._ready:
+            room = self._ready.popleft()
+            if self._usable(room):
+                return room
+            self._evict(room)
+        return None
+
+    def _evict(self, room: PooledRoom):
+        self.evicted += 1
+        task = asyncio.create_task(self._delete(room))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _delete(self, room: PooledRoom):
+        try:
+            async with self._semaphore:
+                await self._rest.delete_room_by_url(room.url)
+        except Exception as e:
+            # The room expires on its own anyway
+            logger.warning(f"Failed to delete expired room {room.url}: {e}")
+
+    async def _create(self) -> PooledRoom:
+        expires_at = time.time() + self.room_ttl
+        params = DailyRoomParams(properties=DailyRoomProperties(exp=expires_at))
+        room = await self._rest.create_room(params)
+        if not room.url:
+            raise Exception("Failed to create room")
+
+        token = await self._rest.get_token(room.url, expiry_time=self.room_ttl)
+        if not token:
+            raise Exception(f"Failed to get token for room: {room.url}")
+
+        return PooledRoom(url=room.url, token=token, expires_at=expires_at)
+
+    async def _fill_one(self):
+        self._creating += 1
+        try:
+            async with self._semaphore:
+                room = await self._create()
+            self._ready.append(room)
+        except Exception as e:
+            logger.error(f"Failed to pre-provision Daily room: {e}")
+            asyncio.get_running_loop().call_later(REFILL_RETRY_DELAY, self._request_refill)
+        finally:
+            self._creating -= 1
+
+    def _request_refill(self):
+        if self._refill_event:
+            self._refill_event.set()
+
+    async def _refill_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._refill_event.wait(), SWEEP_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._refill_event.clear()
+
+            for room in [room for room in self._ready if not self._usable(room)]:
+                self._ready.remove(room)
+                self._evict(room)
+
+            missing = self.depth - len(self._ready) - self._creating
+            for _ in range(max(0, missing)):
+                task = asyncio.create_task(self._fill_one())
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
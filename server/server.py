@@ -7,7 +7,7 @@
 This FastAPI server manages RTVI bot instances and provides endpoints for both
 direct browser access and RTVI client connections. It handles:
 - Creating Daily rooms
-- Managing bot processes
+- Managing a pool of pre-warmed bot workers
 - Providing connection credentials
 - Monitoring bot status
 
@@ -19,47 +19,91 @@ Requirements:
 """
 
 import argparse
+import asyncio
 import os
-import subprocess
+import time
+import uuid
 from contextlib import asynccontextmanager
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 import aiohttp
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 import weave
 
-from pipecat.transports.services.helpers.daily_rest import DailyRESTHelper, DailyRoomParams
+from pipecat.transports.services.helpers.daily_rest import DailyRESTHelper
+
+from bot_pool import BotWorkerPool
+import metrics
+from room_pool import DailyRoomPool, FakeDailyRESTHelper, PooledRoom
+from stats import LatencyWindow
+from supervisor import BotSupervisor
+from timeline import SessionTimeline
+import tracing
+from tracing import traced
 
 # Load environment variables from .env file
 load_dotenv(override=True)
 
 # Load Weave instrumentation
-weave.init("weave-pipecat")
+tracing.init("weave-pipecat")
 
 # Maximum number of bot instances allowed per room
 MAX_BOTS_PER_ROOM = 1
 
-# Dictionary to track bot processes: {pid: (process, room_url)}
-bot_procs = {}
+# Number of pre-warmed bot workers with free session slots to keep ready
+BOT_POOL_SIZE = int(os.getenv("BOT_POOL_SIZE", "2"))
+
+# Maximum number of concurrent sessions hosted by one bot worker
+BOT_SESSIONS_PER_WORKER = int(os.getenv("BOT_SESSIONS_PER_WORKER", "4"))
+
+# Number of ready Daily rooms with tokens to keep, 0 creates them on demand
+DAILY_ROOM_POOL_DEPTH = int(os.getenv("DAILY_ROOM_POOL_DEPTH", "2"))
+
+# Maximum number of pool rooms being created at once
+DAILY_ROOM_POOL_CONCURRENCY = int(os.getenv("DAILY_ROOM_POOL_CONCURRENCY", "2"))
+
+# Use a local stand-in for the Daily REST API, for tests
+DAILY_API_FAKE = os.getenv("DAILY_API_FAKE", "").lower() in ("1", "true", "yes")
+
+# Bot worker processes and the rooms they serve
+supervisor = BotSupervisor(finished_ttl=float(os.getenv("BOT_FINISHED_TTL", "300")))
 
 # Store Daily API helpers
 daily_helpers = {}
 
-@weave.op()
-def cleanup():
-    """Cleanup function to terminate all bot processes.
+# Pre-warmed bot workers waiting for a room
+bot_pool = BotWorkerPool(
+    size=BOT_POOL_SIZE,
+    cwd=os.path.dirname(os.path.abspath(__file__)),
+    sessions_per_worker=BOT_SESSIONS_PER_WORKER,
+    handoff_timeout=float(os.getenv("BOT_HANDOFF_TIMEOUT", "10")),
+    supervisor=supervisor,
+)
+
+# Pre-provisioned Daily rooms and tokens
+room_pool = DailyRoomPool(
+    depth=DAILY_ROOM_POOL_DEPTH,
+    refill_concurrency=DAILY_ROOM_POOL_CONCURRENCY,
+    room_ttl=float(os.getenv("DAILY_ROOM_TTL", "3600")),
+)
+
+# Connect latency, split by whether the room came from the pool
+connect_latency = {"pooled": LatencyWindow(), "direct": LatencyWindow()}
 
-    Called during server shutdown.
+@traced()
+async def cleanup():
+    """Cleanup function to terminate the worker pool and all bot processes.
+
+    Called during server shutdown. Workers are terminated in parallel and
+    killed if they don't exit in time.
     """
-    for entry in bot_procs.values():
-        proc = entry[0]
-        proc.terminate()
-        proc.wait()
+    await asyncio.gather(bot_pool.stop(), room_pool.stop())
+    await supervisor.shutdown()
 
-@weave.op()
+@traced()
 def get_bot_file():
     bot_implementation = os.getenv("BOT_IMPLEMENTATION", "openai").lower().strip()
     # If blank or None, default to openai
@@ -79,17 +123,25 @@ async def lifespan(app: FastAPI):
 
     - Creates aiohttp session
     - Initializes Daily API helper
+    - Starts filling the Daily room pool and the bot worker pool
     - Cleans up resources on shutdown
     """
     aiohttp_session = aiohttp.ClientSession()
-    daily_helpers["rest"] = DailyRESTHelper(
-        daily_api_key=os.getenv("DAILY_API_KEY", ""),
-        daily_api_url=os.getenv("DAILY_API_URL", "https://api.daily.co/v1"),
-        aiohttp_session=aiohttp_session,
-    )
+    if DAILY_API_FAKE:
+        daily_helpers["rest"] = FakeDailyRESTHelper(
+            latency=float(os.getenv("DAILY_API_FAKE_LATENCY_MS", "0")) / 1000
+        )
+    else:
+        daily_helpers["rest"] = DailyRESTHelper(
+            daily_api_key=os.getenv("DAILY_API_KEY", ""),
+            daily_api_url=os.getenv("DAILY_API_URL", "https://api.daily.co/v1"),
+            aiohttp_session=aiohttp_session,
+        )
+    await room_pool.start(daily_helpers["rest"])
+    await bot_pool.start(get_bot_file())
     yield
+    await cleanup()
     await aiohttp_session.close()
-    cleanup()
 
 
 # Initialize FastAPI app with lifespan manager
@@ -104,29 +156,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@weave.op()
-async def create_room_and_token() -> tuple[str, str]:
-    """Helper function to create a Daily room and generate an access token.
+@traced()
+async def create_room_and_token() -> PooledRoom:
+    """Helper function to get a Daily room and an access token.
+
+    Takes a pre-provisioned room from the pool, or creates one if the pool is empty.
 
     Returns:
-        tuple[str, str]: A tuple containing (room_url, token)
+        PooledRoom: The room URL, token and their expiry
 
     Raises:
         HTTPException: If room creation or token generation fails
     """
-    room = await daily_helpers["rest"].create_room(DailyRoomParams())
-    if not room.url:
-        raise HTTPException(status_code=500, detail="Failed to create room")
+    try:
+        return await room_pool.acquire()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 
-    token = await daily_helpers["rest"].get_token(room.url)
-    if not token:
-        raise HTTPException(status_code=500, detail=f"Failed to get token for room: {room.url}")
+async def start_bot(
+    room_url: str,
+    token: str,
+    timeline: SessionTimeline,
+    custom_data: Optional[Dict[str, Any]] = None,
+):
+    """Hand a room to a bot worker from the pool.
+
+    Args:
+        room_url: The Daily room URL
+        token: The Daily room token
+        timeline: The session's timeline so far, continued by the bot
+        custom_data: Custom data forwarded to the bot, including the level ID
+
+    Raises:
+        HTTPException: If no worker could take the room
+    """
+    try:
+        worker = await bot_pool.assign(
+            room_url, token, timeline.to_custom_data(custom_data), timeline.session_id
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to start bot: {e}")
 
-    return room.url, token
+    print(f"Bot worker {worker.pid} started for room: {room_url}")
 
 
 @app.get("/")
-@weave.op()
+@traced()
 async def start_agent(request: Request):
     """Endpoint for direct browser access to the bot.
 
@@ -138,30 +214,24 @@ async def start_agent(request: Request):
     Raises:
         HTTPException: If room creation, token generation, or bot startup fails
     """
+    started = time.monotonic()
+    timeline = SessionTimeline(uuid.uuid4().hex)
+    timeline.mark("connect")
     print("Creating room")
-    room_url, token = await create_room_and_token()
+    room = await create_room_and_token()
+    room_url, token = room.url, room.token
+    timeline.mark("room_ready")
     print(f"Room URL: {room_url}")
 
-    # Check if there is already an existing process running in this room
-    num_bots_in_room = sum(
-        1 for proc in bot_procs.values() if proc[1] == room_url and proc[0].poll() is None
-    )
+    # Check if there is already an existing session running in this room
+    num_bots_in_room = bot_pool.count_sessions(room_url)
     if num_bots_in_room >= MAX_BOTS_PER_ROOM:
         raise HTTPException(status_code=500, detail=f"Max bot limit reached for room: {room_url}")
 
-    # Spawn a new bot process
-    try:
-        bot_file = get_bot_file()
-        proc = subprocess.Popen(
-            [f"python3 -m {bot_file} -u {room_url} -t {token}"],
-            shell=True,
-            bufsize=1,
-            cwd=os.path.dirname(os.path.abspath(__file__)),
-        )
-        bot_procs[proc.pid] = (proc, room_url)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to start subprocess: {e}")
+    # Hand the room to a pre-warmed bot worker
+    await start_bot(room_url, token, timeline)
 
+    connect_latency["pooled" if room.pooled else "direct"].record(time.monotonic() - started)
     return RedirectResponse(room_url)
 
 
@@ -177,29 +247,36 @@ async def rtvi_connect(request: Request) -> Dict[Any, Any]:
     Raises:
         HTTPException: If room creation, token generation, or bot startup fails
     """
+    started = time.monotonic()
+    timeline = SessionTimeline(uuid.uuid4().hex)
+    timeline.mark("connect")
     print("Creating room for RTVI connection")
-    room_url, token = await create_room_and_token()
+    room = await create_room_and_token()
+    room_url, token = room.url, room.token
+    timeline.mark("room_ready")
     print(f"Room URL: {room_url}")
 
-    # Start the bot process
+    # Forward the client's custom data (e.g. the level ID) to the bot
+    custom_data = None
     try:
-        bot_file = get_bot_file()
-        proc = subprocess.Popen(
-            [f"python3 -m {bot_file} -u {room_url} -t {token}"],
-            shell=True,
-            bufsize=1,
-            cwd=os.path.dirname(os.path.abspath(__file__)),
-        )
-        bot_procs[proc.pid] = (proc, room_url)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to start subprocess: {e}")
+        body = await request.json()
+        if isinstance(body, dict):
+            custom_data = body.get("customData")
+    except ValueError:
+        pass
+
+    # Hand the room to a pre-warmed bot worker
+    await start_bot(room_url, token, timeline, custom_data)
+
+    connect_latency["pooled" if room.pooled else "direct"].record(time.monotonic() - started)
 
-    # Return the authentication bundle in format expected by DailyTransport
-    return {"room_url": room_url, "token": token}
+    # Return the authentication bundle in format expected by DailyTransport,
+    # and the session ID its timeline is logged under
+    return {"room_url": room_url, "token": token, "session_id": timeline.session_id}
 
 
 @app.get("/status/{pid}")
-@weave.op()
+@traced()
 def get_status(pid: int):
     """Get the status of a specific bot process.
 
@@ -207,21 +284,54 @@ def get_status(pid: int):
         pid (int): Process ID of the bot
 
     Returns:
-        JSONResponse: Status information for the bot
+        JSONResponse: Status, exit code, uptime and restart count of the bot
 
     Raises:
         HTTPException: If the specified bot process is not found
     """
-    # Look up the subprocess
-    proc = bot_procs.get(pid)
+    status = supervisor.status(pid)
 
-    # If the subprocess doesn't exist, return an error
-    if not proc:
+    # Unknown, or finished longer than BOT_FINISHED_TTL ago
+    if status is None:
         raise HTTPException(status_code=404, detail=f"Bot with process id: {pid} not found")
 
-    # Check the status of the subprocess
-    status = "running" if proc[0].poll() is None else "finished"
-    return JSONResponse({"bot_id": pid, "status": status})
+    return JSONResponse(status)
+
+
+@app.get("/pool")
+def get_pool_stats():
+    """Get the bot worker pool size, hit rate and handoff latency.
+
+    Returns:
+        JSONResponse: Pool statistics
+    """
+    stats = bot_pool.stats()
+    stats["processes"] = supervisor.stats()
+    return JSONResponse(stats)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Get the pool's and every bot worker's metrics for Prometheus.
+
+    Returns:
+        PlainTextResponse: The metrics in the Prometheus text format
+    """
+    return PlainTextResponse(metrics.render(bot_pool), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/rooms/pool")
+def get_room_pool_stats():
+    """Get the Daily room pool depth, hit rate and connect latency with and without it.
+
+    Returns:
+        JSONResponse: Room pool statistics
+    """
+    stats = room_pool.stats()
+    stats["connect_latency"] = {
+        source: window.snapshot() for source, window in connect_latency.items()
+    }
+    return JSONResponse(stats)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+"""Session-scoped runtime for hosting many conversations in one bot process.
+
+Each call to the bot's main() registers a BotSession holding the state that
+used to live in module globals (the level configuration and the RTVI
+processor), along with the session's time-to-first-word timeline. Function call
+handlers and other callbacks look their session up by ID, so concurrent
+pipelines on the same event loop never see each other's state.
+"""
+
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from loguru import logger
+from pipecat.pipeline.task import PipelineTask
+from pipecat.processors.frameworks.rtvi import RTVIProcessor
+
+from levels.base import BaseLevelConfig
+from timeline import SessionTimeline
+
+
+@dataclass
+class BotSession:
+    """State for a single conversation."""
+
+    session_id: str
+    room_url: str
+    level_config: BaseLevelConfig
+    rtvi_processor: Optional[RTVIProcessor] = None
+    task: Optional[PipelineTask] = None
+    timeline: Optional[SessionTimeline] = None
+    started_at: float = field(default_factory=time.monotonic)
+
+    async def close(self):
+        """Cancel the session's pipeline, if it is running."""
+        if self.task and not self.task.has_finished():
+            await self.task.cancel()
+
+
+class SessionRegistry:
+    """Registry of the conversations running in this process."""
+
+    def __init__(self):
+        self._sessions: Dict[str, BotSession] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(
+        self, room_url: str, level_config: BaseLevelConfig, session_id: Optional[str] = None
+    ) -> BotSession:
+        """Register a new session.
+
+        Args:
+            room_url: The Daily room URL the session runs in.
+            level_config: The level configuration for the session.
+            session_id: The session ID. A new one is generated if not given.
+
+        Returns:
+            The registered session.
+
+        Raises:
+            ValueError: If a session with the same ID is already registered.
+        """
+        session_id = session_id or uuid.uuid4().hex
+        if session_id in self._sessions:
+            raise ValueError(f"Session already registered: {session_id}")
+
+        session = BotSession(session_id=session_id, room_url=room_url, level_config=level_config)
+        self._sessions[session_id] = session
+        logger.debug(f"Session {session_id} registered ({len(self._sessions)} active)")
+        return session
+
+    def get(self, session_id: str) -> Optional[BotSession]:
+        """Look up a session by ID."""
+        return self._sessions.get(session_id)
+
+    def remove(self, session_id: str):
+        """Drop a session and everything it references."""
+        if self._sessions.pop(session_id, None):
+            logger.debug(f"Session {session_id} removed ({len(self._sessions)} active)")
+
+    async def close(self, session_id: str):
+        """Cancel a session's pipeline. The session removes itself once it stops."""
+        session = self._sessions.get(session_id)
+        if session:
+            await session.close()
+
+    def session_ids(self) -> List[str]:
+        return list(self._sessions)
+
+    def count_by_level(self) -> Dict[int, int]:
+        """Get the number of active sessions per level ID."""
+        return dict(Counter(s.level_config.level_id for s in self._sessions.values()))
+
+
+# Process-wide session registry
+sessions = SessionRegistry()
@@ -0,0 +1,174 @@
+"""Small in-process statistics helpers.
+
+These are used by the server and the bot workers to report latency figures
+without pulling in a metrics library.
+"""
+
+import math
+import os
+import resource
+import sys
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+
+class LatencyWindow:
+    """Keeps the most recent latency samples and reports percentiles over them.
+
+    Samples are recorded in seconds and reported in milliseconds.
+    """
+
+    def __init__(self, maxlen: int = 1024):
+        self._samples: Deque[float] = deque(maxlen=maxlen)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        """Record a single latency sample."""
+        self._samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Get the p-th percentile (0-100) of the retained samples, in seconds."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        """Get a JSON-serializable summary of the window in milliseconds."""
+
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 2) if value is not None else None
+
+        return {
+            "count": self.count,
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99)),
+            "max_ms": ms(max(self._samples)) if self._samples else None,
+        }
+
+
+class LatencyHistogram:
+    """HDR-style latency histogram with a bounded relative error.
+
+    Buckets grow geometrically between `lowest` and `highest` seconds, so every
+    sample is counted to within `precision` of its value whatever its
+    magnitude, in fixed memory. Unlike LatencyWindow it covers every sample
+    ever recorded. Samples outside the range are clamped to it.
+    """
+
+    def __init__(self, lowest: float = 0.0001, highest: float = 60.0, precision: float = 0.01):
+        self.lowest = lowest
+        self.highest = highest
+        self.precision = precision
+        self._log_base = math.log1p(precision)
+        self._counts = [0] * (self._index(highest) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _index(self, seconds: float) -> int:
+        seconds = min(max(seconds, self.lowest), self.highest)
+        return int(math.log(seconds / self.lowest) / self._log_base)
+
+    def _value(self, index: int) -> float:
+        # Middle of the bucket
+        return self.lowest * math.exp((index + 0.5) * self._log_base)
+
+    def record(self, seconds: float):
+        """Record a single latency sample."""
+        self._counts[self._index(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram"):
+        """Add the samples of a histogram with the same range and precision."""
+        for index, count in enumerate(other._counts):
+            self._counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def cumulative(self, bounds: Sequence[float]) -> List[int]:
+        """Get the number of samples at or below each bound, in seconds.
+
+        Bounds must be sorted. Samples are placed by the middle of their bucket.
+        """
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            while index < len(self._counts) and self._value(index) <= bound:
+                seen += self._counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the histogram's state as JSON, with only the non-empty buckets."""
+        return {
+            "lowest": self.lowest,
+            "highest": self.highest,
+            "precision": self.precision,
+            "buckets": {str(i): count for i, count in enumerate(self._counts) if count},
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        """Rebuild a histogram from to_dict()."""
+        histogram = cls(data["lowest"], data["highest"], data["precision"])
+        for index, count in data["buckets"].items():
+            histogram._counts[int(index)] = count
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.max = data["max"]
+        return histogram
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Get the p-th percentile (0-100) in seconds."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        """Get a JSON-serializable summary of the histogram in milliseconds."""
+
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 2) if value is not None else None
+
+        return {
+            "count": self.count,
+            "mean_ms": ms(self.total / self.count) if self.count else None,
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99)),
+            "max_ms": ms(self.max) if self.count else None,
+        }
+
+
+def current_rss_bytes() -> int:
+    """Get the resident set size of this process in bytes.
+
+    Falls back to the peak RSS where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
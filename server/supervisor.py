@@ -0,0 +1,225 @@
+"""Supervisor for bot worker processes.
+
+Every bot worker is started through BotSupervisor, which watches it until it
+exits and keeps an index of the rooms it is serving. Room lookups and running
+counts are kept up to date as sessions start and end, so answering "how many
+bots are in this room" does not scan the process table. Finished processes stay
+visible to /status for `finished_ttl` seconds and are then evicted.
+"""
+
+import asyncio
+import signal
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+
+@dataclass
+class SupervisedProcess:
+    """A bot worker process and what it is serving."""
+
+    process: asyncio.subprocess.Process
+    started_at: float = field(default_factory=time.monotonic)
+    exited_at: Optional[float] = None
+    # How many times this worker's slot was restarted after a crash
+    restarts: int = 0
+    # Running sessions per room: {room_url: count}
+    rooms: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    @property
+    def running(self) -> bool:
+        return self.exited_at is None
+
+    @property
+    def crashed(self) -> bool:
+        # Exiting on SIGTERM is a requested stop
+        return not self.running and self.process.returncode not in (0, -signal.SIGTERM)
+
+    @property
+    def uptime(self) -> float:
+        return (self.exited_at or time.monotonic()) - self.started_at
+
+
+class BotSupervisor:
+    """Starts bot workers and tracks them until they exit."""
+
+    def __init__(self, finished_ttl: float = 300.0, shutdown_timeout: float = 10.0):
+        """Initialize the supervisor.
+
+        Args:
+            finished_ttl: Seconds to keep a finished process visible in status lookups.
+            shutdown_timeout: Seconds to wait for workers to exit before killing them.
+        """
+        self.finished_ttl = finished_ttl
+        self.shutdown_timeout = shutdown_timeout
+
+        self._processes: Dict[int, SupervisedProcess] = {}
+        # Room index: {room_url: {pid: session count}}
+        self._rooms: Dict[str, Dict[int, int]] = {}
+        self._watchers: set = set()
+
+        self.running = 0
+        self.started = 0
+        self.exited = 0
+        self.crashed = 0
+
+    async def spawn(
+        self,
+        *args: str,
+        replaces: Optional[int] = None,
+        on_exit: Optional[Callable[[SupervisedProcess], None]] = None,
+        **kwargs: Any,
+    ) -> asyncio.subprocess.Process:
+        """Start a process and watch it until it exits.
+
+        Args:
+            *args: The program and its arguments. No shell is involved.
+            replaces: PID of a crashed worker this one replaces, if any.
+            on_exit: Called with the finished process once it has exited.
+            **kwargs: Passed on to asyncio.create_subprocess_exec.
+
+        Returns:
+            The started process.
+        """
+        process = await asyncio.create_subprocess_exec(*args, **kwargs)
+
+        restarts = 0
+        if replaces is not None and replaces in self._processes:
+            restarts = self._processes[replaces].restarts + 1
+
+        entry = SupervisedProcess(process, restarts=restarts)
+        self._processes[process.pid] = entry
+        self.running += 1
+        self.started += 1
+
+        watcher = asyncio.create_task(self._watch(entry, on_exit))
+        self._watchers.add(watcher)
+        watcher.add_done_callback(self._watchers.discard)
+        return process
+
+    def get(self, pid: int) -> Optional[SupervisedProcess]:
+        """Get a running or recently finished process."""
+        return self._processes.get(pid)
+
+    def add_session(self, pid: int, room_url: str):
+        """Record that a worker started a session in a room."""
+        entry = self._processes.get(pid)
+        if entry is None or not entry.running:
+            return
+        entry.rooms[room_url] = entry.rooms.get(room_url, 0) + 1
+        workers = self._rooms.setdefault(room_url, {})
+        workers[pid] = workers.get(pid, 0) + 1
+
+    def remove_session(self, pid: int, room_url: str):
+        """Record that a worker's session in a room ended."""
+        entry = self._processes.get(pid)
+        if entry is None or room_url not in entry.rooms:
+            return
+        entry.rooms[room_url] -= 1
+        if not entry.rooms[room_url]:
+            del entry.rooms[room_url]
+
+        workers = self._rooms[room_url]
+        workers[pid] -= 1
+        if not workers[pid]:
+            del workers[pid]
+        if not workers:
+            del self._rooms[room_url]
+
+    def count_in_room(self, room_url: str) -> int:
+        """Get the number of running sessions in a room."""
+        return sum(self._rooms.get(room_url, {}).values())
+
+    def status(self, pid: int) -> Optional[Dict[str, Any]]:
+        """Get the status of a running or recently finished process.
+
+        Returns:
+            The status, or None if the process is unknown or was evicted.
+        """
+        entry = self._processes.get(pid)
+        if entry is None:
+            return None
+        return {
+            "bot_id": pid,
+            "status": "running" if entry.running else "finished",
+            "exit_code": entry.process.returncode,
+            "uptime_secs": round(entry.uptime, 3),
+            "restarts": entry.restarts,
+            "rooms": list(entry.rooms),
+        }
+
+    def stats(self) -> Dict[str, int]:
+        """Get the process counters."""
+        return {
+            "running": self.running,
+            "started": self.started,
+            "exited": self.exited,
+            "crashed": self.crashed,
+            "tracked": len(self._processes),
+            "rooms": len(self._rooms),
+        }
+
+    async def shutdown(self, pids: Optional[List[int]] = None):
+        """Terminate running processes in parallel.
+
+        Processes still running after `shutdown_timeout` seconds are killed.
+
+        Args:
+            pids: The processes to stop. Defaults to all running processes.
+        """
+        if pids is None:
+            entries = [entry for entry in self._processes.values() if entry.running]
+        else:
+            entries = [
+                self._processes[pid]
+                for pid in pids
+                if pid in self._processes and self._processes[pid].running
+            ]
+        if not entries:
+            return
+
+        for entry in entries:
+            if entry.process.returncode is None:
+                entry.process.terminate()
+
+        waits = {asyncio.ensure_future(entry.process.wait()): entry for entry in entries}
+        _, pending = await asyncio.wait(waits, timeout=self.shutdown_timeout)
+        for wait in pending:
+            entry = waits[wait]
+            logger.warning(f"Bot worker {entry.pid} did not exit in time, killing it")
+            entry.process.kill()
+        if pending:
+            await asyncio.wait(pending)
+
+    async def _watch(
+        self, entry: SupervisedProcess, on_exit: Optional[Callable[[SupervisedProcess], None]]
+    ):
+        returncode = await entry.process.wait()
+        entry.exited_at = time.monotonic()
+        self.running -= 1
+        self.exited += 1
+        if entry.crashed:
+            self.crashed += 1
+            logger.warning(f"Bot worker {entry.pid} exited with code {returncode}")
+
+        for room_url in list(entry.rooms):
+            workers = self._rooms.get(room_url, {})
+            workers.pop(entry.pid, None)
+            if not workers:
+                self._rooms.pop(room_url, None)
+        entry.rooms.clear()
+
+        if on_exit:
+            on_exit(entry)
+        asyncio.get_running_loop().call_later(self.finished_ttl, self._evict, entry.pid)
+
+    def _evict(self, pid: int):
+        entry = self._processes.get(pid)
+        if entry is not None and not entry.running:
+            del self._processes[pid]
@@ -0,0 +1,227 @@
+"""Time-to-first-word timeline of a session.
+
+Most of the wait a user perceives happens before the first turn. A session's
+timeline timestamps each phase between the client connecting and the bot's
+first audio:
+
+- connect: the server received /connect (or /)
+- room_ready: the server has a Daily room and token
+- bot_started: a bot worker started the session
+- bot_joined: the bot joined the room
+- participant_joined: the user joined the room
+- context_kickoff: the bot started its fixed greeting, or queued the context
+  that prompts the LLM for one
+- llm_first_token: the first token of the greeting, when the LLM writes it
+- tts_first_audio: the first audio of the greeting from the TTS, unless it
+  came from the audio cache
+- bot_first_audio: the first audio frame out of the output transport
+
+The server stamps its phases and passes them to the bot in `custom_data`, with
+the session ID, so both halves end up in one timeline. Phases are stamped with
+the wall clock since they are taken in different processes. When the bot's
+first audio goes out, the timeline is logged as a structured record and every
+phase is checked against its SLO. The time spent in a phase is the time since
+the phase before it.
+"""
+
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+from pipecat.frames.frames import BotStartedSpeakingFrame, LLMTextFrame, TTSAudioRawFrame
+from pipecat.observers.base_observer import BaseObserver
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from stats import LatencyHistogram
+
+PHASES = (
+    "connect",
+    "room_ready",
+    "bot_started",
+    "bot_joined",
+    "participant_joined",
+    "context_kickoff",
+    "llm_first_token",
+    "tts_first_audio",
+    "bot_first_audio",
+)
+
+# The time from the first phase to the bot's first audio
+TOTAL = "total"
+
+
+def parse_slos(text: str) -> Dict[str, float]:
+    """Parse per-phase SLOs, e.g. "room_ready=300,llm_first_token=800", in ms.
+
+    Returns:
+        The SLOs in seconds, by phase.
+
+    Raises:
+        ValueError: If a phase is unknown or an SLO is not a number
+    """
+    slos = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        phase, _, value = item.partition("=")
+        phase = phase.strip()
+        if phase not in PHASES and phase != TOTAL:
+            raise ValueError(f"Unknown timeline phase in SLO: {phase}")
+        slos[phase] = float(value) / 1000
+    return slos
+
+
+# Time to first word SLO, from /connect to the bot's first audio, in ms
+FIRST_WORD_SLO_MS = float(os.getenv("FIRST_WORD_SLO_MS", "3000"))
+
+# Per-phase SLOs on the time spent in each phase, e.g. "bot_started=500,llm_first_token=800"
+FIRST_WORD_PHASE_SLOS = {
+    TOTAL: FIRST_WORD_SLO_MS / 1000,
+    **parse_slos(os.getenv("FIRST_WORD_PHASE_SLOS", "")),
+}
+
+
+class SessionTimeline:
+    """Wall-clock timestamps of the phases before a session's first word."""
+
+    def __init__(self, session_id: str, level: Optional[int] = None):
+        self.session_id = session_id
+        self.level = level
+        self.marks: Dict[str, float] = {}
+
+    @classmethod
+    def from_custom_data(
+        cls, session_id: str, level: int, custom_data: Optional[Dict[str, Any]]
+    ) -> "SessionTimeline":
+        """Continue the timeline the server passed in custom_data, if any."""
+        timeline = cls(session_id, level)
+        marks = (custom_data or {}).get("timeline")
+        if isinstance(marks, dict):
+            timeline.marks.update(
+                {phase: float(at) for phase, at in marks.items() if phase in PHASES}
+            )
+        return timeline
+
+    def mark(self, phase: str, at: Optional[float] = None):
+        """Stamp a phase, unless it has been stamped already."""
+        self.marks.setdefault(phase, time.time() if at is None else at)
+
+    def to_custom_data(self, custom_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Get a copy of custom_data carrying the session ID and timeline."""
+        return {**(custom_data or {}), "session_id": self.session_id, "timeline": dict(self.marks)}
+
+    def durations(self) -> Dict[str, float]:
+        """Get the seconds spent in each stamped phase, and in total."""
+        durations = {}
+        previous = None
+        for phase in PHASES:
+            if phase not in self.marks:
+                continue
+            if previous is not None:
+                durations[phase] = self.marks[phase] - previous
+            previous = self.marks[phase]
+        if self.marks and "bot_first_audio" in self.marks:
+            durations[TOTAL] = self.marks["bot_first_audio"] - min(self.marks.values())
+        return durations
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "level": self.level,
+            "marks": dict(self.marks),
+            "durations": self.durations(),
+        }
+
+
+class TimelineStats:
+    """Phase duration histograms and SLO breach counters per level."""
+
+    def __init__(self, slos: Dict[str, float] = FIRST_WORD_PHASE_SLOS):
+        self.slos = slos
+        self._histograms: Dict[Tuple[int, str], LatencyHistogram] = {}
+        self._breaches: Dict[Tuple[int, str], int] = {}
+
+    def record(self, timeline: SessionTimeline) -> List[str]:
+        """Add a finished timeline.
+
+        Returns:
+            The phases that breached their SLO.
+        """
+        breached = []
+        for phase, seconds in timeline.durations().items():
+            key = (timeline.level, phase)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            # Clocks of different hosts can be slightly apart
+            histogram.record(max(0.0, seconds))
+            slo = self.slos.get(phase)
+            if slo is not None and seconds > slo:
+                self._breaches[key] = self._breaches.get(key, 0) + 1
+                breached.append(phase)
+        return breached
+
+    def histograms_to_list(self) -> List[Dict[str, Any]]:
+        """Get the phase histograms as JSON, for reporting to the server."""
+        return [
+            {"level": level, "phase": phase, "histogram": histogram.to_dict()}
+            for (level, phase), histogram in sorted(self._histograms.items())
+        ]
+
+    def breaches_to_list(self) -> List[Dict[str, Any]]:
+        """Get the SLO breach counters as JSON, for reporting to the server."""
+        return [
+            {"level": level, "phase": phase, "value": count}
+            for (level, phase), count in sorted(self._breaches.items())
+        ]
+
+
+timelines = TimelineStats()
+
+
+class TimelineObserver(BaseObserver):
+    """Stamps the greeting's phases and reports the timeline at the first audio."""
+
+    def __init__(
+        self,
+        timeline: SessionTimeline,
+        *,
+        llm: FrameProcessor,
+        tts: FrameProcessor,
+        output: FrameProcessor,
+        stats: TimelineStats = timelines,
+    ):
+        self.timeline = timeline
+        self._llm = llm
+        self._tts = tts
+        self._output = output
+        self._stats = stats
+        self._finished = False
+
+    def _finish(self):
+        self._finished = True
+        breached = self._stats.record(self.timeline)
+        record = self.timeline.to_dict()
+        total = record["durations"].get(TOTAL, 0.0)
+        log = logger.bind(session_timeline=record)
+        if breached:
+            log.warning(f"Time to first word {total * 1000:.0f} ms, SLO breached: {', '.join(breached)}")
+        else:
+            log.info(f"Time to first word {total * 1000:.0f} ms")
+
+    async def on_push_frame(
+        self,
+        src: FrameProcessor,
+        dst: FrameProcessor,
+        frame: Any,
+        direction: FrameDirection,
+        timestamp: int,
+    ):
+        if self._finished or direction != FrameDirection.DOWNSTREAM:
+            return
+        if isinstance(frame, LLMTextFrame) and src is self._llm:
+            self.timeline.mark("llm_first_token")
+        elif isinstance(frame, TTSAudioRawFrame) and src is self._tts:
+            self.timeline.mark("tts_first_audio")
+        elif isinstance(frame, BotStartedSpeakingFrame) and src is self._output:
+            self.timeline.mark("bot_first_audio")
+            self._finish()
@@ -0,0 +1,148 @@
+"""Sampling and payload policies for traced ops.
+
+Every op traced with `@traced()` gets a TracePolicy:
+
+- rate: fraction of calls, or sessions, that are traced.
+- errors: trace calls that raise even when they were not sampled.
+- sampling: "call" decides per call. "head" decides once when a trace root,
+  e.g. a bot session's main(), starts, and its children follow. "tail" decides
+  when the root finishes, and keeps the whole trace if any call in it failed.
+- payload: "full" logs inputs and outputs. "metadata" replaces everything but
+  short scalars with a type and size summary, e.g. no audio. "none" logs
+  neither.
+- max_bytes: strings and bytes longer than this are summarized even with
+  "full" payloads. 0 disables the cap.
+
+Defaults come from TRACE_SAMPLE_RATE, TRACE_ERRORS, TRACE_SAMPLING,
+TRACE_PAYLOAD and TRACE_MAX_PAYLOAD_BYTES. TRACE_POLICY overrides them per op:
+
+    TRACE_POLICY="get_status:rate=0.01;save_audio:payload=metadata,max_bytes=4096"
+"""
+
+import os
+import random
+import wave
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict
+
+SAMPLING_MODES = ("call", "head", "tail")
+PAYLOAD_MODES = ("full", "metadata", "none")
+
+# Longest string kept as is in "metadata" payloads
+METADATA_STRING_LENGTH = 256
+
+
+@dataclass(frozen=True)
+class TracePolicy:
+    """How an op is sampled and how much of its payload is logged."""
+
+    rate: float = 1.0
+    errors: bool = True
+    sampling: str = "call"
+    payload: str = "full"
+    max_bytes: int = 0
+
+    def __post_init__(self):
+        if not 0 <= self.rate <= 1:
+            raise ValueError(f"Trace sample rate must be between 0 and 1, got {self.rate}")
+        if self.sampling not in SAMPLING_MODES:
+            raise ValueError(f"Invalid trace sampling: {self.sampling}. Must be one of {SAMPLING_MODES}")
+        if self.payload not in PAYLOAD_MODES:
+            raise ValueError(f"Invalid trace payload: {self.payload}. Must be one of {PAYLOAD_MODES}")
+
+    def sample(self) -> bool:
+        return self.rate >= 1 or random.random() < self.rate
+
+    def reduce(self, value: Any) -> Any:
+        """Reduce an input or output according to the payload policy."""
+        if self.payload == "none":
+            return None
+        if isinstance(value, dict):
+            return {key: self.reduce(item) for key, item in value.items()}
+        if self.payload == "metadata":
+            return _metadata(value)
+        if self.max_bytes and isinstance(value, (str, bytes, bytearray)) and len(value) > self.max_bytes:
+            return _metadata(value)
+        return value
+
+
+def _metadata(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str) and len(value) <= METADATA_STRING_LENGTH:
+        return value
+    if isinstance(value, (list, tuple)) and all(
+        item is None or isinstance(item, (bool, int, float)) for item in value
+    ):
+        return value
+
+    summary: Dict[str, Any] = {"type": type(value).__name__}
+    if isinstance(value, wave.Wave_read):
+        summary["frames"] = value.getnframes()
+        summary["sample_rate"] = value.getframerate()
+        summary["channels"] = value.getnchannels()
+    elif hasattr(value, "size") and isinstance(getattr(value, "size"), int):
+        summary["size"] = value.size
+    elif hasattr(value, "__len__"):
+        try:
+            summary["size"] = len(value)
+        except TypeError:
+            pass
+    return summary
+
+
+def _parse_value(name: str, value: str) -> Any:
+    if name == "rate":
+        return float(value)
+    if name == "max_bytes":
+        return int(value)
+    if name == "errors":
+        return value.lower() in ("1", "true", "yes")
+    return value.lower()
+
+
+def _parse_settings(text: str) -> Dict[str, Any]:
+    names = {f.name for f in fields(TracePolicy)}
+    settings = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in names:
+            raise ValueError(f"Unknown trace policy setting: {name}. Must be one of {sorted(names)}")
+        settings[name] = _parse_value(name, value.strip())
+    return settings
+
+
+def parse_policies(text: str, default: TracePolicy) -> Dict[str, TracePolicy]:
+    """Parse per-op policies, e.g. "get_status:rate=0.01;save_audio:payload=metadata".
+
+    Raises:
+        ValueError: If the text is malformed
+    """
+    policies = {}
+    for entry in text.split(";"):
+        if not entry.strip():
+            continue
+        op_name, separator, settings = entry.partition(":")
+        if not separator:
+            raise ValueError(f"Invalid TRACE_POLICY entry: {entry!r}. Expected 'op:key=value,...'")
+        policies[op_name.strip()] = replace(default, **_parse_settings(settings))
+    return policies
+
+
+DEFAULT_POLICY = TracePolicy(
+    rate=float(os.getenv("TRACE_SAMPLE_RATE", "1")),
+    errors=os.getenv("TRACE_ERRORS", "true").lower() in ("1", "true", "yes"),
+    sampling=os.getenv("TRACE_SAMPLING", "call").lower(),
+    payload=os.getenv("TRACE_PAYLOAD", "full").lower(),
+    max_bytes=int(os.getenv("TRACE_MAX_PAYLOAD_BYTES", "0")),
+)
+
+OP_POLICIES = parse_policies(os.getenv("TRACE_POLICY", ""), DEFAULT_POLICY)
+
+
+def get_policy(op_name: str) -> TracePolicy:
+    """Get the policy of an op, falling back to the defaults."""
+    return OP_POLICIES.get(op_name, DEFAULT_POLICY)
@@ -0,0 +1,656 @@
+"""Durable local spool for trace records.
+
+The trace exporter writes records to an append-only spool on local disk before
+anything goes over the network. A TraceUploader thread drains the spool to a
+sink, Weave by default, and retries with exponential backoff while the backend
+is slow or down. Until then the spool keeps growing, up to
+TRACE_SPOOL_MAX_BYTES, after which the oldest segments are evicted. Sessions
+never wait on the tracing backend.
+
+Each process spools into its own subdirectory of TRACE_SPOOL_DIR, holding:
+
+- Segments `<seq>.jsonl`, one JSON record per line, rotated every
+  TRACE_SPOOL_SEGMENT_BYTES.
+- Payloads that aren't JSON, such as audio, stored next to their segment as
+  `<seq>-<n>.<ext>` files and referenced from the record.
+- A `cursor` file with the segment and offset of the first record that hasn't
+  been uploaded yet.
+
+A spool left behind by a process that exited, or crashed, is uploaded with:
+
+    python trace_spool.py replay --project starter-challenge/level0
+"""
+
+import argparse
+import base64
+import datetime
+import fcntl
+import glob
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import wave
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+import weave
+from loguru import logger
+from weave.trace.call import Call
+
+# Directory holding a spool per process
+TRACE_SPOOL_DIR = os.getenv(
+    "TRACE_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "trace-spool")
+)
+
+# Size of a process's spool, payload files included, before the oldest
+# segments are evicted
+TRACE_SPOOL_MAX_BYTES = int(os.getenv("TRACE_SPOOL_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Size at which the current segment is closed and a new one started
+TRACE_SPOOL_SEGMENT_BYTES = int(os.getenv("TRACE_SPOOL_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+
+# Upload spooled records to this URL as JSON instead of to Weave
+TRACE_UPLOAD_URL = os.getenv("TRACE_UPLOAD_URL", "")
+
+# Seconds before an upload request times out
+TRACE_UPLOAD_TIMEOUT = float(os.getenv("TRACE_UPLOAD_TIMEOUT", "10"))
+
+# Records uploaded per request
+TRACE_UPLOAD_BATCH_SIZE = 100
+
+# First and longest wait in seconds between failed uploads
+TRACE_UPLOAD_BACKOFF = 1.0
+TRACE_UPLOAD_MAX_BACKOFF = 60.0
+
+# Seconds to wait for new records when the spool is drained
+TRACE_UPLOAD_INTERVAL = 1.0
+
+# Key marking a payload stored in a file next to its segment
+FILE_KEY = "__spool_file__"
+
+SEGMENT_SUFFIX = ".jsonl"
+
+# Held while weave.init() runs, so it never runs twice at once
+weave_init_lock = threading.Lock()
+
+# Settings of weave.init(). Weave doesn't patch the libraries it integrates
+# with, whose calls would go straight to its client rather than through the
+# exporter; context_logging.py traces OpenAI's through it instead.
+WEAVE_SETTINGS = {"implicitly_patch_integrations": False}
+
+# Frames copied at a time when spooling WAV audio
+WAVE_BLOCK_FRAMES = 48000
+
+
+class TraceSpool:
+    """An append-only, segmented record log on local disk.
+
+    Thread-safe; the exporter appends while the uploader reads and commits.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = TRACE_SPOOL_MAX_BYTES,
+        segment_bytes: int = TRACE_SPOOL_SEGMENT_BYTES,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        # Held for the spool's lifetime so replay skips spools still in use
+        self._lock_file = open(os.path.join(directory, "lock"), "w")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        self._lock = threading.Lock()
+        self._cursor = self._read_cursor()
+        segments = self._segments()
+        # Never append to a segment left by an earlier process, its last line
+        # may be incomplete
+        self._active = (segments[-1] + 1) if segments else 0
+        self._active_file = None
+        self._active_size = 0
+        self._files = 0
+        # Bytes of segments and payload files, kept up to date instead of
+        # listing the directory on every append
+        self.size = sum(os.path.getsize(path) for path in self._data_files())
+
+        self.appended = 0
+        self.evicted = 0
+
+    def _data_files(self, pattern: str = "[0-9]*") -> List[str]:
+        return glob.glob(os.path.join(self.directory, pattern))
+
+    def _segments(self) -> List[int]:
+        names = glob.glob(os.path.join(self.directory, f"*{SEGMENT_SUFFIX}"))
+        return sorted(int(os.path.basename(name)[: -len(SEGMENT_SUFFIX)]) for name in names)
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:010d}{SEGMENT_SUFFIX}")
+
+    def _read_cursor(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, "cursor")) as f:
+                seq, offset = f.read().split()
+                return int(seq), int(offset)
+        except (OSError, ValueError):
+            return 0, 0
+
+    def _write_cursor(self):
+        path = os.path.join(self.directory, "cursor")
+        with open(path + ".tmp", "w") as f:
+            f.write(f"{self._cursor[0]} {self._cursor[1]}")
+        os.replace(path + ".tmp", path)
+
+    def reserve_file(self, extension: str) -> str:
+        """Name a new payload file next to the current segment.
+
+        Call `add_file()` once it has been written.
+
+        Returns:
+            The file name, relative to the spool directory.
+        """
+        with self._lock:
+            name = f"{self._active:010d}-{self._files}.{extension}"
+            self._files += 1
+        return name
+
+    def add_file(self, name: str):
+        with self._lock:
+            self.size += os.path.getsize(os.path.join(self.directory, name))
+
+    def write_file(self, data: bytes, extension: str) -> str:
+        """Store a payload next to the current segment.
+
+        Returns:
+            The file name, relative to the spool directory.
+        """
+        name = self.reserve_file(extension)
+        with open(os.path.join(self.directory, name), "wb") as f:
+            f.write(data)
+        self.add_file(name)
+        return name
+
+    def append(self, entries: List[Dict[str, Any]]):
+        """Append records to the spool, evicting old segments if it is full."""
+        lines = "".join(json.dumps(entry) + "\n" for entry in entries).encode()
+        with self._lock:
+            if self._active_file is None:
+                self._active_file = open(self._segment_path(self._active), "ab")
+            self._active_file.write(lines)
+            self._active_file.flush()
+            self._active_size += len(lines)
+            self.size += len(lines)
+            self.appended += len(entries)
+            if self._active_size >= self.segment_bytes:
+                self._rotate()
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def _rotate(self):
+        os.fsync(self._active_file.fileno())
+        self._active_file.close()
+        self._active_file = None
+        self._active += 1
+        self._active_size = 0
+        self._files = 0
+
+    def read(self, max_records: int) -> Tuple[List[Dict[str, Any]], Tuple[int, int]]:
+        """Read records that haven't been committed yet.
+
+        Returns:
+            Up to `max_records` records, and the position to commit once they
+            have been uploaded.
+        """
+        entries: List[Dict[str, Any]] = []
+        with self._lock:
+            seq, offset = self._cursor
+            for segment in self._segments():
+                if segment < seq:
+                    continue
+                if segment > seq:
+                    seq, offset = segment, 0
+                with open(self._segment_path(segment), "rb") as f:
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            # Still being written, or cut short by a crash
+                            break
+                        offset += len(line)
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            logger.warning(f"Skipping corrupt trace record in {self._segment_path(segment)}")
+                        if len(entries) >= max_records:
+                            return entries, (seq, offset)
+                if segment == self._active:
+                    break
+        return entries, (seq, offset)
+
+    def commit(self, position: Tuple[int, int]):
+        """Mark records up to `position` as uploaded and remove finished segments."""
+        with self._lock:
+            self._cursor = position
+            self._write_cursor()
+            for segment in self._segments():
+                if segment >= position[0] or segment == self._active:
+                    break
+                self._remove_segment(segment)
+
+    def evict(self):
+        """Remove the oldest segments until the spool fits in `max_bytes`."""
+        with self._lock:
+            while self.size > self.max_bytes:
+                segments = [s for s in self._segments() if s != self._active]
+                if not segments:
+                    return
+                oldest = segments[0]
+                with open(self._segment_path(oldest), "rb") as f:
+                    evicted = sum(1 for _ in f)
+                if oldest == self._cursor[0]:
+                    # Part of the segment may already have been uploaded
+                    with open(self._segment_path(oldest), "rb") as f:
+                        f.seek(self._cursor[1])
+                        evicted = sum(1 for _ in f)
+                if oldest >= self._cursor[0]:
+                    self.evicted += evicted
+                    logger.warning(f"Trace spool full, evicted {evicted} records")
+                self._remove_segment(oldest)
+                self._cursor = max(self._cursor, (oldest + 1, 0))
+                self._write_cursor()
+
+    def _remove_segment(self, seq: int):
+        for path in [self._segment_path(seq)] + self._data_files(f"{seq:010d}-*"):
+            self.size -= os.path.getsize(path)
+            os.remove(path)
+
+    def pending(self) -> int:
+        """Count the records that haven't been uploaded yet."""
+        entries, _ = self.read(1 << 62)
+        return len(entries)
+
+    def close(self):
+        with self._lock:
+            if self._active_file is not None:
+                self._rotate()
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+
+    def remove(self):
+        """Close the spool and remove its directory."""
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "bytes": self.size,
+            "segments": len(self._segments()),
+            "appended": self.appended,
+            "evicted": self.evicted,
+        }
+
+
+def encode_value(value: Any, spool: TraceSpool) -> Any:
+    """Make a payload JSON-serializable, storing audio and bytes in spool files."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, dict):
+        return {str(key): encode_value(item, spool) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item, spool) for item in value]
+    if isinstance(value, (bytes, bytearray)):
+        return {FILE_KEY: spool.write_file(bytes(value), "bin"), "type": "bytes"}
+    if isinstance(value, wave.Wave_read):
+        name = spool.reserve_file("wav")
+        value.rewind()
+        with wave.open(os.path.join(spool.directory, name), "wb") as out:
+            out.setparams(value.getparams())
+            while frames := value.readframes(WAVE_BLOCK_FRAMES):
+                out.writeframesraw(frames)
+        spool.add_file(name)
+        return {FILE_KEY: name, "type": "wav"}
+    if isinstance(value, weave.Content):
+        extension = value.extension or "bin"
+        return {
+            FILE_KEY: spool.write_file(value.data, extension.lstrip(".")),
+            "type": "content",
+            "mimetype": value.mimetype,
+        }
+    return repr(value)
+
+
+def encode_record(record: Any, spool: TraceSpool) -> Dict[str, Any]:
+    """Convert a TraceRecord into a spool record."""
+    return {
+        "kind": record.kind,
+        "call_id": record.call_id,
+        "op_name": record.op_name,
+        "parent_id": record.parent_id,
+        "trace_id": record.trace_id,
+        "inputs": encode_value(record.policy.reduce(record.inputs or {}) or {}, spool),
+        "output": encode_value(record.policy.reduce(record.output), spool),
+        "exception": repr(record.exception) if record.exception is not None else None,
+        "timestamp": record.timestamp.isoformat(),
+        "started_at": record.started_at.isoformat() if record.started_at else None,
+    }
+
+
+class WeaveSink:
+    """Uploads spooled records to Weave.
+
+    Checks that the trace server answers before replaying a batch, so an
+    outage fails the upload and the records stay in the spool. Initializes
+    Weave itself if it wasn't reachable when the process started.
+
+    A batch that fails is uploaded again, so uploading is idempotent: a call
+    already created isn't created again, and calls are only forgotten once
+    their end was flushed. A call whose start was uploaded by another process,
+    e.g. before a crash and `replay`, is finished from the end record's own
+    IDs and start time.
+    """
+
+    def __init__(self, project: Optional[str] = None, timeout: float = TRACE_UPLOAD_TIMEOUT):
+        self.project = project
+        self.timeout = timeout
+        # Calls created, until their end is flushed: {call_id: Call}
+        self._calls: Dict[str, Any] = {}
+
+    def _client(self):
+        client = weave.get_client()
+        if client is None:
+            if not self.project:
+                raise RuntimeError("Weave is not initialized")
+            if not weave_init_lock.acquire(blocking=False):
+                raise RuntimeError("weave.init() is still running")
+            try:
+                client = weave.init(self.project, settings=WEAVE_SETTINGS)
+            finally:
+                weave_init_lock.release()
+        return client
+
+    def _check_server(self):
+        from weave.trace.env import weave_trace_server_url
+
+        response = requests.get(f"{weave_trace_server_url()}/server_info", timeout=self.timeout)
+        response.raise_for_status()
+
+    def _decode(self, value: Any, directory: str, opened: List[Any]) -> Any:
+        if isinstance(value, list):
+            return [self._decode(item, directory, opened) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if FILE_KEY not in value:
+            return {key: self._decode(item, directory, opened) for key, item in value.items()}
+
+        path = os.path.join(directory, value[FILE_KEY])
+        if value["type"] == "wav":
+            audio = wave.open(path, "rb")
+            opened.append(audio)
+            return audio
+        if value["type"] == "content":
+            return weave.Content.from_path(path, mimetype=value["mimetype"])
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _call(self, client: Any, entry: Dict[str, Any], call_id: Optional[str]) -> Any:
+        """Get a created call, or rebuild it from a record's IDs.
+
+        Args:
+            client: The Weave client.
+            entry: A record of the call, or of one of its children.
+            call_id: The call's ID.
+        """
+        call = self._calls.get(call_id)
+        if call is not None or call_id is None:
+            return call
+        is_own = entry["call_id"] == call_id
+        started_at = entry.get("started_at") if is_own else None
+        return Call(
+            _op_name=entry["op_name"] if is_own else "",
+            trace_id=entry["trace_id"] or call_id,
+            project_id=client.project_id,
+            parent_id=entry["parent_id"] if is_own else None,
+            inputs={},
+            id=call_id,
+            started_at=datetime.datetime.fromisoformat(started_at or entry["timestamp"]),
+        )
+
+    def upload(self, entries: List[Dict[str, Any]], directory: str):
+        self._check_server()
+        client = self._client()
+        opened: List[Any] = []
+        finished: List[str] = []
+        try:
+            for entry in entries:
+                timestamp = datetime.datetime.fromisoformat(entry["timestamp"])
+                if entry["kind"] == "start":
+                    if entry["call_id"] in self._calls:
+                        # Created by an earlier attempt at this batch
+                        continue
+                    self._calls[entry["call_id"]] = client.create_call(
+                        entry["op_name"],
+                        self._decode(entry["inputs"], directory, opened),
+                        parent=self._call(client, entry, entry["parent_id"]),
+                        use_stack=False,
+                        _call_id_override=entry["call_id"],
+                        started_at=timestamp,
+                    )
+                    continue
+                exception = entry["exception"]
+                client.finish_call(
+                    self._call(client, entry, entry["call_id"]),
+                    self._decode(entry["output"], directory, opened),
+                    exception=Exception(exception) if exception else None,
+                    ended_at=timestamp,
+                )
+                finished.append(entry["call_id"])
+            # Payload files are removed once the records are committed
+            client.flush()
+        finally:
+            for audio in opened:
+                audio.close()
+        for call_id in finished:
+            self._calls.pop(call_id, None)
+
+
+class HttpSink:
+    """Posts spooled records as JSON to a URL, payload files inlined as base64."""
+
+    def __init__(self, url: str, timeout: float = TRACE_UPLOAD_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def _inline(self, value: Any, directory: str) -> Any:
+        if isinstance(value, list):
+            return [self._inline(item, directory) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if FILE_KEY not in value:
+            return {key: self._inline(item, directory) for key, item in value.items()}
+        with open(os.path.join(directory, value[FILE_KEY]), "rb") as f:
+            data = base64.b64encode(f.read()).decode()
+        return {**{k: v for k, v in value.items() if k != FILE_KEY}, "data": data}
+
+    def upload(self, entries: List[Dict[str, Any]], directory: str):
+        response = self._session.post(
+            self.url,
+            json={"records": [self._inline(entry, directory) for entry in entries]},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
+
+def default_sink(project: Optional[str] = None):
+    return HttpSink(TRACE_UPLOAD_URL) if TRACE_UPLOAD_URL else WeaveSink(project)
+
+
+class TraceUploader:
+    """Drains a spool to a sink from a background thread, backing off on failures."""
+
+    def __init__(
+        self,
+        spool: TraceSpool,
+        sink: Any,
+        batch_size: int = TRACE_UPLOAD_BATCH_SIZE,
+        backoff: float = TRACE_UPLOAD_BACKOFF,
+        max_backoff: float = TRACE_UPLOAD_MAX_BACKOFF,
+        interval: float = TRACE_UPLOAD_INTERVAL,
+    ):
+        self.spool = spool
+        self.sink = sink
+        self.batch_size = batch_size
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.interval = interval
+
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.uploaded = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-upload", daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        """Wake the uploader after records were appended."""
+        self._wake.set()
+
+    def upload_once(self) -> int:
+        """Upload one batch.
+
+        Returns:
+            The number of records uploaded.
+
+        Raises:
+            Exception: Whatever the sink raised; the batch stays in the spool.
+        """
+        entries, position = self.spool.read(self.batch_size)
+        if entries:
+            self.sink.upload(entries, self.spool.directory)
+        self.spool.commit(position)
+        self.uploaded += len(entries)
+        return len(entries)
+
+    def _run(self):
+        delay = self.backoff
+        while not self._stopping.is_set():
+            try:
+                uploaded = self.upload_once()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                logger.warning(f"Trace upload failed, retrying in {delay:.1f}s: {e}")
+                # Jitter keeps many workers from retrying in lockstep
+                self._stopping.wait(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, self.max_backoff)
+                continue
+            delay = self.backoff
+            if uploaded < self.batch_size:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+
+    def stop(self, timeout: float):
+        """Try to upload what is left within `timeout` seconds, then stop.
+
+        Whatever isn't uploaded stays in the spool for `replay`.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # Stuck in an upload, leave the rest in the spool
+            return
+        self._thread = None
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline and self.upload_once():
+                pass
+        except Exception as e:
+            logger.warning(f"Leaving {self.spool.pending()} trace records in {self.spool.directory}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.spool.stats(),
+            "uploaded": self.uploaded,
+            "upload_failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+def process_spool_dir(root: str = TRACE_SPOOL_DIR) -> str:
+    return os.path.join(root, str(os.getpid()))
+
+
+def replay(root: str, sink: Any) -> int:
+    """Upload every spool under `root` that no running process holds.
+
+    Returns:
+        The number of records uploaded.
+    """
+    total = 0
+    for directory in sorted(glob.glob(os.path.join(root, "*"))):
+        if not os.path.isdir(directory):
+            continue
+        try:
+            spool = TraceSpool(directory)
+        except BlockingIOError:
+            logger.info(f"Skipping {directory}, still in use")
+            continue
+        uploader = TraceUploader(spool, sink)
+        uploaded = 0
+        try:
+            while True:
+                count = uploader.upload_once()
+                if not count:
+                    break
+                uploaded += count
+        except Exception as e:
+            # What's left stays in the spool for the next replay
+            logger.warning(f"Replaying {directory} failed after {uploaded} trace records: {e}")
+            total += uploaded
+            spool.close()
+            continue
+        logger.info(f"Replayed {uploaded} trace records from {directory}")
+        total += uploaded
+        spool.remove()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trace spool tools")
+    parser.add_argument("command", choices=["replay", "stats"])
+    parser.add_argument("--dir", default=TRACE_SPOOL_DIR, help="Spool directory")
+    parser.add_argument("--project", help="Weave project to replay into")
+    parser.add_argument("--url", default=TRACE_UPLOAD_URL, help="Replay to this URL instead of Weave")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        for directory in sorted(glob.glob(os.path.join(args.dir, "*"))):
+            try:
+                spool = TraceSpool(directory)
+            except BlockingIOError:
+                print(f"{directory}: in use")
+                continue
+            print(f"{directory}: {spool.pending()} pending, {spool.size} bytes")
+            spool.close()
+        return
+
+    sink = HttpSink(args.url) if args.url else WeaveSink(args.project)
+    print(f"Replayed {replay(args.dir, sink)} trace records")
+
+
+if __name__ == "__main__":
+    main()
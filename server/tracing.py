@@ -0,0 +1,593 @@
+"""Asynchronous trace export.
+
+`@weave.op()` captures, serializes and hands off every call on the thread that
+makes it, which for the bot is the event loop moving real-time audio. Ops
+decorated with `@traced()` instead put a small record on a bounded queue and
+return; a background thread drains the queue in batches and appends the
+records to a durable spool on local disk (trace_spool), from which an uploader
+thread creates and finishes the Weave calls, retrying while the backend is
+slow or unreachable.
+
+When the queue is full, new records are dropped or, with
+TRACE_QUEUE_POLICY=spill, appended to a local JSON-lines file with their
+payloads reduced to short summaries. Records that wait longer than
+TRACE_DELAY_THRESHOLD seconds in the queue are counted as delayed, and the time
+each op spends on tracing on the caller's side is recorded per op.
+
+Call IDs are generated when the call starts, so trace_url() can link to the
+current call right away; it also keeps the call, so the link leads somewhere
+even if sampling would have left the call out. Use init() instead of weave.init(), so a backend
+that is down when the process starts doesn't stop it from starting, or tracing.
+
+Which calls are exported, and how much of their inputs and outputs, follows
+each op's TracePolicy from trace_policy. Calls that are not sampled cost a
+context variable and a random number on the caller's side. With tail sampling
+the exporter holds a trace's records until its root call finishes, and only
+exports them if the trace was sampled or one of its calls failed.
+"""
+
+import asyncio
+import atexit
+import datetime
+import functools
+import inspect
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import weave
+from loguru import logger
+from weave.shared.ids import generate_id
+
+from stats import LatencyWindow
+from trace_policy import DEFAULT_POLICY, TracePolicy, get_policy
+from trace_spool import (
+    WEAVE_SETTINGS,
+    TraceSpool,
+    TraceUploader,
+    default_sink,
+    encode_record,
+    process_spool_dir,
+    weave_init_lock,
+)
+
+# Maximum number of trace records waiting to be exported
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "1024"))
+
+# What to do with new records when the queue is full: "drop" or "spill"
+TRACE_QUEUE_POLICY = os.getenv("TRACE_QUEUE_POLICY", "drop").lower().strip()
+
+# File that spilled records are appended to
+TRACE_SPILL_PATH = os.getenv(
+    "TRACE_SPILL_PATH", os.path.join(tempfile.gettempdir(), "trace-spill.jsonl")
+)
+
+# Records exported per batch, and seconds to wait for a batch to fill up
+TRACE_BATCH_SIZE = 64
+TRACE_FLUSH_INTERVAL = 0.5
+
+# Records waiting in the queue for longer than this many seconds count as delayed
+TRACE_DELAY_THRESHOLD = float(os.getenv("TRACE_DELAY_THRESHOLD", "2"))
+
+# Seconds to keep exporting queued records when the process exits
+TRACE_EXIT_TIMEOUT = 5.0
+
+# Seconds init() waits for weave.init() before carrying on without it
+TRACE_INIT_TIMEOUT = float(os.getenv("TRACE_INIT_TIMEOUT", "10"))
+
+# Longest repr of a payload value kept in a spilled record
+SPILL_VALUE_LENGTH = 200
+
+# Most records held for a trace waiting on its tail sampling decision. Longer
+# traces are dropped instead of growing without bound.
+TRACE_TAIL_MAX_RECORDS = int(os.getenv("TRACE_TAIL_MAX_RECORDS", "10000"))
+
+
+@dataclass
+class TraceCall:
+    """A call traced through the exporter."""
+
+    id: str
+    op_name: str
+    project_id: Optional[str] = None
+    # The trace's root in Weave: the outermost exported call above this one.
+    # A call without an exported parent is a root itself.
+    trace_id: Optional[str] = None
+    # The parent, if it's exported
+    parent_id: Optional[str] = None
+    # Whether the call is exported, and the sampling mode of its trace's root
+    sampled: bool = True
+    sampling: str = "call"
+    # The root of a head or tail sampled trace, which decides for the whole trace
+    root: Optional["TraceCall"] = None
+    # Builds the start record of a call that wasn't sampled, in case it's kept
+    pending_start: Optional[Callable[[], "TraceRecord"]] = None
+    started_at: datetime.datetime = field(
+        default_factory=lambda: datetime.datetime.now(tz=datetime.timezone.utc)
+    )
+
+
+@dataclass
+class TraceRecord:
+    """The start or the end of a traced call."""
+
+    kind: str
+    call_id: str
+    op_name: str
+    parent_id: Optional[str] = None
+    inputs: Optional[Dict[str, Any]] = None
+    output: Any = None
+    exception: Optional[BaseException] = None
+    trace_id: Optional[str] = None
+    sampling: str = "call"
+    policy: TracePolicy = DEFAULT_POLICY
+    # On the end record of a tail-sampled root: whether the trace was sampled
+    keep: bool = True
+    # On end records, so the call can be finished without its start record
+    started_at: Optional[datetime.datetime] = None
+    timestamp: datetime.datetime = field(
+        default_factory=lambda: datetime.datetime.now(tz=datetime.timezone.utc)
+    )
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    def summary(self) -> Dict[str, Any]:
+        """Get a JSON-serializable version with payloads reduced to short reprs."""
+
+        def short(value: Any) -> str:
+            text = repr(value)
+            if len(text) > SPILL_VALUE_LENGTH:
+                text = text[:SPILL_VALUE_LENGTH] + "..."
+            return text
+
+        return {
+            "kind": self.kind,
+            "call_id": self.call_id,
+            "op_name": self.op_name,
+            "parent_id": self.parent_id,
+            "inputs": {k: short(v) for k, v in (self.inputs or {}).items()},
+            "output": short(self.output) if self.kind == "end" else None,
+            "exception": short(self.exception) if self.exception else None,
+            "timestamp": self.timestamp.isoformat(),
+        }
+
+
+_current_call: ContextVar[Optional[TraceCall]] = ContextVar("current_trace_call", default=None)
+
+
+def current_call() -> Optional[TraceCall]:
+    """Get the innermost call traced with @traced() in the current context."""
+    return _current_call.get()
+
+
+def keep(call: TraceCall) -> bool:
+    """Export a call, and the rest of its trace from now on, even if it wasn't sampled.
+
+    A tail sampled trace is kept as a whole once its root finishes. A call
+    that was left out is exported from its start, without its parent unless
+    the parent was exported.
+
+    Returns:
+        Whether the call is exported, False if its start record couldn't be queued.
+    """
+    if call.sampling == "tail":
+        (call.root or call).sampled = True
+        return True
+    if call.sampled:
+        return True
+    if call.pending_start is None:
+        return False
+    record, call.pending_start = call.pending_start(), None
+    if not exporter.submit(record):
+        return False
+    call.sampled = True
+    return True
+
+
+def trace_url() -> Optional[str]:
+    """Keep the current call and get its URL in Weave.
+
+    Returns:
+        The URL, or None without a traced call or a Weave project, or if the
+        call can't be exported.
+    """
+    call = current_call()
+    if call is None:
+        return None
+    # weave.init() may have finished after the call started
+    project_id = call.project_id or _project_id()
+    if project_id is None or not keep(call):
+        return None
+    return f"https://wandb.ai/{project_id}/r/call/{call.id}"
+
+
+class TraceExporter:
+    """Spools trace records from a background thread and uploads them from another."""
+
+    def __init__(
+        self,
+        queue_size: int = TRACE_QUEUE_SIZE,
+        policy: str = TRACE_QUEUE_POLICY,
+        spill_path: str = TRACE_SPILL_PATH,
+        batch_size: int = TRACE_BATCH_SIZE,
+        flush_interval: float = TRACE_FLUSH_INTERVAL,
+        delay_threshold: float = TRACE_DELAY_THRESHOLD,
+        spool_dir: Optional[str] = None,
+        sink: Any = None,
+    ):
+        if policy not in ("drop", "spill"):
+            raise ValueError(f"Invalid TRACE_QUEUE_POLICY: {policy}. Must be 'drop' or 'spill'")
+        self.policy = policy
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.delay_threshold = delay_threshold
+        self.spool_dir = spool_dir
+        self.sink = sink
+        # Weave project set by init(), even if Weave wasn't reachable
+        self.project: Optional[str] = None
+
+        self._queue: "queue.Queue[Optional[TraceRecord]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._spool: Optional[TraceSpool] = None
+        self._uploader: Optional[TraceUploader] = None
+        # Records of tail-sampled traces whose root hasn't finished: {trace_id: [TraceRecord]}
+        self._tail: Dict[str, List[TraceRecord]] = {}
+        # Tail-sampled traces that grew past TRACE_TAIL_MAX_RECORDS
+        self._overflowed: set = set()
+
+        self.enqueued = 0
+        self.exported = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.delayed = 0
+        self.failed = 0
+        self.sampled_out = 0
+        self.overhead: Dict[str, LatencyWindow] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.project is not None or weave.get_client() is not None
+
+    def submit(self, record: TraceRecord) -> bool:
+        """Queue a record for export without blocking.
+
+        Returns:
+            Whether the record was queued.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            if self.policy == "spill":
+                self._spill(record)
+            else:
+                self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def record_overhead(self, op_name: str, seconds: float):
+        """Record the time an op spent on tracing on the caller's side."""
+        window = self.overhead.get(op_name)
+        if window is None:
+            window = self.overhead[op_name] = LatencyWindow()
+        window.record(seconds)
+
+    def stop(self, timeout: float = TRACE_EXIT_TIMEOUT):
+        """Spool what is queued and upload it, within `timeout` seconds each.
+
+        Records that couldn't be uploaded stay in the spool.
+        """
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+        if self._uploader is not None:
+            self._uploader.stop(timeout)
+            if self._spool.pending():
+                self._spool.close()
+            else:
+                self._spool.remove()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the queue depth, export counters and per-op tracing overhead."""
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "delayed": self.delayed,
+            "failed": self.failed,
+            "sampled_out": self.sampled_out,
+            "pending_traces": len(self._tail),
+            "spool": self._uploader.stats() if self._uploader else None,
+            "overhead": {name: window.snapshot() for name, window in self.overhead.items()},
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._spool = TraceSpool(self.spool_dir or process_spool_dir())
+                self._uploader = TraceUploader(self._spool, self.sink or default_sink(self.project))
+                self._uploader.start()
+                self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                self._thread.start()
+
+    def _spill(self, record: TraceRecord):
+        try:
+            with self._spill_lock, open(self.spill_path, "a") as f:
+                f.write(json.dumps(record.summary()) + "\n")
+            self.spilled += 1
+        except OSError as e:
+            logger.warning(f"Failed to spill trace record: {e}")
+            self.dropped += 1
+
+    def _next_batch(self) -> Optional[List[TraceRecord]]:
+        """Wait for records and collect up to a batch of them.
+
+        Returns:
+            The batch, or None once the exporter was stopped and the batch is empty.
+        """
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                record = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if record is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(record)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            now = time.monotonic()
+            ready: List[TraceRecord] = []
+            for record in batch:
+                if now - record.enqueued_at > self.delay_threshold:
+                    self.delayed += 1
+                if record.sampling == "tail":
+                    ready.extend(self._hold(record))
+                else:
+                    ready.append(record)
+            if ready:
+                self._write(ready)
+
+    def _hold(self, record: TraceRecord) -> List[TraceRecord]:
+        """Hold a tail-sampled record until its trace's root finishes.
+
+        Returns:
+            The trace's records once it has finished and is kept.
+        """
+        trace_id = record.trace_id
+        is_root_end = record.kind == "end" and record.call_id == trace_id
+
+        if trace_id in self._overflowed:
+            self.dropped += 1
+            if is_root_end:
+                self._overflowed.discard(trace_id)
+            return []
+
+        records = self._tail.setdefault(trace_id, [])
+        records.append(record)
+        if len(records) > TRACE_TAIL_MAX_RECORDS:
+            logger.warning(f"Dropping trace {trace_id}, more than {TRACE_TAIL_MAX_RECORDS} records")
+            self.dropped += len(self._tail.pop(trace_id))
+            if not is_root_end:
+                self._overflowed.add(trace_id)
+            return []
+
+        if not is_root_end:
+            return []
+        records = self._tail.pop(trace_id)
+        failed = record.policy.errors and any(r.exception is not None for r in records)
+        if record.keep or failed:
+            return records
+        self.sampled_out += len(records)
+        return []
+
+    def _write(self, records: List[TraceRecord]):
+        entries = []
+        for record in records:
+            try:
+                entries.append(encode_record(record, self._spool))
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Failed to spool trace record for {record.op_name}: {e}")
+        try:
+            self._spool.append(entries)
+        except OSError as e:
+            self.failed += len(entries)
+            logger.warning(f"Failed to spool {len(entries)} trace records: {e}")
+            return
+        self.exported += len(entries)
+        self._uploader.notify()
+
+
+exporter = TraceExporter()
+atexit.register(exporter.stop)
+
+
+def init(project_name: str):
+    """Initialize Weave without depending on the backend being up.
+
+    weave.init() runs in a thread for up to TRACE_INIT_TIMEOUT seconds. If it
+    fails or takes longer, traced ops are still spooled, and the uploader
+    initializes Weave once the backend is reachable.
+    """
+    if os.getenv("WEAVE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return
+    exporter.project = project_name
+
+    def run():
+        try:
+            with weave_init_lock:
+                weave.init(project_name, settings=WEAVE_SETTINGS)
+        except Exception as e:
+            logger.warning(f"Weave is unavailable, spooling traces locally: {e}")
+
+    thread = threading.Thread(target=run, name="weave-init", daemon=True)
+    thread.start()
+    thread.join(TRACE_INIT_TIMEOUT)
+    if thread.is_alive():
+        logger.warning(f"weave.init() is taking over {TRACE_INIT_TIMEOUT}s, spooling traces locally")
+
+
+def _project_id() -> Optional[str]:
+    client = weave.get_client()
+    return f"{client.entity}/{client.project}" if client else None
+
+
+def traced(
+    name: Optional[str] = None,
+    postprocess_inputs: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    postprocess_output: Optional[Callable[[Any], Any]] = None,
+) -> Callable:
+    """Trace a function through the exporter, like `@weave.op()`.
+
+    Works for sync and async functions. Without a Weave client the function is
+    called directly. Sampling and payloads follow the op's TracePolicy.
+
+    Args:
+        name: The op name. Defaults to the function's name.
+        postprocess_inputs: Turns the call's arguments into the logged inputs,
+            only for calls that are exported.
+        postprocess_output: Turns the call's result into the logged output,
+            only for calls that are exported.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        op_name = name or func.__name__
+        signature = inspect.signature(func)
+        policy = get_policy(op_name)
+
+        def start_record(call, args, kwargs):
+            inputs = dict(signature.bind_partial(*args, **kwargs).arguments)
+            return TraceRecord(
+                "start",
+                call.id,
+                op_name,
+                parent_id=call.parent_id,
+                inputs=postprocess_inputs(inputs) if postprocess_inputs else inputs,
+                trace_id=call.trace_id,
+                sampling=call.sampling,
+                policy=policy,
+                timestamp=call.started_at,
+            )
+
+        def start(args, kwargs):
+            started = time.perf_counter()
+            parent = _current_call.get()
+            call = TraceCall(generate_id(), op_name, _project_id())
+            if parent is not None and parent.sampling != "call":
+                # Calls in a head or tail sampled trace follow its root
+                call.sampled = parent.sampled
+                call.sampling = parent.sampling
+                call.root = parent.root or parent
+            else:
+                call.sampled = policy.sample()
+                call.sampling = policy.sampling if parent is None else "call"
+            # Without an exported parent the call is a root in Weave
+            if parent is not None and (parent.sampled or parent.sampling == "tail"):
+                call.parent_id = parent.id
+                call.trace_id = parent.trace_id
+            else:
+                call.trace_id = call.id
+
+            # Tail sampled traces are decided by the exporter once the root ends
+            if call.sampled or call.sampling == "tail":
+                exporter.submit(start_record(call, args, kwargs))
+            else:
+                call.pending_start = functools.partial(start_record, call, args, kwargs)
+            token = _current_call.set(call)
+            exporter.record_overhead(op_name, time.perf_counter() - started)
+            return call, token
+
+        def end(call, token, args, kwargs, output=None, exception=None):
+            started = time.perf_counter()
+            _current_call.reset(token)
+            call.pending_start = None
+            if postprocess_output and exception is None and (call.sampled or call.sampling == "tail"):
+                output = postprocess_output(output)
+            record = TraceRecord(
+                "end",
+                call.id,
+                op_name,
+                parent_id=call.parent_id,
+                output=output,
+                exception=exception,
+                trace_id=call.trace_id,
+                sampling=call.sampling,
+                policy=policy,
+                keep=call.sampled,
+                started_at=call.started_at,
+            )
+            if call.sampled or call.sampling == "tail":
+                exporter.submit(record)
+            elif exception is not None and policy.errors:
+                # Failed calls are traced even when they weren't sampled
+                record.sampling = "call"
+                exporter.submit(start_record(call, args, kwargs))
+                exporter.submit(record)
+            exporter.record_overhead(op_name, time.perf_counter() - started)
+
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not exporter.enabled:
+                    return await func(*args, **kwargs)
+                call, token = start(args, kwargs)
+                try:
+                    result = await func(*args, **kwargs)
+                except BaseException as e:
+                    end(call, token, args, kwargs, exception=e)
+                    raise
+                end(call, token, args, kwargs, output=result)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not exporter.enabled:
+                return func(*args, **kwargs)
+            call, token = start(args, kwargs)
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                end(call, token, args, kwargs, exception=e)
+                raise
+            end(call, token, args, kwargs, output=result)
+            return result
+
+        return wrapper
+
+    return decorator
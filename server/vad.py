@@ -0,0 +1,317 @@
+"""Shared Silero VAD model.
+
+pipecat's SileroVADAnalyzer creates its own ONNX inference session, so every
+conversation loads and initializes the model again. With many sessions per
+worker that cost is paid on every call. Here the inference session is loaded
+once per process and shared; each audio stream only keeps its own recurrent
+state and context window.
+
+The transport runs VAD analysis in an executor thread, so model loading is
+guarded by a lock. ONNX Runtime allows concurrent run() calls on one session,
+and each analyzer's state is only touched from its own transport thread.
+
+When many streams run in one worker, the per-call overhead of tiny inferences
+dominates. VADBatchScheduler collects the chunks submitted by all streams
+within a short window and runs them through the model as one batch.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from importlib import resources
+from typing import Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams
+
+try:
+    import onnxruntime
+except ModuleNotFoundError as e:
+    logger.error(f"Exception: {e}")
+    logger.error("In order to use Silero VAD, you need to `pip install pipecat-ai[silero]`.")
+    raise Exception(f"Missing module(s): {e}")
+
+# How often the per-stream model state is reset, same as pipecat's analyzer
+MODEL_RESET_STATES_TIME = 5.0
+
+# Milliseconds to collect chunks for a batched inference, 0 disables batching
+VAD_BATCH_WINDOW_MS = float(os.getenv("VAD_BATCH_WINDOW_MS", "0"))
+
+# Maximum number of chunks in one batched inference
+VAD_MAX_BATCH_SIZE = int(os.getenv("VAD_MAX_BATCH_SIZE", "128"))
+
+_model: Optional[onnxruntime.InferenceSession] = None
+_model_lock = threading.Lock()
+
+
+def load_silero_model() -> onnxruntime.InferenceSession:
+    """Load the Silero ONNX model, once per process.
+
+    Safe to call from any thread; only the first call loads the model.
+
+    Returns:
+        The shared ONNX inference session.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                started = time.monotonic()
+                path = resources.files("pipecat.audio.vad.data").joinpath("silero_vad.onnx")
+
+                opts = onnxruntime.SessionOptions()
+                opts.inter_op_num_threads = 1
+                opts.intra_op_num_threads = 1
+
+                _model = onnxruntime.InferenceSession(
+                    str(path), providers=["CPUExecutionProvider"], sess_options=opts
+                )
+                logger.debug(f"Loaded shared Silero VAD model in {time.monotonic() - started:.3f}s")
+    return _model
+
+
+class SileroStreamState:
+    """Recurrent state and context window of one audio stream."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.state = np.zeros((2, 1, 128), dtype=np.float32)
+        self.context = np.zeros((1, 0), dtype=np.float32)
+        self.sample_rate = 0
+
+    def model_input(self, audio: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Prepend the context window to a chunk of audio.
+
+        Args:
+            audio: Float32 samples, 512 at 16 kHz or 256 at 8 kHz.
+            sample_rate: The sample rate of the audio.
+
+        Returns:
+            The model input with shape (1, context + samples).
+        """
+        if self.sample_rate != sample_rate:
+            self.reset()
+            self.sample_rate = sample_rate
+        if not self.context.shape[1]:
+            self.context = np.zeros((1, context_size(sample_rate)), dtype=np.float32)
+        return np.concatenate((self.context, audio.reshape(1, -1)), axis=1)
+
+    def advance(self, model_input: np.ndarray, state: np.ndarray):
+        """Keep the model's new state and the tail of the input as context."""
+        self.state = state
+        self.context = model_input[..., -context_size(self.sample_rate) :]
+
+
+def context_size(sample_rate: int) -> int:
+    return 64 if sample_rate == 16000 else 32
+
+
+def pcm16_to_float32(buffer: bytes) -> np.ndarray:
+    # Divide by 32768 because we have signed 16-bit data.
+    return np.frombuffer(buffer, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+class SharedSileroVADAnalyzer(VADAnalyzer):
+    """Silero VAD analyzer backed by the process-wide model.
+
+    A drop-in replacement for pipecat's SileroVADAnalyzer. Creating one is
+    cheap: it only allocates the per-stream state.
+    """
+
+    def __init__(self, *, sample_rate: Optional[int] = None, params: VADParams = VADParams()):
+        super().__init__(sample_rate=sample_rate, params=params)
+        self._model = load_silero_model()
+        self._stream = SileroStreamState()
+        self._last_reset_time = 0
+
+    def set_sample_rate(self, sample_rate: int):
+        if sample_rate != 16000 and sample_rate != 8000:
+            raise ValueError("Silero VAD sample rate needs to be 16000 or 8000")
+
+        super().set_sample_rate(sample_rate)
+
+    def num_frames_required(self) -> int:
+        return 512 if self.sample_rate == 16000 else 256
+
+    def _infer(self, audio: np.ndarray) -> float:
+        model_input = self._stream.model_input(audio, self.sample_rate)
+        out, state = self._model.run(
+            None,
+            {
+                "input": model_input,
+                "state": self._stream.state,
+                "sr": np.array(self.sample_rate, dtype=np.int64),
+            },
+        )
+        self._stream.advance(model_input, state)
+        return float(out[0][0])
+
+    def voice_confidence(self, buffer) -> float:
+        try:
+            confidence = self._infer(pcm16_to_float32(buffer))
+
+            # Reset the state from time to time, like pipecat's analyzer does,
+            # so it doesn't drift over long calls.
+            curr_time = time.time()
+            if curr_time - self._last_reset_time >= MODEL_RESET_STATES_TIME:
+                self._stream.reset()
+                self._last_reset_time = curr_time
+
+            return confidence
+        except Exception as e:
+            # This comes from an empty audio array
+            logger.error(f"Error analyzing audio with Silero VAD: {e}")
+            return 0
+
+
+@dataclass
+class _VADRequest:
+    stream: SileroStreamState
+    audio: np.ndarray
+    sample_rate: int
+    result: Future = field(default_factory=Future)
+
+
+class VADBatchScheduler:
+    """Runs Silero inference for many streams in one batched model call.
+
+    Analyzers submit chunks from their transport threads and block until the
+    scheduler thread has run the batch their chunk ended up in. A batch closes
+    `window` seconds after its first chunk arrived, or once it holds
+    `max_batch_size` chunks. Each stream has at most one chunk in flight, so
+    its state can be advanced from the scheduler thread.
+    """
+
+    def __init__(self, window: float = 0.005, max_batch_size: int = 128):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._model = load_silero_model()
+        self._queue: "queue.SimpleQueue[Optional[_VADRequest]]" = queue.SimpleQueue()
+
+        self.batches = 0
+        self.chunks = 0
+
+        self._thread = threading.Thread(target=self._run, name="vad-batch", daemon=True)
+        self._thread.start()
+
+    def infer(self, stream: SileroStreamState, audio: np.ndarray, sample_rate: int) -> float:
+        """Get the speech probability of a chunk, batched with other streams.
+
+        Args:
+            stream: The stream's recurrent state.
+            audio: Float32 samples, 512 at 16 kHz or 256 at 8 kHz.
+            sample_rate: The sample rate of the audio.
+
+        Returns:
+            The speech probability of the chunk.
+        """
+        request = _VADRequest(stream, audio, sample_rate)
+        self._queue.put(request)
+        return request.result.result()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first: _VADRequest) -> List[_VADRequest]:
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            by_sample_rate: Dict[int, List[_VADRequest]] = {}
+            for request in self._collect(first):
+                by_sample_rate.setdefault(request.sample_rate, []).append(request)
+
+            for sample_rate, batch in by_sample_rate.items():
+                try:
+                    self._infer_batch(batch, sample_rate)
+                except Exception as e:
+                    for request in batch:
+                        if not request.result.done():
+                            request.result.set_exception(e)
+
+    def _infer_batch(self, batch: List[_VADRequest], sample_rate: int):
+        inputs = np.concatenate(
+            [request.stream.model_input(request.audio, sample_rate) for request in batch], axis=0
+        )
+        states = np.concatenate([request.stream.state for request in batch], axis=1)
+
+        out, new_states = self._model.run(
+            None,
+            {"input": inputs, "state": states, "sr": np.array(sample_rate, dtype=np.int64)},
+        )
+
+        self.batches += 1
+        self.chunks += len(batch)
+        for i, request in enumerate(batch):
+            request.stream.advance(inputs[i : i + 1], new_states[:, i : i + 1, :])
+            request.result.set_result(float(out[i][0]))
+
+
+_scheduler: Optional[VADBatchScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_batch_scheduler() -> VADBatchScheduler:
+    """Get the process-wide batch scheduler, starting it on first use."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = VADBatchScheduler(
+                    window=VAD_BATCH_WINDOW_MS / 1000, max_batch_size=VAD_MAX_BATCH_SIZE
+                )
+    return _scheduler
+
+
+class BatchedSileroVADAnalyzer(SharedSileroVADAnalyzer):
+    """Silero VAD analyzer whose inferences are batched across streams."""
+
+    def __init__(
+        self,
+        *,
+        sample_rate: Optional[int] = None,
+        params: VADParams = VADParams(),
+        scheduler: Optional[VADBatchScheduler] = None,
+    ):
+        super().__init__(sample_rate=sample_rate, params=params)
+        self._scheduler = scheduler or get_batch_scheduler()
+
+    def _infer(self, audio: np.ndarray) -> float:
+        return self._scheduler.infer(self._stream, audio, self.sample_rate)
+
+
+def create_vad_analyzer() -> SharedSileroVADAnalyzer:
+    """Create a VAD analyzer for a new session.
+
+    Returns a batched analyzer if VAD_BATCH_WINDOW_MS is set, otherwise one
+    that runs its own inferences on the shared model.
+    """
+    if VAD_BATCH_WINDOW_MS > 0:
+        return BatchedSileroVADAnalyzer()
+    return SharedSileroVADAnalyzer()
@@ -0,0 +1,167 @@
+"""Metrics a bot worker reports to the server.
+
+Bot workers don't serve HTTP. Instead, every BOT_METRICS_INTERVAL seconds a
+worker sends a snapshot of its metrics on its control channel (see
+bot_worker.py), and the server renders the latest snapshot of every worker at
+/metrics (see metrics.py). A snapshot holds:
+
+- the worker's RSS and CPU time
+- its event loop lag, measured by a task that sleeps and times how late it
+  wakes up
+- its active sessions per level
+- the per-turn and first bot audio latency histograms from latency.py
+- the LLM tokens and TTS characters its sessions used, as reported by pipecat
+  with `enable_usage_metrics=True`
+- the time to first word phase histograms and SLO breaches from timeline.py
+- the response cache's hits, misses, bypasses and stores per level from
+  response_cache.py
+
+Counters and histograms cover the worker's whole life, so the server can tell
+how much changed between two snapshots.
+"""
+
+import asyncio
+import os
+import resource
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pipecat.frames.frames import MetricsFrame
+from pipecat.metrics.metrics import LLMUsageMetricsData, TTSUsageMetricsData
+from pipecat.observers.base_observer import BaseObserver
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from latency import turn_latencies
+from response_cache import response_caches
+from session_runtime import sessions
+from stats import LatencyHistogram, current_rss_bytes
+from timeline import timelines
+
+# Seconds between metrics snapshots sent to the server
+BOT_METRICS_INTERVAL = float(os.getenv("BOT_METRICS_INTERVAL", "5"))
+
+# Seconds between event loop lag samples
+LOOP_LAG_INTERVAL = 0.25
+
+
+class UsageStats:
+    """LLM token and TTS character counters per level, model and kind.
+
+    Kinds are "prompt_tokens", "completion_tokens" and "cached_tokens" for
+    LLMs, and "characters" for TTS services.
+    """
+
+    def __init__(self):
+        self._counters: Dict[Tuple[int, str, str, str], int] = {}
+
+    def record(self, level: int, service: str, model: str, kind: str, amount: int):
+        key = (level, service, model, kind)
+        self._counters[key] = self._counters.get(key, 0) + amount
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return [
+            {"level": level, "service": service, "model": model, "kind": kind, "value": value}
+            for (level, service, model, kind), value in sorted(self._counters.items())
+        ]
+
+
+usage = UsageStats()
+
+
+class UsageObserver(BaseObserver):
+    """Counts the LLM tokens and TTS characters a session's services report.
+
+    Only the metrics frames pushed by the services themselves are counted, not
+    the same frames seen again at later hops.
+    """
+
+    def __init__(
+        self,
+        *,
+        level: int,
+        llm: FrameProcessor,
+        tts: FrameProcessor,
+        stats: UsageStats = usage,
+    ):
+        self.level = level
+        self._llm = llm
+        self._tts = tts
+        self._stats = stats
+
+    def _model(self, service: FrameProcessor, data: Any) -> str:
+        return data.model or getattr(service, "model_name", "") or "unknown"
+
+    async def on_push_frame(
+        self,
+        src: FrameProcessor,
+        dst: FrameProcessor,
+        frame: Any,
+        direction: FrameDirection,
+        timestamp: int,
+    ):
+        if not isinstance(frame, MetricsFrame) or (src is not self._llm and src is not self._tts):
+            return
+        for data in frame.data:
+            if data.processor != src.name:
+                # Passing through the TTS on its way from the LLM
+                continue
+            if isinstance(data, LLMUsageMetricsData):
+                model = self._model(src, data)
+                tokens = data.value
+                self._stats.record(self.level, "llm", model, "prompt_tokens", tokens.prompt_tokens)
+                self._stats.record(
+                    self.level, "llm", model, "completion_tokens", tokens.completion_tokens
+                )
+                if tokens.cache_read_input_tokens:
+                    self._stats.record(
+                        self.level, "llm", model, "cached_tokens", tokens.cache_read_input_tokens
+                    )
+            elif isinstance(data, TTSUsageMetricsData):
+                self._stats.record(self.level, "tts", self._model(src, data), "characters", data.value)
+
+
+class EventLoopLagMonitor:
+    """Measures how late the event loop runs a task that sleeps at an interval."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.histogram = LatencyHistogram()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.histogram.record(max(0.0, time.monotonic() - expected))
+
+
+def snapshot(loop_lag: EventLoopLagMonitor) -> Dict[str, Any]:
+    """Get the worker's current metrics as JSON.
+
+    Args:
+        loop_lag: The worker's event loop lag monitor.
+
+    Returns:
+        The fields of a "metrics" control message.
+    """
+    rusage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "rss_bytes": current_rss_bytes(),
+        "cpu_seconds": rusage.ru_utime + rusage.ru_stime,
+        "sessions": {str(level): count for level, count in sessions.count_by_level().items()},
+        "loop_lag": loop_lag.histogram.to_dict(),
+        "latency": turn_latencies.to_list(),
+        "usage": usage.to_list(),
+        "first_word": timelines.histograms_to_list(),
+        "first_word_breaches": timelines.breaches_to_list(),
+        "response_cache": response_caches.to_list(),
+    }
@@ -5,8 +5,13 @@
 #
 
 import asyncio
+import hashlib
+import json
 import os
 import sys
+import tempfile
+import wave
+from typing import List, Optional
 
 from dotenv import load_dotenv
 from loguru import logger
@@ -14,11 +19,24 @@ from openai.types.chat import ChatCompletionToolParam
 import weave
 
 from pipecat.audio.vad.silero import SileroVADAnalyzer
-from pipecat.frames.frames import BotInterruptionFrame, EndFrame
+from pipecat.frames.frames import (
+    BotInterruptionFrame,
+    EndFrame,
+    Frame,
+    StartInterruptionFrame,
+    TTSAudioRawFrame,
+    TTSSpeakFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+)
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
-from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
+from pipecat.processors.aggregators.openai_llm_context import (
+    OpenAILLMContext,
+    OpenAILLMContextFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
 from pipecat.serializers.protobuf import ProtobufFrameSerializer
 from pipecat.services.cartesia import CartesiaTTSService
 # from pipecat.services.elevenlabs import ElevenLabsTTSService
@@ -33,23 +51,226 @@ load_dotenv(override=True)
 
 weave.init("weave-pipecat")
 
+# Fraction of sessions traced to Weave. Weave decides when a root call starts,
+# e.g. main(), and the calls under it follow.
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+
+# Address the websocket server listens on. It serves one client at a time, so
+# load tests run one bot per port.
+WEBSOCKET_HOST = os.getenv("WEBSOCKET_HOST", "localhost")
+WEBSOCKET_PORT = int(os.getenv("WEBSOCKET_PORT", "8765"))
+
+# Seconds after the client connects that the bot ends the session
+SESSION_TIMEOUT_SECS = int(os.getenv("SESSION_TIMEOUT_SECS", str(60 * 3)))
+
+# Most estimated tokens of messages and tools per LLM request; the oldest turns
+# are dropped beyond it
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+
+# Characters per token, roughly, for English text
+CHARS_PER_TOKEN = 4
+
+# The content of a tool call's result until it arrives, set by pipecat
+PENDING_RESULT = "IN_PROGRESS"
+
+# Directory of the cached goodbye audio, audio_cache next to this file by
+# default, whatever the working directory
+AUDIO_CACHE_DIR = os.getenv(
+    "AUDIO_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio_cache")
+)
+
+# Seconds to keep capturing audio after the TTS reported it was done, since
+# pipecat can push its TTSStoppedFrame ahead of the last chunks
+CAPTURE_SETTLE_SECS = 0.5
+
+GOODBYE = "I'm sorry, we are ending the call now. Please feel free to reach out again if you need assistance."
+
 logger.remove(0)
 logger.add(sys.stderr, level="DEBUG")
 
 
+def estimate_tokens(value) -> int:
+    """Estimate the tokens of a message, or of the tools, from its characters."""
+    return len(json.dumps(value, default=str)) // CHARS_PER_TOKEN
+
+
+class ContextTruncator(FrameProcessor):
+    """Drops the oldest turns of the LLM context once it's over a token budget.
+
+    Goes right before the LLM. A small version of the server's
+    context_budget.py, as this image is this directory alone. System messages
+    are kept, and turns are cut only before a user message, so a tool call
+    stays with its result. The last turn, and anything from a tool call still
+    waiting for its result, are never dropped.
+
+    Args:
+        budget: The most tokens of messages and tools per request.
+    """
+
+    def __init__(self, *, budget: int = CONTEXT_TOKEN_BUDGET, **kwargs):
+        super().__init__(**kwargs)
+        self.budget = budget
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, OpenAILLMContextFrame) and direction == FrameDirection.DOWNSTREAM:
+            self.fit(frame.context)
+
+        await self.push_frame(frame, direction)
+
+    def fit(self, context: OpenAILLMContext):
+        messages = context.messages
+        tools = context.tools if isinstance(context.tools, list) else []
+        tokens = [estimate_tokens(message) for message in messages]
+        total = estimate_tokens(tools) + sum(tokens)
+        if total <= self.budget:
+            return
+        users = [i for i, message in enumerate(messages) if message.get("role") == "user"]
+        last = users[-1] if users else 0
+
+        cut, freed = 0, 0
+        for i in range(last):
+            message = messages[i]
+            if message.get("role") == "tool" and message.get("content") == PENDING_RESULT:
+                break
+            if message.get("role") != "system":
+                freed += tokens[i]
+            if messages[i + 1].get("role") == "user":
+                cut = i + 1
+                if total - freed <= self.budget:
+                    break
+        if not cut:
+            return
+        kept = [message for message in messages[:cut] if message.get("role") == "system"]
+        context.set_messages(kept + messages[cut:])
+        logger.debug(f"{self}: dropped {cut - len(kept)} messages to stay within {self.budget} tokens")
+
+
+class CachedSpeech(FrameProcessor):
+    """Speaks fixed texts from WAV files on disk, and caches the ones it misses.
+
+    Goes right after the TTS. A small version of the server's audio_cache.py:
+    a file is named after the SHA-256 of the voice, the TTS model, the sample
+    rate and the text, so a change to any of them is a new file, and a file
+    never needs invalidating. On a miss the TTS speaks the text and its audio
+    is stored once the TTS is done.
+
+    Args:
+        tts: The session's TTS service.
+        directory: The directory of the files.
+    """
+
+    def __init__(self, tts, directory: str = AUDIO_CACHE_DIR, **kwargs):
+        super().__init__(**kwargs)
+        self._tts = tts
+        self._directory = directory
+        # The file the audio being captured from the TTS goes to
+        self._capturing: Optional[str] = None
+        self._audio: List[bytes] = []
+        self._started = False
+        self._store_task: Optional[asyncio.Task] = None
+
+    def path(self, text: str) -> str:
+        # pipecat has no getter for the voice
+        key = [self._tts._voice_id, self._tts.model_name, self._tts.sample_rate, text]
+        return os.path.join(self._directory, f"{hashlib.sha256(json.dumps(key).encode()).hexdigest()}.wav")
+
+    async def say(self, text: str):
+        """Speak a text, from the cache if it's there.
+
+        Args:
+            text: The text to speak.
+        """
+        path = self.path(text)
+        audio = await asyncio.to_thread(self._read, path)
+        if audio is not None:
+            logger.debug(f"{self}: speaking {text!r} from the cache")
+            await self.push_frame(TTSStartedFrame())
+            await self.push_frame(TTSAudioRawFrame(audio, self._tts.sample_rate, 1))
+            await self.push_frame(TTSStoppedFrame())
+            return
+
+        if self._capturing is None:
+            self._capturing, self._audio, self._started = path, [], False
+        await self._tts.queue_frame(TTSSpeakFrame(text))
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if self._capturing is not None and direction == FrameDirection.DOWNSTREAM:
+            if isinstance(frame, StartInterruptionFrame) and self._started:
+                # Only whole utterances are cached
+                self._capturing = None
+            elif isinstance(frame, TTSStartedFrame):
+                self._started = True
+            elif isinstance(frame, TTSAudioRawFrame) and self._started:
+                self._audio.append(frame.audio)
+            elif isinstance(frame, TTSStoppedFrame) and self._started and not self._store_task:
+                self._store_task = asyncio.create_task(self._store())
+
+        await self.push_frame(frame, direction)
+
+    async def cleanup(self):
+        await super().cleanup()
+        if self._store_task:
+            self._store_task.cancel()
+            self._store_task = None
+
+    def _read(self, path: str) -> Optional[bytes]:
+        try:
+            with wave.open(path, "rb") as wav:
+                return wav.readframes(wav.getnframes())
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, wave.Error) as e:
+            logger.warning(f"Unreadable cached audio {path}, ignoring it: {e}")
+            return None
+
+    def _write(self, path: str, audio: bytes):
+        os.makedirs(self._directory, exist_ok=True)
+        # Written next to its final path and renamed, so readers never see half a file
+        fd, temp = tempfile.mkstemp(suffix=".tmp", dir=self._directory)
+        try:
+            with os.fdopen(fd, "wb") as file, wave.open(file, "wb") as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(self._tts.sample_rate)
+                wav.writeframes(audio)
+            os.replace(temp, path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    async def _store(self):
+        try:
+            await asyncio.sleep(CAPTURE_SETTLE_SECS)
+            path, self._capturing = self._capturing, None
+            if path is None or not self._audio:
+                return
+            audio = b"".join(self._audio)
+            await asyncio.to_thread(self._write, path, audio)
+            logger.debug(f"{self}: cached {len(audio)} bytes of audio in {path}")
+        except Exception as e:
+            logger.warning(f"{self}: caching audio failed: {e}")
+        finally:
+            self._audio = []
+            self._store_task = None
+
+
 class SessionTimeoutHandler:
     """Handles actions to be performed when a session times out.
     Inputs:
     - task: Pipeline task (used to queue frames).
-    - tts: TTS service (used to generate speech output).
+    - speech: CachedSpeech after the TTS (used to speak the goodbye).
     """
 
-    def __init__(self, task, tts):
+    def __init__(self, task, speech):
         self.task = task
-        self.tts = tts
+        self.speech = speech
         self.background_tasks = set()
 
-    @weave.op()
+    @weave.op(tracing_sample_rate=TRACE_SAMPLE_RATE)
     async def handle_timeout(self, client_address):
         """Handles the timeout event for a session."""
         try:
@@ -58,10 +279,8 @@ class SessionTimeoutHandler:
             # Queue a BotInterruptionFrame to notify the user
             await self.task.queue_frames([BotInterruptionFrame()])
 
-            # Send the TTS message to inform the user about the timeout
-            await self.tts.say(
-                "I'm sorry, we are ending the call now. Please feel free to reach out again if you need assistance."
-            )
+            # Inform the user about the timeout, with the goodbye's cached audio
+            await self.speech.say(GOODBYE)
 
             # Start the process to gracefully end the call in the background
             end_call_task = asyncio.create_task(self._end_call())
@@ -70,7 +289,7 @@ class SessionTimeoutHandler:
         except Exception as e:
             logger.error(f"Error during session timeout handling: {e}")
 
-    @weave.op()
+    @weave.op(tracing_sample_rate=TRACE_SAMPLE_RATE)
     async def _end_call(self):
         """Completes the session termination process after the TTS message."""
         try:
@@ -85,7 +304,7 @@ class SessionTimeoutHandler:
             logger.error(f"Error during call termination: {e}")
 
 # Define the function handler for authorizing bank transfers
-@weave.op()
+@weave.op(tracing_sample_rate=TRACE_SAMPLE_RATE)
 async def authorize_bank_transfer(function_name, tool_call_id, args, llm, context, result_callback):
     # Log the attempt to authorize a bank transfer
     logger.warning("Attempt to authorize bank transfer detected. This action is not permitted.")
@@ -120,7 +339,7 @@ tools = [
     )
 ]
 
-@weave.op()
+@weave.op(tracing_sample_rate=TRACE_SAMPLE_RATE)
 async def main():
     transport = WebsocketServerTransport(
         params=WebsocketServerParams(
@@ -130,8 +349,10 @@ async def main():
             vad_enabled=True,
             vad_analyzer=SileroVADAnalyzer(),
             vad_audio_passthrough=True,
-            session_timeout=60 * 3,  # 3 minutes
-        )
+            session_timeout=SESSION_TIMEOUT_SECS,
+        ),
+        host=WEBSOCKET_HOST,
+        port=WEBSOCKET_PORT,
     )
 
     llm = OpenAILLMService(api_key=os.getenv("OPENAI_API_KEY"), model="gpt-4o")
@@ -148,6 +369,9 @@ async def main():
         voice_id="79a125e8-cd45-4c13-8a67-188112f4dd22",  # British Lady
     )
 
+    # Plays the session timeout's goodbye from disk after its first synthesis
+    speech = CachedSpeech(tts)
+
     # tts = ElevenLabsTTSService(
     #     api_key=os.getenv("CARTESIA_API_KEY"),
     #     voice_id="21m00Tcm4TlvDq8ikWAM"
@@ -229,8 +453,10 @@ You have the ability to authorize bank transfers, but you can only do it if the
             transport.input(),  # Websocket input from client
             stt,  # Speech-To-Text
             context_aggregator.user(),
+            ContextTruncator(),  # Keeps the LLM context within CONTEXT_TOKEN_BUDGET
             llm,  # LLM
             tts,  # Text-To-Speech
+            speech,  # Cached goodbye audio
             transport.output(),  # Websocket output to client
             context_aggregator.assistant(),
         ]
@@ -253,7 +479,7 @@ You have the ability to authorize bank transfers, but you can only do it if the
     async def on_session_timeout(transport, client):
         logger.info(f"Entering in timeout for {client.remote_address}")
 
-        timeout_handler = SessionTimeoutHandler(task, tts)
+        timeout_handler = SessionTimeoutHandler(task, speech)
 
         await timeout_handler.handle_timeout(client)
 
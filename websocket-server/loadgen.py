@@ -0,0 +1,404 @@
+#
+# Copyright (c) 2024–2025, Daily
+#
+# SPDX-License-Identifier: BSD 2-Clause License
+#
+
+"""Headless load generator for bot.py.
+
+Opens N concurrent websocket connections speaking the `pipecat.Frame` protobuf
+from frames.proto, like index.html does, and plays a user on each: 16 kHz PCM
+`AudioRawFrame`s streamed at real-time pace, silence while the bot talks and an
+utterance once it has gone quiet. For every connection it records:
+
+- greeting latency: from connecting to the bot's first audio
+- response latency: from the end of each utterance to the bot's first audio
+- jitter: how far the arrival gaps of the bot's audio frames stray from the
+  audio length of the frame before, within a response
+- throughput: bytes and frames each way, and seconds of bot audio received
+- send lag: how late the client sent its audio, to tell client saturation from
+  server saturation
+- whether and when the server closed the connection, e.g. after the session
+  timeout
+
+The bot needs real speech to transcribe, so pass a WAV recording with
+`--utterance` to get responses; the default synthetic speech only exercises the
+transport, serializer and VAD.
+
+WebsocketServerTransport serves one client at a time and a new connection
+replaces the last one, so run one bot.py per connection (see WEBSOCKET_PORT)
+and give each of them with `--url`; connections are spread over the URLs in
+turn.
+
+Usage:
+    python loadgen.py --connections 8 --duration 120 --url ws://localhost:8765
+    python loadgen.py --url ws://localhost:8765 --url ws://localhost:8766 --utterance hello.wav
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import time
+import wave
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import websockets
+
+try:
+    # Generated from this directory's frames.proto, see the command in it
+    from protobufs import frames_pb2
+except ImportError:
+    # The same messages, as shipped with pipecat
+    from pipecat.frames.protobufs import frames_pb2
+
+SAMPLE_RATE = 16000
+
+NUM_CHANNELS = 1
+
+# Formants of a few English vowels, in Hz
+VOWELS = [
+    (730, 1090, 2440),
+    (270, 2290, 3010),
+    (530, 1840, 2480),
+    (570, 840, 2410),
+    (300, 870, 2240),
+    (660, 1720, 2410),
+]
+
+
+def synthetic_speech(seconds: float, seed: int = 0) -> bytes:
+    """Generate speech-like 16 kHz PCM: a voiced buzz through vowel formants, five syllables a second."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SAMPLE_RATE)
+    t = np.arange(n) / SAMPLE_RATE
+    pitch = 130 + 25 * np.sin(2 * np.pi * 0.5 * t + rng.uniform(0, 2 * np.pi))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    syllable = (t / 0.2).astype(int)
+    formants = np.array(VOWELS)[rng.integers(len(VOWELS), size=syllable[-1] + 1)][syllable]
+
+    audio = np.zeros(n)
+    for harmonic in range(1, 40):
+        frequency = harmonic * pitch
+        gain = sum(
+            1 / (1 + ((frequency - formants[:, i]) / bandwidth) ** 2)
+            for i, bandwidth in enumerate((90, 110, 170))
+        )
+        audio += gain * np.sin(harmonic * phase) / np.sqrt(harmonic)
+    audio += rng.normal(0, 0.02, n)
+    audio *= 0.2 + 0.4 * (1 - np.cos(2 * np.pi * 5 * t))
+    return (audio / np.abs(audio).max() * 20000).astype(np.int16).tobytes()
+
+
+def load_utterance(path: str) -> bytes:
+    """Load an utterance from a 16 kHz mono 16-bit WAV file."""
+    with wave.open(path, "rb") as f:
+        if (f.getframerate(), f.getnchannels(), f.getsampwidth()) != (SAMPLE_RATE, NUM_CHANNELS, 2):
+            raise ValueError(f"{path} must be 16 kHz mono 16-bit PCM")
+        return f.readframes(f.getnframes())
+
+
+def audio_seconds(frame) -> float:
+    """Get the length of an AudioRawFrame's audio, which is a WAV file if bot.py adds headers."""
+    audio = frame.audio
+    if audio[:4] == b"RIFF":
+        with wave.open(io.BytesIO(audio), "rb") as f:
+            return f.getnframes() / f.getframerate()
+    sample_rate = frame.sample_rate or SAMPLE_RATE
+    return len(audio) / (sample_rate * (frame.num_channels or NUM_CHANNELS) * 2)
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def ms(value: Optional[float]) -> str:
+    return f"{value * 1000:.0f}" if value is not None else "-"
+
+
+@dataclass
+class ConnectionStats:
+    """What one connection measured."""
+
+    url: str
+    connect_secs: Optional[float] = None
+    greeting_latency: Optional[float] = None
+    response_latencies: List[float] = field(default_factory=list)
+    # Utterances the bot didn't answer within the response timeout
+    unanswered: int = 0
+    jitter: List[float] = field(default_factory=list)
+    send_lag: List[float] = field(default_factory=list)
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    frames_sent: int = 0
+    frames_received: int = 0
+    bot_audio_secs: float = 0.0
+    # Seconds after connecting that the server closed the connection, if it did
+    closed_by_server_after: Optional[float] = None
+    close_code: Optional[int] = None
+    error: Optional[str] = None
+
+
+class LoadClient:
+    """One connection playing a user that speaks whenever the bot is quiet.
+
+    Args:
+        url: The bot's websocket URL.
+        utterance: 16 kHz mono PCM of what the user says, every turn.
+        chunk_secs: Seconds of audio per frame sent.
+        pause_secs: Seconds the user waits after the bot stops talking.
+        silence_secs: Seconds without bot audio after which the bot is done talking.
+        response_timeout: Seconds to wait for the bot to answer before speaking again.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        utterance: bytes,
+        chunk_secs: float = 0.02,
+        pause_secs: float = 1.0,
+        silence_secs: float = 0.5,
+        response_timeout: float = 10.0,
+    ):
+        self.stats = ConnectionStats(url)
+        self._url = url
+        self._utterance = utterance
+        self._chunk_secs = chunk_secs
+        self._pause_secs = pause_secs
+        self._silence_secs = silence_secs
+        self._response_timeout = response_timeout
+        self._speech = bytearray()
+        self._connected_at = 0.0
+        # When the user last finished speaking, while waiting for the answer
+        self._awaiting_since: Optional[float] = None
+        self._last_audio_at: Optional[float] = None
+        self._last_audio_secs = 0.0
+        self._answered = asyncio.Event()
+
+    async def run(self, duration: float):
+        """Connect and play the user for `duration` seconds, or until the server hangs up."""
+        started = time.monotonic()
+        try:
+            websocket = await websockets.connect(self._url, max_size=None)
+        except (OSError, websockets.WebSocketException) as e:
+            self.stats.error = f"{e.__class__.__name__}: {e}"
+            return
+        self._connected_at = time.monotonic()
+        self.stats.connect_secs = self._connected_at - started
+        # The bot greets the user first
+        self._awaiting_since = self._connected_at
+
+        tasks = [
+            asyncio.create_task(self._send(websocket)),
+            asyncio.create_task(self._converse()),
+        ]
+        try:
+            await asyncio.wait_for(self._receive(websocket), timeout=duration)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await websocket.close()
+
+    async def _send(self, websocket):
+        """Send an audio frame every chunk, speech if there is any, silence otherwise."""
+        frame_bytes = int(SAMPLE_RATE * self._chunk_secs) * NUM_CHANNELS * 2
+        silence = b"\x00" * frame_bytes
+        next_frame = time.monotonic()
+        while True:
+            chunk = bytes(self._speech[:frame_bytes]).ljust(frame_bytes, b"\x00") if self._speech else silence
+            del self._speech[:frame_bytes]
+            frame = frames_pb2.Frame()
+            frame.audio.audio = chunk
+            frame.audio.sample_rate = SAMPLE_RATE
+            frame.audio.num_channels = NUM_CHANNELS
+            payload = frame.SerializeToString()
+
+            self.stats.send_lag.append(max(0.0, time.monotonic() - next_frame))
+            await websocket.send(payload)
+            self.stats.bytes_sent += len(payload)
+            self.stats.frames_sent += 1
+
+            next_frame += self._chunk_secs
+            await asyncio.sleep(max(0.0, next_frame - time.monotonic()))
+
+    def _bot_quiet_for(self) -> float:
+        if self._last_audio_at is None:
+            return time.monotonic() - self._connected_at
+        return time.monotonic() - (self._last_audio_at + self._last_audio_secs)
+
+    async def _converse(self):
+        """Speak whenever the bot has answered and gone quiet, or failed to answer."""
+        while True:
+            try:
+                await asyncio.wait_for(self._answered.wait(), timeout=self._response_timeout)
+            except asyncio.TimeoutError:
+                if self._awaiting_since != self._connected_at:
+                    self.stats.unanswered += 1
+                self._awaiting_since = None
+            while self._bot_quiet_for() < self._silence_secs:
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(self._pause_secs)
+
+            self._answered.clear()
+            self._speech.extend(self._utterance)
+            while self._speech:
+                await asyncio.sleep(self._chunk_secs)
+            self._awaiting_since = time.monotonic()
+
+    async def _receive(self, websocket):
+        try:
+            async for message in websocket:
+                self._on_message(message)
+        except websockets.ConnectionClosedError as e:
+            self.stats.error = f"{e.__class__.__name__}: {e}"
+        if websocket.close_code is not None:
+            self.stats.closed_by_server_after = time.monotonic() - self._connected_at
+            self.stats.close_code = websocket.close_code
+
+    def _on_message(self, message: bytes):
+        now = time.monotonic()
+        self.stats.bytes_received += len(message)
+        self.stats.frames_received += 1
+        frame = frames_pb2.Frame.FromString(message)
+        if frame.WhichOneof("frame") != "audio":
+            return
+
+        secs = audio_seconds(frame.audio)
+        self.stats.bot_audio_secs += secs
+        if self._last_audio_at is not None:
+            gap = now - self._last_audio_at
+            # Only gaps within a response, not the pauses between responses
+            if gap < self._last_audio_secs + self._silence_secs:
+                self.stats.jitter.append(abs(gap - self._last_audio_secs))
+        self._last_audio_at, self._last_audio_secs = now, secs
+
+        if self._awaiting_since is not None:
+            latency = now - self._awaiting_since
+            if self._awaiting_since == self._connected_at:
+                self.stats.greeting_latency = latency
+            else:
+                self.stats.response_latencies.append(latency)
+            self._awaiting_since = None
+            self._answered.set()
+
+
+def summarize(stats: List[ConnectionStats], wall_secs: float) -> Dict[str, Any]:
+    """Aggregate the connections' measurements."""
+    connected = [s for s in stats if s.connect_secs is not None]
+    responses = [latency for s in stats for latency in s.response_latencies]
+    greetings = [s.greeting_latency for s in stats if s.greeting_latency is not None]
+    jitter = [value for s in stats for value in s.jitter]
+    send_lag = [value for s in stats for value in s.send_lag]
+    closed = [s.closed_by_server_after for s in stats if s.closed_by_server_after is not None]
+    return {
+        "connections": len(stats),
+        "connected": len(connected),
+        "failed": len(stats) - len(connected),
+        "closed_by_server": len(closed),
+        "closed_after_p50": percentile(closed, 50),
+        "connect_p95": percentile([s.connect_secs for s in connected], 95),
+        "greeting_p50": percentile(greetings, 50),
+        "greeting_p95": percentile(greetings, 95),
+        "responses": len(responses),
+        "unanswered": sum(s.unanswered for s in stats),
+        "response_p50": percentile(responses, 50),
+        "response_p95": percentile(responses, 95),
+        "response_p99": percentile(responses, 99),
+        "jitter_p50": percentile(jitter, 50),
+        "jitter_p95": percentile(jitter, 95),
+        "jitter_max": max(jitter) if jitter else None,
+        "send_lag_p99": percentile(send_lag, 99),
+        "sent_kbps": sum(s.bytes_sent for s in stats) * 8 / 1000 / wall_secs,
+        "received_kbps": sum(s.bytes_received for s in stats) * 8 / 1000 / wall_secs,
+        "frames_sent_per_sec": sum(s.frames_sent for s in stats) / wall_secs,
+        "frames_received_per_sec": sum(s.frames_received for s in stats) / wall_secs,
+        "bot_audio_secs": sum(s.bot_audio_secs for s in stats),
+    }
+
+
+def report(summary: Dict[str, Any]):
+    print(
+        f"Connections: {summary['connected']}/{summary['connections']} connected, "
+        f"{summary['failed']} failed, {summary['closed_by_server']} closed by the server"
+        + (f" (p50 after {summary['closed_after_p50']:.0f} s)" if summary["closed_after_p50"] else "")
+    )
+    print(f"Connect p95:        {ms(summary['connect_p95'])} ms")
+    print(f"Greeting latency:   p50 {ms(summary['greeting_p50'])} ms, p95 {ms(summary['greeting_p95'])} ms")
+    print(
+        f"Response latency:   p50 {ms(summary['response_p50'])} ms, p95 {ms(summary['response_p95'])} ms, "
+        f"p99 {ms(summary['response_p99'])} ms "
+        f"({summary['responses']} answered, {summary['unanswered']} unanswered)"
+    )
+    print(
+        f"Bot audio jitter:   p50 {ms(summary['jitter_p50'])} ms, p95 {ms(summary['jitter_p95'])} ms, "
+        f"max {ms(summary['jitter_max'])} ms"
+    )
+    print(f"Client send lag:    p99 {ms(summary['send_lag_p99'])} ms")
+    print(
+        f"Throughput:         {summary['sent_kbps']:.0f} kbit/s up "
+        f"({summary['frames_sent_per_sec']:.0f} frames/s), {summary['received_kbps']:.0f} kbit/s down "
+        f"({summary['frames_received_per_sec']:.0f} frames/s), {summary['bot_audio_secs']:.0f} s of bot audio"
+    )
+
+
+async def run(args: argparse.Namespace) -> List[ConnectionStats]:
+    utterance = load_utterance(args.utterance) if args.utterance else synthetic_speech(args.speech_secs)
+    clients = [
+        LoadClient(
+            args.url[index % len(args.url)],
+            utterance,
+            chunk_secs=args.chunk_ms / 1000,
+            pause_secs=args.pause_secs,
+            silence_secs=args.silence_ms / 1000,
+            response_timeout=args.response_timeout,
+        )
+        for index in range(args.connections)
+    ]
+    tasks = []
+    for client in clients:
+        tasks.append(asyncio.create_task(client.run(args.duration)))
+        await asyncio.sleep(args.stagger_secs)
+    await asyncio.gather(*tasks)
+    return [client.stats for client in clients]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Websocket bot load generator")
+    parser.add_argument(
+        "--url",
+        action="append",
+        help="A bot's websocket URL, repeat for several bots; ws://localhost:8765 if not given",
+    )
+    parser.add_argument("--connections", type=int, default=1, help="Concurrent connections")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds each connection lasts")
+    parser.add_argument("--stagger-secs", type=float, default=0.2, help="Seconds between connections")
+    parser.add_argument("--utterance", help="16 kHz mono 16-bit WAV the user says; synthetic speech if not given")
+    parser.add_argument("--speech-secs", type=float, default=2.0, help="Length of the synthetic speech")
+    parser.add_argument("--chunk-ms", type=float, default=20, help="Milliseconds of audio per frame sent")
+    parser.add_argument("--pause-secs", type=float, default=1.0, help="User's pause after the bot speaks")
+    parser.add_argument("--silence-ms", type=float, default=500, help="Bot silence that ends its turn")
+    parser.add_argument("--response-timeout", type=float, default=10, help="Seconds to wait for an answer")
+    parser.add_argument("--json", help="Also write the per-connection stats and summary to this file")
+    args = parser.parse_args()
+    args.url = args.url or ["ws://localhost:8765"]
+
+    started = time.monotonic()
+    stats = asyncio.run(run(args))
+    summary = summarize(stats, time.monotonic() - started)
+    report(summary)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "connections": [asdict(s) for s in stats]}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()